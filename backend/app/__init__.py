@@ -5,6 +5,12 @@ from config import Config
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+
+    # Worker processes re-import the server's main module (run.py), and with it this. They
+    # set up only what their worker settings hand them, however the server was started
+    from app.api.executors import in_worker_process
+    if in_worker_process():
+        return app
     
     # Enable CORS
     CORS(app, resources={
@@ -15,8 +21,40 @@ def create_app(config_class=Config):
         }
     })
 
+    # Leveled logging with per-job buffers
+    from app.utils import joblog
+    joblog.init_app(app)
+
     # Register blueprints
     from app.api import bp as api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    # Share extracted metadata between previews and downloads
+    from app.utils import metadata_cache
+    metadata_cache.init_app(app)
+
+    # Reuse finished downloads for repeat requests
+    from app.utils import download_cache
+    download_cache.init_app(app)
+
+    # Keep Whisper models loaded between transcriptions
+    from app.utils import whisper_models
+    whisper_models.init_app(app)
+
+    # Reuse transcripts of audio transcribed before
+    from app.utils import transcript_cache
+    transcript_cache.init_app(app)
+
+    # Size the transcription pool
+    from app.utils import transcription
+    transcription.init_app(app)
+
+    # Catalogue of the downloads folder, rescanned in the background
+    from app.database import library
+    library.init_app(app)
+
+    # Start the download worker pool
+    from app.api import download_manager
+    download_manager.init_app(app)
+
     return app
\ No newline at end of file
@@ -1,125 +1,831 @@
 # backend/app/api/download_manager.py
+import json
+import time
 import uuid
-from threading import Thread, Lock
-from app.utils.downloader import download_and_process
+from threading import Lock
+from yt_dlp.utils import DownloadCancelled
+from app.api.events import broker
+from app.api.executors import ThreadBackend, create_backend, in_reloader_parent, worker_settings
+from app.api.postprocessing import postprocess_pool
+from app.api.metrics import (
+    DOWNLOADED_BYTES, FORMAT_PLANS, JOB_ERRORS, JOBS_FINISHED, PLANNED_CPU_SECONDS, STAGE_SECONDS, classify_error,
+    collected, registry as metrics_registry
+)
+from app.api.progress import AggregateProgress, ProgressTracker, registry as progress_registry
+from app.api.scheduler import JobScheduler, PRIORITIES, PRIORITY_INTERACTIVE, host_key
+from app.database.library import library
+from app.database.job_store import MemoryJobStore, FINISHED_STATUSES, create_job_store
+from app.utils.download_cache import download_cache
+from app.utils.joblog import get_logger, job_context, job_logs
+from app.utils.metadata_cache import metadata_cache, normalize_url
+from app.utils.staging import clear_stale, discard, staging_dir
+from app.utils.transcript_cache import transcript_cache
 
-# In-memory store for download jobs
-# In a production environment, you might use Redis or a database
-_jobs = {}
-_jobs_lock = Lock()
+# Job state; replaced by the configured (persistent) store in init_app()
+_store = MemoryJobStore()
 
-def create_job(url, options):
-    """Creates a new download job and starts it in a background thread."""
+# Worker pool that runs the jobs; configured by init_app()
+_scheduler = None
+
+# Where the download work itself runs (threads or worker processes); configured by init_app()
+_backend = None
+
+# Progress trackers of running jobs, for their hook counters
+_trackers = {}
+
+# Progress publishing rate limits; configured by init_app()
+_progress_settings = {'min_interval': 0.25, 'min_delta': 1.0}
+
+# Playlist parents that are still running: parent_id -> AggregateProgress
+_parents = {}
+
+# child_id -> parent_id for the children of those playlists
+_child_parents = {}
+_parents_lock = Lock()
+
+# How often a failed playlist entry is retried; configured by init_app()
+_playlist_settings = {'entry_retries': 2}
+
+# Identical requests in flight share one download: request key -> leading job_id,
+# and leading job_id -> ids of the jobs attached to it
+_inflight = {}
+_attached = {}
+_inflight_lock = Lock()
+
+# Downloads whose files are being merged or converted: job_id -> (future, cancel_event)
+_postprocessing = {}
+_postprocessing_lock = Lock()
+
+# Fields of the leading job that attached jobs mirror
+MIRRORED_FIELDS = (
+    'status', 'progress', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'current_file',
+    'entries_total', 'entries_done', 'entries_failed', 'entries_cancelled', 'result', 'progress_stats', 'format_plan',
+    'clip',
+)
+
+log = get_logger('jobs')
+
+# Jobs in these states were interrupted by a restart and can be resumed
+RESUMABLE_STATUSES = ('queued', 'starting', 'downloading', 'processing')
+
+def _transcription_jobs():
+    # Imported late: transcription_jobs builds its jobs on this module's store
+    from app.api import transcription_jobs
+    return transcription_jobs
+
+def init_app(app):
+    """Open the job store, start the worker pool and resume interrupted jobs."""
+    global _backend, _scheduler, _store
+    if in_reloader_parent(app):
+        # The reloader's parent only restarts the server: just the serving process runs (and recovers) jobs
+        return
+    _store = create_job_store(app)
+    _backend = create_backend(app)
+    _progress_settings['min_interval'] = app.config.get('PROGRESS_MIN_INTERVAL', 0.25)
+    _progress_settings['min_delta'] = app.config.get('PROGRESS_MIN_DELTA', 1.0)
+    _playlist_settings['entry_retries'] = app.config.get('PLAYLIST_ENTRY_RETRIES', 2)
+    _scheduler = JobScheduler(
+        workers=app.config.get('DOWNLOAD_WORKERS', 3),
+        per_host_limit=app.config.get('DOWNLOAD_PER_HOST_LIMIT', 2),
+    )
+    _scheduler.start()
+    postprocess_pool.configure(
+        workers=app.config.get('POSTPROCESS_WORKERS'),
+        niceness=app.config.get('POSTPROCESS_NICENESS', 10),
+        max_jobs_per_worker=app.config.get('DOWNLOAD_WORKER_MAX_JOBS', 25),
+        memory_limit_mb=app.config.get('DOWNLOAD_WORKER_MEMORY_MB', 4096),
+        settings=worker_settings(),
+    )
+    resumed = _recover_jobs()
+    # Staging directories of jobs that will not run again (killed, or finished during a crash)
+    cleared = clear_stale(app.config['UPLOAD_FOLDER'], keep=resumed)
+    if cleared:
+        log.info('Removed %d stale staging directories', cleared)
+    metrics_registry.add_collector(_collect_metrics)
+
+def shutdown():
+    """Stop the worker pool and its processes, and flush the job store."""
+    global _backend, _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown()
+        _scheduler = None
+    if _backend is not None:
+        _backend.shutdown()
+        _backend = None
+    postprocess_pool.shutdown()
+    _store.close()
+
+def _update(job_id, client_id=None, **fields):
+    """Persist a state change and push it to event subscribers."""
+    if _store.update(job_id, **fields):
+        _publish(job_id, fields, client_id)
+        _notify_parent(job_id, fields)
+        _mirror(job_id, fields)
+
+def _update_progress(job_id, client_id=None, **fields):
+    """Record a progress update (batched in the store) and push it to subscribers."""
+    if _store.update_progress(job_id, **fields):
+        _publish(job_id, fields, client_id)
+        _notify_parent(job_id, fields)
+        _mirror(job_id, fields, progress=True)
+
+def _publish(job_id, fields, client_id=None):
+    if client_id is None:
+        job = _store.get(job_id)
+        client_id = job.get('client_id') if job else None
+    delta = {key: value for key, value in fields.items() if key not in ('options', 'client_id')}
+    broker.publish(job_id, client_id, delta)
+
+def _recover_jobs():
+    """Re-queue jobs that were still active when the server stopped. Returns the ids of resumed downloads."""
+    jobs = sorted(_store.list(), key=lambda j: j['created_at'])
+    cancelled_parents = set()
+    resumed = []
+
+    # Playlist parents first, so their children report into a rebuilt aggregate
+    for job in jobs:
+        if not job.get('is_playlist') or job['status'] in FINISHED_STATUSES:
+            continue
+        _restore_parent(job)
+        if job['status'] == 'cancelling':
+            cancelled_parents.add(job['job_id'])
+            _parents[job['job_id']].expansion_done()
+
+    for job in jobs:
+        if job.get('type') == 'transcription':
+            if job['status'] not in FINISHED_STATUSES:
+                _transcription_jobs().recover(job)
+            continue
+        if job.get('is_playlist'):
+            if job['status'] in RESUMABLE_STATUSES and not job.get('expanded'):
+                # Expansion was interrupted; it continues after the known children
+                _update(job['job_id'], status='queued', recovered=True)
+                _submit(job['job_id'], job['url'], job['options'], job.get('priority', 'interactive'))
+            continue
+        if job['status'] == 'cancelling' or (
+            job.get('parent_id') in cancelled_parents and job['status'] not in FINISHED_STATUSES
+        ):
+            _update(job['job_id'], status='cancelled')
+        elif job['status'] in RESUMABLE_STATUSES:
+            # Keep existing .part files so yt-dlp continues where it stopped
+            options = dict(job['options'], resume=True)
+            _update(job['job_id'], status='queued', options=options, recovered=True)
+            _submit(job['job_id'], job['url'], options, job.get('priority', 'interactive'))
+            resumed.append(job['job_id'])
+
+    # Playlists whose remaining children all finished before the restart
+    for parent_id in list(_parents):
+        _finish_parent_if_done(parent_id)
+    return resumed
+
+def _get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        # Used outside the Flask app (scripts); fall back to the defaults
+        _scheduler = JobScheduler()
+        _scheduler.start()
+    return _scheduler
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        _backend = ThreadBackend()
+    return _backend
+
+def create_job(url, options, priority='interactive', client_id=None):
+    """
+    Creates a new download job and queues it on the worker pool.
+    ``client_id`` groups the jobs of one browser session for the event stream.
+    """
     job_id = str(uuid.uuid4())
-    
-    with _jobs_lock:
-        _jobs[job_id] = {
-            'job_id': job_id,
-            'status': 'queued',
-            'progress': 0,
-            'url': url,
-            'options': options,
-            'result': None
-        }
+    key = _request_key(url, options)
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'progress': 0,
+        'url': url,
+        'options': options,
+        'priority': priority,
+        'client_id': client_id,
+        'request_key': key,
+        'result': None
+    }
+
+    with _inflight_lock:
+        leader_id = _inflight.get(key)
+        if leader_id is None:
+            _inflight[key] = job_id
+            _attached[job_id] = []
+        else:
+            # Same request already running: follow it instead of downloading twice
+            _attached[leader_id].append(job_id)
+            job['attached_to'] = leader_id
+        # Added under the lock so the leader cannot finish before this job exists
+        _store.add(job)
 
-    # Start the download in a background thread
-    thread = Thread(target=_run_download_job, args=(job_id, url, options))
-    thread.daemon = True
-    thread.start()
+    if leader_id is None:
+        _submit(job_id, url, options, priority)
+    else:
+        leader = _store.get(leader_id) or {}
+        _update(job_id, **{field: leader[field] for field in MIRRORED_FIELDS if field in leader})
     
     return job_id
 
-def get_job_status(job_id):
-    """Retrieves the status of a specific download job."""
-    with _jobs_lock:
-        job = _jobs.get(job_id)
-        if job:
-            # Create a copy without non-serializable items (like progress_hooks)
-            serializable_job = {
-                'job_id': job['job_id'],
-                'status': job['status'],
-                'progress': job.get('progress', 0),
-                'url': job['url'],
-                'result': job.get('result'),
-                'speed': job.get('speed'),
-                'eta': job.get('eta'),
-                'downloaded_bytes': job.get('downloaded_bytes'),
-                'total_bytes': job.get('total_bytes')
-            }
-            return serializable_job
-        return None
-
-def _run_download_job(job_id, url, options):
-    """The target function for the download thread."""
-    
-    def progress_hook(d):
-        """Hook for yt-dlp to report progress."""
-        status = d.get('status', 'unknown')
-        print(f"HOOK FIRED: {status}")  # DEBUG
-
-        with _jobs_lock:
-            job = _jobs[job_id]
-
-            if status == 'downloading':
-                job['status'] = 'downloading'
-
-                # Store byte-level information
-                downloaded_bytes = d.get('downloaded_bytes', 0)
-                total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
-
-                # Get filename being downloaded
-                filename = d.get('filename', '')
-                if filename:
-                    job['current_file'] = filename
-
-                job['downloaded_bytes'] = downloaded_bytes
-                job['total_bytes'] = total_bytes
-
-                if total_bytes and total_bytes > 0:
-                    job['progress'] = round((downloaded_bytes / total_bytes) * 100, 2)
-                else:
-                    # If no total bytes, show partial progress based on downloaded
-                    job['progress'] = min(downloaded_bytes / (1024 * 1024), 99)  # Cap at 99%
-
-                job['speed'] = d.get('speed', 0)
-                job['eta'] = d.get('eta', 0)
-
-                # Additional metadata
-                job['_percent_str'] = d.get('_percent_str', f"{job['progress']:.1f}%")
-                job['_speed_str'] = d.get('_speed_str', 'Unknown')
-                job['_eta_str'] = d.get('_eta_str', 'Unknown')
-
-                # DEBUG: Print detailed progress info
-                print(f"PROGRESS: {job['progress']:.1f}% | {downloaded_bytes}/{total_bytes} bytes | Speed: {job['speed']} | ETA: {job['eta']}s")
-
-            elif status == 'finished':
-                print(f"HOOK: Download finished, starting post-processing")
-                job['status'] = 'processing'
-                job['progress'] = 100
-                job['downloaded_bytes'] = job.get('total_bytes', 0)
-
-            elif status == 'error':
-                print(f"HOOK ERROR: {d.get('error', 'Unknown error')}")
-                job['status'] = 'error'
-                job['error'] = str(d.get('error', 'Download failed'))
-
-    # Add the progress hook to the options
-    options['progress_hooks'] = [progress_hook]
-    
-    with _jobs_lock:
-        _jobs[job_id]['status'] = 'starting'
+def _request_key(url, options):
+    """Jobs with equal keys would produce the same files."""
+    relevant = {key: value for key, value in options.items() if key not in ('resume', 'network_settings')}
+    return json.dumps([normalize_url(url), relevant], sort_keys=True, default=str)
+
+def _mirror(job_id, fields, progress=False):
+    """Repeat an update of a leading job on the jobs attached to it."""
+    if job_id not in _attached:
+        return
+    if fields.get('status') in FINISHED_STATUSES:
+        _release_attached(job_id, fields)
+        return
+
+    mirrored = {key: value for key, value in fields.items() if key in MIRRORED_FIELDS}
+    if mirrored.get('status') == 'cancelling':
+        # Attached jobs are not being cancelled; they take over if the leader stops
+        del mirrored['status']
+    if not mirrored:
+        return
+    for follower_id in list(_attached.get(job_id, ())):
+        if progress:
+            _update_progress(follower_id, **mirrored)
+        else:
+            _update(follower_id, **mirrored)
+
+def _release_attached(leader_id, fields):
+    """Hand a finished leader's outcome to its attached jobs."""
+    leader = _store.get(leader_id) or {}
+    new_leader_id = None
+    with _inflight_lock:
+        followers = _attached.pop(leader_id, [])
+        key = leader.get('request_key')
+        if _inflight.get(key) == leader_id:
+            del _inflight[key]
+        if fields['status'] == 'cancelled' and followers:
+            # Only the leading job was cancelled, not the request: the next one takes over
+            new_leader_id = followers.pop(0)
+            _inflight[key] = new_leader_id
+            _attached[new_leader_id] = followers
+
+    if new_leader_id is not None:
+        for follower_id in followers:
+            _store.update(follower_id, attached_to=new_leader_id)
+        _update(new_leader_id, status='queued', progress=0, attached_to=None)
+        _submit(new_leader_id, leader['url'], leader['options'], leader.get('priority', 'interactive'))
+        return
+
+    final = {key: value for key, value in leader.items() if key in MIRRORED_FIELDS}
+    for follower_id in followers:
+        _update(follower_id, **final)
+
+def _detach(job_id, leader_id):
+    """Cancel a job that follows another; the shared download keeps running."""
+    with _inflight_lock:
+        followers = _attached.get(leader_id)
+        if followers is None or job_id not in followers:
+            return False
+        followers.remove(job_id)
+    _update(job_id, status='cancelled', attached_to=None)
+    return True
+
+def _submit(job_id, url, options, priority):
+    _get_scheduler().submit(
+        job_id,
+        _run_download_job,
+        args=(job_id, url, options),
+        priority=PRIORITIES.get(priority, PRIORITY_INTERACTIVE),
+        host=host_key(url),
+    )
+
+def cancel_job(job_id):
+    """
+    Cancels a queued or running job.
+    Returns False if the job does not exist or has already finished.
+    """
+    job = _store.get(job_id)
+    if not job or job['status'] in FINISHED_STATUSES:
+        return False
+
+    if job.get('attached_to'):
+        return _detach(job_id, job['attached_to'])
+
+    if job.get('type') == 'transcription':
+        return _transcription_jobs().cancel(job)
+
+    if job.get('is_playlist'):
+        return _cancel_playlist(job)
+
+    with _postprocessing_lock:
+        entry = _postprocessing.get(job_id)
+    if entry is not None:
+        future, cancel_event = entry
+        if not postprocess_pool.cancel(future):
+            # Its process is killed, ffmpeg with it, and the staged files are discarded
+            cancel_event.set()
+            _update(job_id, status='cancelling')
+        return True
+
+    where = _get_scheduler().cancel(job_id)
+    if where == 'queued':
+        _update(job_id, status='cancelled')
+    elif where == 'running':
+        # The progress hook picks this up and aborts the download
+        _update(job_id, status='cancelling')
+    else:
+        return False
+
+    return True
+
+def get_queue_stats():
+    """Returns worker pool utilisation and progress hook counters."""
+    stats = _get_scheduler().stats()
+    stats['executor'] = _get_backend().stats()
+    stats['postprocessing'] = postprocess_pool.stats()
+    stats['download_cache'] = download_cache.stats()
+    stats['progress_hooks'] = progress_registry.stats()
+    stats['transcription'] = _transcription_jobs().get_stats()
+    stats['transcript_cache'] = transcript_cache.stats()
+    return stats
+
+def get_job_status(job_id, include_logs=False):
+    """Retrieves the status of a specific download job, with its recent log lines if asked."""
+    job = _store.get(job_id)
+    if job:
+        # Create a copy without internal items (like the job options)
+        serializable_job = {
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'progress': job.get('progress', 0),
+            'url': job['url'],
+            'result': job.get('result'),
+            'speed': job.get('speed'),
+            'eta': job.get('eta'),
+            'downloaded_bytes': job.get('downloaded_bytes'),
+            'total_bytes': job.get('total_bytes'),
+            'recovered': job.get('recovered', False)
+        }
+        if job.get('attached_to'):
+            serializable_job['attached_to'] = job['attached_to']
+        if job.get('format_plan'):
+            serializable_job['format_plan'] = job['format_plan']
+        if job.get('clip'):
+            serializable_job['clip'] = job['clip']
+        if job.get('type') == 'transcription':
+            serializable_job['type'] = job['type']
+            serializable_job['source_job_id'] = job.get('source_job_id')
+            serializable_job['model'] = job['options'].get('model')
+            serializable_job['language'] = job['options'].get('language')
+            for key in ('chunks_done', 'chunks_total', 'partial_text'):
+                if job.get(key) is not None:
+                    serializable_job[key] = job[key]
+        elif job.get('transcription_jobs'):
+            serializable_job['transcription_jobs'] = job['transcription_jobs']
+        if job.get('is_playlist'):
+            for key in ('playlist_title', 'children', 'entries_total', 'entries_done',
+                        'entries_failed', 'entries_cancelled', 'entries_expanding'):
+                serializable_job[key] = job.get(key)
+        elif job.get('parent_id'):
+            for key in ('parent_id', 'index', 'title', 'attempt', 'last_error'):
+                serializable_job[key] = job.get(key)
+        tracker = _trackers.get(job_id)
+        if tracker is not None:
+            serializable_job['progress_stats'] = tracker.stats()
+        elif job.get('progress_stats'):
+            serializable_job['progress_stats'] = job['progress_stats']
+        if job.get('timings'):
+            serializable_job['timings'] = job['timings']
+        if job['status'] == 'queued':
+            if job.get('type') == 'transcription':
+                serializable_job['queue_position'] = _transcription_jobs().queue_position(job_id)
+            else:
+                serializable_job['queue_position'] = _get_scheduler().queue_position(job_id)
+        if include_logs:
+            # An attached job's download is logged under the job it is attached to
+            serializable_job['logs'] = job_logs.lines(job.get('attached_to') or job_id)
+        return serializable_job
+    return None
+
+def get_client_job_ids(client_id):
+    """Returns the ids of all stored jobs started by a client."""
+    return [job['job_id'] for job in _store.list() if job.get('client_id') == client_id]
+
+def _run_download_job(job_id, url, options, cancel_event):
+    """The target function run by a scheduler worker."""
+    with job_context(job_id):
+        _run_job(job_id, url, options, cancel_event)
+
+def _run_job(job_id, url, options, cancel_event):
+    job = _store.get(job_id)
+    client_id = job.get('client_id') if job else None
+    parent_id = job.get('parent_id') if job else None
+    started_at = time.time()
+
+    def publish(fields):
+        if fields['status'] == 'downloading':
+            _update_progress(job_id, client_id=client_id, **fields)
+        else:
+            # Status transitions are written through immediately
+            _update(job_id, client_id=client_id, **fields)
+
+    tracker = ProgressTracker(
+        publish,
+        min_interval=_progress_settings['min_interval'],
+        min_delta=_progress_settings['min_delta'],
+    )
+    _trackers[job_id] = tracker
+    progress_registry.add(tracker)
 
     try:
-        # Run the actual download function
-        result = download_and_process(url, **options)
-        
-        # Update the job with the final result
-        with _jobs_lock:
-            _jobs[job_id]['status'] = 'completed'
-            _jobs[job_id]['result'] = result
+        if cancel_event.is_set():
+            _update(job_id, status='cancelled')
+            _record_job_metrics('cancelled', None, [])
+            return
+        _update(job_id, status='starting')
+        log.info('Starting %s', url)
+        timings = _manager_spans(job, started_at) if job else []
+
+        try:
+            # Run the actual download function; the backend reports progress to the tracker.
+            # Transcription is not part of it: the job finishes once the media is on disk
+            # and hands the files (and any caption track found) to the transcription queue.
+            # The staging directory is named after the job, so a resumed job finds its .part files.
+            # Merging and converting are deferred to the post-processing pool, so this worker
+            # moves on to the next download once the bytes are on disk
+            # A top-level job's URL is probed in the worker; a playlist comes back with its flat
+            # listing, from which the entries are queued here as jobs of their own
+            run_options = dict(options, staging_id=job_id, defer_postprocessing=True, expand_playlists=not parent_id)
+            if options.get('transcribe'):
+                run_options.update(transcribe=False, find_captions=True)
+            result = _get_backend().run(url, run_options, tracker.hook, cancel_event)
+            timings.extend(result.pop('timings', None) or [])
+
+            if result.get('playlist') is not None:
+                _expand_playlist(job_id, url, options, result['playlist'], cancel_event, client_id)
+                return
+
+            state = result.pop('postprocess', None)
+            if state is not None:
+                _defer_postprocessing(job_id, url, options, state, result, timings, tracker.stats(),
+                                      cancel_event, client_id, parent_id)
+                return
+            _complete(job_id, url, options, result, timings, tracker.stats(), client_id, parent_id)
+
+        except DownloadCancelled:
+            # A killed worker process could not clean up after itself
+            discard(staging_dir(options['output_dir'], job_id))
+            _update(job_id, status='cancelled', progress_stats=tracker.stats())
+            _record_job_metrics('cancelled', None, timings)
+
+        except Exception as e:
+            if parent_id and _retry_entry(job_id, url, options, str(e)):
+                return
+            log.error('Job failed: %s', e)
+            _update(job_id, status='error', result={'error': str(e)}, timings=timings, progress_stats=tracker.stats())
+            _record_job_metrics('error', {'error': str(e)}, timings)
+
+    finally:
+        # A retried entry may already be running again under the same id
+        if _trackers.get(job_id) is tracker:
+            del _trackers[job_id]
+        progress_registry.retire(tracker)
+
+def _complete(job_id, url, options, result, timings, progress_stats, client_id=None, parent_id=None):
+    """Record a finished download: catalogue its files, hand them to transcription and complete the job."""
+    if parent_id and not result.get('success'):
+        # A playlist entry that produced nothing is a failure worth retrying
+        error = '; '.join(e.get('error', '') for e in result.get('errors', [])) or 'Download failed'
+        if not _retry_entry(job_id, url, options, error):
+            log.warning('Entry failed: %s', error)
+            _update(job_id, status='error', result=result, timings=timings, progress_stats=progress_stats)
+            _record_job_metrics('error', result, timings)
+        return
+
+    for download in result.get('downloads', []):
+        try:
+            library.add_download(download)
+        except Exception as e:
+            # The files are on disk either way; the startup scan catalogues them
+            log.warning('Could not add %s to the library: %s', download.get('filename'), e)
+
+    transcription_ids = []
+    if options.get('transcribe') and result.get('success'):
+        transcription_ids = _transcription_jobs().handoff(job_id, result, options, client_id=client_id)
+        if transcription_ids:
+            result['transcription_jobs'] = transcription_ids
+
+    # Update the job with the final result; the format plan shows any re-encoding it cost,
+    # the clip how much of the video was fetched for a time range
+    _update(job_id, status='completed', result=result, timings=timings, progress_stats=progress_stats,
+            transcription_jobs=transcription_ids or None, format_plan=result.get('format_plan'),
+            clip=result.get('clip'))
+    _record_job_metrics('completed', result, timings)
+
+def _defer_postprocessing(job_id, url, options, state, result, timings, progress_stats, cancel_event,
+                          client_id=None, parent_id=None):
+    """
+    Queue the second stage of a download whose streams are on disk but
+    still need ffmpeg (merge, remux, conversion). The job stays 'processing'
+    until one of the pool's processes has run finish_download on them;
+    ``cancel_event`` is the job's, so a cancellation that came in meanwhile
+    still applies.
+    """
+    queued_at = time.time()
+    started = {}
+
+    def run():
+        started['at'] = time.time()
+        with job_context(job_id):
+            return postprocess_pool.finish(state, cancel_event)
 
+    def finished(future):
+        with _postprocessing_lock:
+            _postprocessing.pop(job_id, None)
+        # Waiting for a post-processing process, relative to the downloader's start like its own spans
+        wait = round((started.get('at') or time.time()) - queued_at, 4)
+        all_timings = timings + [
+            {'stage': 'postprocess_wait', 'offset': round(queued_at - state['started_at'], 4), 'seconds': wait}
+        ]
+        with job_context(job_id):
+            try:
+                if future.cancelled():
+                    raise DownloadCancelled()
+                second = future.result()
+            except DownloadCancelled:
+                discard(state['staging'])
+                _update(job_id, status='cancelled', progress_stats=progress_stats)
+                _record_job_metrics('cancelled', None, all_timings)
+                return
+            except Exception as e:
+                log.error('Post-processing failed: %s', e)
+                _update(job_id, status='error', result={'error': str(e)}, timings=all_timings,
+                        progress_stats=progress_stats)
+                _record_job_metrics('error', {'error': str(e)}, all_timings)
+                return
+            all_timings.extend(second.pop('timings', None) or [])
+            second['format_plan'] = result.get('format_plan')
+            second.setdefault('clip', result.get('clip'))
+            _complete(job_id, url, options, second, all_timings, progress_stats, client_id, parent_id)
+
+    _update(job_id, client_id=client_id, status='processing')
+    log.info('Download finished; queued for post-processing')
+    future = postprocess_pool.submit(run)
+    with _postprocessing_lock:
+        _postprocessing[job_id] = (future, cancel_event)
+    future.add_done_callback(finished)
+
+def _manager_spans(job, started_at):
+    """
+    Spans for the time before the downloader ran: waiting for a worker.
+    Offsets are negative, relative to the downloader's start.
+    """
+    queued = round(max(started_at - job['created_at'], 0), 4)
+    return [{'stage': 'queue_wait', 'offset': -queued, 'seconds': queued}]
+
+def _record_job_metrics(status, result, timings):
+    JOBS_FINISHED.inc(status=status)
+    for span in timings:
+        STAGE_SECONDS.observe(span['seconds'], stage=span['stage'])
+    if result is None:
+        return
+    if status == 'error' or not result.get('success'):
+        messages = [result.get('error')] + [e.get('details') or e.get('error') for e in result.get('errors', [])]
+        JOB_ERRORS.inc(error_class=classify_error(' '.join(m for m in messages if m)))
+    downloaded = sum(
+        download.get('size') or 0
+        for download in result.get('downloads', []) if not download.get('cached')
+    )
+    if downloaded:
+        DOWNLOADED_BYTES.inc(downloaded)
+    plan = result.get('format_plan')
+    if plan and downloaded:
+        FORMAT_PLANS.inc(strategy=plan['strategy'])
+        if plan.get('estimated_cpu_seconds'):
+            PLANNED_CPU_SECONDS.inc(plan['estimated_cpu_seconds'], strategy=plan['strategy'])
+
+def _collect_metrics():
+    """Gauges read at scrape time for the metrics endpoint."""
+    pool = _get_scheduler().stats()
+    backend = _get_backend().stats()
+    metrics = [
+        collected('ytd_queue_depth', 'Jobs waiting for a worker', pool['queued']),
+        collected('ytd_jobs_running', 'Jobs holding a worker', pool['running']),
+        collected('ytd_workers', 'Size of the worker pool', pool['workers']),
+        collected('ytd_download_bytes_per_second', 'Combined speed of the running downloads',
+                  round(sum(tracker.speed for tracker in list(_trackers.values())))),
+        collected('ytd_metadata_cache_lookups_total', 'Metadata cache lookups by outcome',
+                  {name: metadata_cache.stats()[name] for name in ('hits', 'sqlite_hits', 'misses', 'coalesced')},
+                  labelname='result', type='counter'),
+    ]
+    postprocess = postprocess_pool.stats()
+    metrics.extend([
+        collected('ytd_postprocess_queue_depth', 'Downloads waiting for a post-processing process', postprocess['queued']),
+        collected('ytd_postprocess_running', 'Downloads being merged or converted', postprocess['running']),
+    ])
+    if 'busy_workers' in backend:
+        metrics.append(collected('ytd_worker_processes', 'Download worker processes by state',
+                                 {'busy': backend['busy_workers'], 'idle': backend['idle_workers']},
+                                 labelname='state'))
+    transcription = _transcription_jobs().get_stats()
+    metrics.extend([
+        collected('ytd_transcription_queue_depth', 'Transcriptions waiting for a worker', transcription['queued']),
+        collected('ytd_transcriptions_running', 'Transcriptions in progress', transcription['running']),
+        collected('ytd_whisper_resident_megabytes', 'Memory held by loaded Whisper models',
+                  transcription['models']['resident_mb']),
+    ])
+    transcripts = transcript_cache.stats()
+    if transcripts['enabled']:
+        metrics.append(collected('ytd_transcript_cache_lookups_total', 'Transcript cache lookups by outcome',
+                                 {'hits': transcripts['hits'], 'misses': transcripts['misses']},
+                                 labelname='result', type='counter'))
+    cache = download_cache.stats()
+    if cache['enabled']:
+        metrics.append(collected('ytd_download_cache_lookups_total', 'Download cache lookups by outcome',
+                                 {'hits': cache['hits'], 'misses': cache['misses']},
+                                 labelname='result', type='counter'))
+        metrics.append(collected('ytd_download_cache_bytes', 'Size of the download cache', cache['bytes']))
+    return metrics
+
+def _expand_playlist(job_id, url, options, playlist, cancel_event, client_id):
+    """
+    Turn a playlist job into one child job per entry of ``playlist``, the
+    flat listing the worker's probe returned.
+
+    Children are queued at bulk priority. The parent holds no worker slot
+    afterwards; it only aggregates its children's progress and finishes
+    when the last of them does.
+    """
+    job = _store.get(job_id)
+    children = list(job.get('children') or [])
+    aggregate = _register_parent(job_id, children)
+
+    _update(job_id, client_id=client_id, status='downloading', is_playlist=True,
+            playlist_title=playlist['title'], children=children, expanded=False)
+
+    try:
+        for index, entry in enumerate(playlist['entries'], 1):
+            if cancel_event.is_set():
+                break
+            if index <= len(children):
+                # Already expanded before a restart
+                continue
+            entry_url = entry['url']
+            child_id = str(uuid.uuid4())
+            with _parents_lock:
+                aggregate.add_child(child_id)
+                _child_parents[child_id] = job_id
+            _store.add({
+                'job_id': child_id,
+                'status': 'queued',
+                'progress': 0,
+                'url': entry_url,
+                'options': options,
+                'priority': 'bulk',
+                'client_id': client_id,
+                'parent_id': job_id,
+                'index': index,
+                'title': entry.get('title'),
+                'attempt': 1,
+                'result': None
+            })
+            _submit(child_id, entry_url, options, 'bulk')
+            children.append(child_id)
+            if len(children) % 50 == 0:
+                _update(job_id, client_id=client_id, children=list(children), **aggregate.snapshot())
+        if playlist.get('error') and not cancel_event.is_set():
+            raise Exception(playlist['error'])
     except Exception as e:
-        with _jobs_lock:
-            _jobs[job_id]['status'] = 'error'
-            _jobs[job_id]['result'] = {'error': str(e)}
+        # Entries queued so far still run; the parent reports what was missed
+        log.warning('Playlist listing stopped after %d entries: %s', len(children), e)
+        _update(job_id, client_id=client_id, expansion_error=str(e))
+    finally:
+        aggregate.expansion_done()
+        _update(job_id, client_id=client_id, children=children, expanded=True, **aggregate.snapshot())
+
+    if cancel_event.is_set():
+        _cancel_playlist(_store.get(job_id))
+    else:
+        _finish_parent_if_done(job_id)
+
+def _register_parent(job_id, child_ids):
+    aggregate = AggregateProgress(min_interval=_progress_settings['min_interval'])
+    with _parents_lock:
+        aggregate = _parents.setdefault(job_id, aggregate)
+        for child_id in child_ids:
+            aggregate.add_child(child_id)
+            _child_parents[child_id] = job_id
+    return aggregate
+
+def _restore_parent(job):
+    """Rebuild a playlist's aggregate from its stored children after a restart."""
+    aggregate = _register_parent(job['job_id'], job.get('children') or [])
+    for child_id in aggregate.child_ids:
+        child = _store.get(child_id)
+        if child is None:
+            # Evicted or lost; count it as failed rather than waiting forever
+            aggregate.update(child_id, {'status': 'error'})
+        else:
+            aggregate.update(child_id, child)
+    if job.get('expanded'):
+        aggregate.expansion_done()
+
+def _notify_parent(job_id, fields):
+    """Fold a child job's update into its playlist parent."""
+    parent_id = _child_parents.get(job_id)
+    if parent_id is None:
+        return
+    aggregate = _parents.get(parent_id)
+    if aggregate is None:
+        return
+
+    aggregate.update(job_id, fields)
+    if fields.get('status') in FINISHED_STATUSES:
+        _finish_parent_if_done(parent_id)
+    elif aggregate.should_publish():
+        _update_progress(parent_id, **aggregate.snapshot())
+
+def _retry_entry(job_id, url, options, error):
+    """Re-queue a failed playlist entry. Returns False once its retries are used up."""
+    job = _store.get(job_id)
+    attempt = job.get('attempt', 1) if job else 1
+    if not job or job['status'] == 'cancelling' or attempt > _playlist_settings['entry_retries']:
+        return False
+    log.info('Retrying (attempt %d) after: %s', attempt + 1, error)
+    _update(job_id, status='queued', attempt=attempt + 1, last_error=error,
+            progress=0, downloaded_bytes=0, speed=None, eta=None)
+    _submit(job_id, url, options, 'bulk')
+    return True
+
+def _cancel_playlist(job):
+    """Cancel every unfinished entry of a playlist; the parent follows the last one."""
+    job_id = job['job_id']
+    # Stops an expansion that is still queuing entries
+    if _get_scheduler().cancel(job_id) == 'queued' and job_id in _parents:
+        # Recovered playlist whose expansion never got to resume
+        _parents[job_id].expansion_done()
+    _update(job_id, status='cancelling')
+    for child_id in job.get('children') or []:
+        cancel_job(child_id)
+    _finish_parent_if_done(job_id)
+    return True
+
+def _finish_parent_if_done(parent_id):
+    aggregate = _parents.get(parent_id)
+    if aggregate is None or not aggregate.finished():
+        return
+    with _parents_lock:
+        # Several children can finish at once; only one of them completes the parent
+        if _parents.pop(parent_id, None) is None:
+            return
+        for child_id in aggregate.child_ids:
+            _child_parents.pop(child_id, None)
+
+    parent = _store.get(parent_id)
+    if parent is None:
+        return
+    status = 'cancelled' if parent['status'] == 'cancelling' else 'completed'
+    _update(parent_id, status=status, result=_playlist_result(parent), **aggregate.snapshot())
+
+def _playlist_result(parent):
+    """Combine the entries' results in the shape download_and_process returns."""
+    results = {
+        'success': False,
+        'downloads': [],
+        'errors': [],
+        'skipped': [],
+        'summary': {}
+    }
+    if parent.get('expansion_error'):
+        results['errors'].append({
+            'error': 'Could not list the whole playlist',
+            'details': parent['expansion_error']
+        })
+
+    for child_id in parent.get('children') or []:
+        child = _store.get(child_id) or {'status': 'error', 'result': None}
+        result = child.get('result') or {}
+        if child['status'] == 'completed':
+            results['downloads'].extend(result.get('downloads', []))
+            results['skipped'].extend(result.get('skipped', []))
+        elif child['status'] == 'cancelled':
+            results['skipped'].append({'index': child.get('index'), 'url': child.get('url'), 'reason': 'Cancelled'})
+        else:
+            results['errors'].append({
+                'index': child.get('index'),
+                'url': child.get('url'),
+                'error': f"Entry {child.get('index')} failed after {child.get('attempt', 1)} attempt(s)",
+                'details': result.get('error') or child.get('last_error')
+            })
 
+    results['success'] = len(results['downloads']) > 0
+    results['summary'] = {
+        'playlist_title': parent.get('playlist_title'),
+        'entries': len(parent.get('children') or []),
+        'total_downloads': len(results['downloads']),
+        'total_errors': len(results['errors']),
+        'total_skipped': len(results['skipped'])
+    }
+    return results
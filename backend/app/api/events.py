@@ -0,0 +1,159 @@
+# backend/app/api/events.py
+import json
+from threading import Lock, Condition
+
+# Statuses after which a job sends no further events
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+class Subscription:
+    """
+    One SSE client's pending events.
+
+    Deltas for the same job are merged while they wait to be sent, so a slow
+    client costs at most one pending entry per job instead of one per event.
+    If even that grows past max_pending the backlog is dropped and the client
+    is told to resync from the status endpoint.
+    """
+
+    def __init__(self, job_ids=None, client_id=None, max_pending=256):
+        self.job_ids = set(job_ids or ())
+        self.client_id = client_id
+        self.max_pending = max_pending
+        self.coalesced = 0
+        self._pending = {}  # job_id -> merged delta, in first-arrival order
+        self._resync = False
+        self._closed = False
+        self._cond = Condition()
+
+    def offer(self, job_id, delta):
+        with self._cond:
+            if self._closed:
+                return
+            pending = self._pending.get(job_id)
+            if pending is not None:
+                pending.update(delta)
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                self._pending.clear()
+                self._resync = True
+            else:
+                self._pending[job_id] = dict(delta)
+            self._cond.notify()
+
+    def drain(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for events.
+        Returns (resync, [(job_id, delta), ...]); both empty on timeout.
+        """
+        with self._cond:
+            if not self._pending and not self._resync and not self._closed:
+                self._cond.wait(timeout)
+            events = list(self._pending.items())
+            resync = self._resync
+            self._pending = {}
+            self._resync = False
+            return resync, events
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    @property
+    def closed(self):
+        return self._closed
+
+class EventBroker:
+    """Fans job updates out to the subscriptions interested in them."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._by_job = {}     # job_id -> set of subscriptions
+        self._by_client = {}  # client_id -> set of subscriptions
+
+    def subscribe(self, job_ids=None, client_id=None):
+        sub = Subscription(job_ids=job_ids, client_id=client_id)
+        with self._lock:
+            for job_id in sub.job_ids:
+                self._by_job.setdefault(job_id, set()).add(sub)
+            if client_id:
+                self._by_client.setdefault(client_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        sub.close()
+        with self._lock:
+            for job_id in sub.job_ids:
+                self._discard(self._by_job, job_id, sub)
+            if sub.client_id:
+                self._discard(self._by_client, sub.client_id, sub)
+
+    def publish(self, job_id, client_id, delta):
+        with self._lock:
+            targets = set(self._by_job.get(job_id, ()))
+            if client_id:
+                targets |= self._by_client.get(client_id, set())
+        for sub in targets:
+            sub.offer(job_id, delta)
+
+    def subscriber_count(self):
+        with self._lock:
+            subs = set()
+            for group in list(self._by_job.values()) + list(self._by_client.values()):
+                subs |= group
+            return len(subs)
+
+    @staticmethod
+    def _discard(index, key, sub):
+        group = index.get(key)
+        if group is not None:
+            group.discard(sub)
+            if not group:
+                del index[key]
+
+def format_sse(data, event=None):
+    """Encode one Server-Sent Event."""
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+def stream_events(sub, snapshots, keepalive=15.0):
+    """
+    Generator producing the SSE stream for a subscription.
+
+    ``snapshots`` is the current state of the subscribed jobs, sent first so
+    a (re)connecting client never misses the state it subscribed to.
+    A stream for explicit job ids ends once all of them have finished.
+    """
+    remaining = set(sub.job_ids)
+
+    for snapshot in snapshots:
+        yield format_sse(snapshot, event='snapshot')
+        if snapshot.get('status') in TERMINAL_STATUSES:
+            remaining.discard(snapshot['job_id'])
+
+    if sub.job_ids and not remaining and not sub.client_id:
+        return
+
+    while not sub.closed:
+        resync, events = sub.drain(keepalive)
+
+        if resync:
+            yield format_sse({}, event='resync')
+
+        if not resync and not events:
+            # Comment line keeps proxies from closing an idle connection
+            yield ': keepalive\n\n'
+            continue
+
+        for job_id, delta in events:
+            yield format_sse(dict(delta, job_id=job_id), event='progress')
+            if delta.get('status') in TERMINAL_STATUSES:
+                remaining.discard(job_id)
+
+        if sub.job_ids and not remaining and not sub.client_id:
+            return
+
+broker = EventBroker()
@@ -0,0 +1,346 @@
+# backend/app/api/executors.py
+import itertools
+import multiprocessing
+import os
+import signal
+import time
+from threading import Lock
+from yt_dlp.utils import DownloadCancelled
+from app.utils import joblog
+from app.utils.download_cache import download_cache
+from app.utils.downloader import download_and_process, finish_download
+from app.utils.metadata_cache import metadata_cache
+from app.utils.long_transcription import PROCESS_NAME_PREFIX as CHUNK_PROCESS_PREFIX
+from app.utils.whisper_models import whisper_models
+
+try:
+    import resource
+except ImportError:  # Windows: no per-process memory limits
+    resource = None
+
+# Names of worker processes start with these; see in_worker_process()
+WORKER_NAME_PREFIX = 'download-process'
+POSTPROCESS_NAME_PREFIX = 'postprocess-process'
+
+# Progress hook fields sent back to the server; the info_dict in the hook
+# argument is large and not always picklable, so it stays in the worker
+PROGRESS_FIELDS = (
+    'status', 'filename', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+    'speed', 'eta', 'elapsed', 'fragment_index', 'fragment_count',
+)
+
+class WorkerCrashed(Exception):
+    """A worker process died while running a job."""
+
+class JobFailed(Exception):
+    """The job raised inside a worker process; the worker itself is fine."""
+
+def in_reloader_parent(app):
+    """
+    True in the process the Werkzeug reloader watches the files from (debug
+    mode). It never serves requests, the child it restarts does, so it must
+    not run jobs or background work either.
+    """
+    return app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+def in_worker_process():
+    """True inside a download, post-processing or transcription worker process (which re-imports the app's main module)."""
+    return multiprocessing.current_process().name.startswith(
+        (WORKER_NAME_PREFIX, POSTPROCESS_NAME_PREFIX, CHUNK_PROCESS_PREFIX))
+
+class ThreadBackend:
+    """Runs downloads on the calling scheduler thread, inside the server process."""
+
+    name = 'thread'
+
+    def run(self, url, options, on_progress, cancel_event):
+        def progress_hook(d):
+            if cancel_event.is_set():
+                raise DownloadCancelled('Job cancelled')
+            on_progress(d)
+
+        # Hooks go on a copy of the options; the stored options stay serialisable
+        return download_and_process(url, **dict(options, progress_hooks=[progress_hook]))
+
+    def stats(self):
+        return {'backend': self.name}
+
+    def shutdown(self):
+        pass
+
+class ProcessBackend:
+    """
+    Runs downloads in separate worker processes.
+
+    yt-dlp's extraction and post-processing then hold their own interpreter's
+    GIL instead of the server's. Each scheduler thread checks out one worker
+    for the duration of a job, so there are never more processes than
+    scheduler workers. Progress comes back over the worker's pipe.
+
+    A worker that crashes (or hits its memory limit) only fails its current
+    job; it is discarded and a new one is spawned for the next job. Workers
+    are also replaced after ``max_jobs_per_worker`` jobs, which returns any
+    memory yt-dlp or ffmpeg wrappers leaked. Cancelling a running job kills
+    its worker, along with any ffmpeg it started.
+    """
+
+    name = 'process'
+
+    def __init__(self, max_jobs_per_worker=25, memory_limit_mb=4096, progress_interval=0.1, settings=None,
+                 niceness=0, name_prefix=WORKER_NAME_PREFIX):
+        self.max_jobs_per_worker = max(1, int(max_jobs_per_worker))
+        # Passed to configure_worker() in each new process
+        self.settings = settings or {}
+        self.memory_limit_mb = memory_limit_mb
+        self.progress_interval = progress_interval
+        self.niceness = niceness
+        self.name_prefix = name_prefix
+        # Forking a threaded server is unsafe; spawn is also the only option on Windows
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._busy = set()
+        self._lock = Lock()
+        self._ids = itertools.count()
+        self.counters = {'spawned': 0, 'recycled': 0, 'crashed': 0, 'killed': 0}
+
+    def run(self, url, options, on_progress, cancel_event):
+        # The worker extracts the URL itself: nothing of yt-dlp's runs in the server for it
+        return self._execute(('run', url, options), on_progress, cancel_event)
+
+    def finish(self, state, cancel_event):
+        """Run finish_download on the ``state`` a deferred download left, in a worker process."""
+        return self._execute(('finish', state), None, cancel_event)
+
+    def _execute(self, message, on_progress, cancel_event):
+        worker = self._checkout()
+        try:
+            result = worker.run(message, on_progress, cancel_event)
+        except DownloadCancelled:
+            self._discard(worker, 'killed')
+            raise
+        except WorkerCrashed:
+            self._discard(worker, 'crashed')
+            raise
+        except JobFailed:
+            self._checkin(worker)
+            raise
+        except BaseException:
+            # Unknown state (e.g. a broken pipe); never reuse it
+            self._discard(worker, 'crashed')
+            raise
+        self._checkin(worker)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                backend=self.name,
+                idle_workers=len(self._idle),
+                busy_workers=len(self._busy),
+                max_jobs_per_worker=self.max_jobs_per_worker,
+                memory_limit_mb=self.memory_limit_mb,
+            )
+
+    def shutdown(self):
+        with self._lock:
+            workers = self._idle + list(self._busy)
+            self._idle = []
+            self._busy = set()
+        for worker in workers:
+            worker.stop()
+
+    def _checkout(self):
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    self._busy.add(worker)
+                    return worker
+                self.counters['crashed'] += 1
+            self.counters['spawned'] += 1
+            name = f'{self.name_prefix}-{next(self._ids)}'
+
+        worker = _ProcessWorker(self._ctx, name, self.memory_limit_mb, self.progress_interval, self.settings,
+                                self.niceness)
+        with self._lock:
+            self._busy.add(worker)
+        return worker
+
+    def _checkin(self, worker):
+        if worker.jobs >= self.max_jobs_per_worker or not worker.alive:
+            self._discard(worker, 'recycled')
+            return
+        with self._lock:
+            self._busy.discard(worker)
+            self._idle.append(worker)
+
+    def _discard(self, worker, reason):
+        with self._lock:
+            self._busy.discard(worker)
+            self.counters[reason] += 1
+        # Only a worker that finished its job can be asked to exit politely
+        worker.stop(force=reason != 'recycled')
+
+class _ProcessWorker:
+    """One worker process and the server's end of its pipe."""
+
+    def __init__(self, ctx, name, memory_limit_mb, progress_interval, settings, niceness=0):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, memory_limit_mb, progress_interval, settings, niceness),
+            name=name,
+        )
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def run(self, message, on_progress, cancel_event):
+        self.jobs += 1
+        self.conn.send(message)
+
+        while True:
+            if cancel_event.is_set():
+                raise DownloadCancelled('Job cancelled')
+            try:
+                if not self.conn.poll(0.2):
+                    if not self.process.is_alive():
+                        raise WorkerCrashed(f'Worker process exited with code {self.process.exitcode}')
+                    continue
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                self.process.join(timeout=1)
+                raise WorkerCrashed(f'Worker process exited with code {self.process.exitcode}')
+
+            kind = message[0]
+            if kind == 'progress':
+                if on_progress is not None:
+                    on_progress(message[1])
+            elif kind == 'log':
+                # Logged on this (the job's scheduler) thread, so it is attributed to the job
+                joblog.relay(message[1])
+            elif kind == 'result':
+                return message[1]
+            elif kind == 'error':
+                raise JobFailed(message[1])
+
+    def stop(self, force=False):
+        """Ask the worker to exit, or kill it straight away with ``force``."""
+        if not force:
+            try:
+                self.conn.send(('stop',))
+            except (OSError, ValueError):
+                pass
+            self.process.join(timeout=2)
+        if self.process.is_alive():
+            if hasattr(os, 'killpg'):
+                try:
+                    # The worker leads its own process group: the ffmpeg it runs goes too
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            self.process.kill()
+            self.process.join(timeout=2)
+        self.conn.close()
+
+def worker_settings():
+    """State of the server's shared caches and logging that a worker process has to reopen."""
+    return {
+        'download_cache': download_cache.settings(),
+        'metadata_cache': metadata_cache.settings(),
+        'logging': joblog.settings(),
+        'whisper_models': whisper_models.settings(),
+    }
+
+def configure_worker(settings, send):
+    if settings.get('download_cache'):
+        download_cache.configure(**settings['download_cache'])
+    if settings.get('metadata_cache'):
+        metadata_cache.configure(**settings['metadata_cache'])
+    if settings.get('logging'):
+        joblog.configure_worker(settings['logging']['level'], lambda record: send(('log', record)))
+    if settings.get('whisper_models'):
+        whisper_models.configure(**settings['whisper_models'])
+
+def _worker_main(conn, memory_limit_mb, progress_interval, settings, niceness=0):
+    """Entry point of a worker process: run jobs sent over ``conn`` until told to stop."""
+    send_lock = Lock()
+
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    if niceness and hasattr(os, 'nice'):
+        # Inherited by the ffmpeg processes started from here
+        os.nice(niceness)
+
+    def send(message):
+        # yt-dlp's fragment threads can log while the main thread reports progress
+        with send_lock:
+            conn.send(message)
+
+    configure_worker(settings, send)
+
+    if resource is not None and memory_limit_mb:
+        limit = int(memory_limit_mb) * 1024 * 1024
+        # Address space, not RSS: also caps ffmpeg and other children started from here
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # The server went away
+            return
+        if message[0] == 'finish':
+            try:
+                send(('result', finish_download(message[1])))
+            except MemoryError:
+                send(('error', 'Worker ran out of memory'))
+                return
+            except Exception as e:
+                send(('error', str(e)))
+            continue
+        if message[0] != 'run':
+            return
+
+        _, url, options = message
+
+        last_sent = {'time': 0.0, 'status': None}
+
+        def progress_hook(d):
+            # Throttle at the source so the pipe carries a few messages a second, not one per chunk
+            now = time.monotonic()
+            status = d.get('status')
+            if status == 'downloading' and status == last_sent['status'] and now - last_sent['time'] < progress_interval:
+                return
+            last_sent['time'] = now
+            last_sent['status'] = status
+            fields = {key: d[key] for key in PROGRESS_FIELDS if key in d}
+            if status == 'error':
+                fields['error'] = str(d.get('error', 'Download failed'))
+            send(('progress', fields))
+
+        try:
+            result = download_and_process(url, **dict(options, progress_hooks=[progress_hook]))
+            send(('result', result))
+        except MemoryError:
+            send(('error', 'Worker ran out of memory'))
+            # The heap may be in any state; let the server start a fresh worker
+            return
+        except Exception as e:
+            send(('error', str(e)))
+
+def create_backend(app):
+    """Build the execution backend selected by the DOWNLOAD_BACKEND config value."""
+    if app.config.get('DOWNLOAD_BACKEND', 'process') == 'thread':
+        return ThreadBackend()
+    return ProcessBackend(
+        max_jobs_per_worker=app.config.get('DOWNLOAD_WORKER_MAX_JOBS', 25),
+        memory_limit_mb=app.config.get('DOWNLOAD_WORKER_MEMORY_MB', 4096),
+        settings=worker_settings(),
+    )
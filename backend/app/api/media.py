@@ -0,0 +1,58 @@
+# backend/app/api/media.py
+import os
+from urllib.parse import quote
+from flask import current_app, send_file
+
+try:
+    from werkzeug.utils import safe_join
+except ImportError:  # Werkzeug < 2.2
+    from werkzeug.security import safe_join
+
+def resolve_media_path(root, filename):
+    """
+    Map a requested filename to a file below ``root``.
+    Raises FileNotFoundError for missing files and paths escaping ``root``.
+    """
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        raise FileNotFoundError(filename)
+    return path
+
+def file_etag(stat):
+    """Strong validator from the file's identity, mtime and size; no hashing of multi-GB files."""
+    return f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+def send_media(root, filename, as_attachment=True, mimetype=None):
+    """
+    Serve a downloaded file with Range, ETag and If-None-Match/If-Range support.
+
+    By default Flask streams the file itself; under a WSGI server that
+    implements ``wsgi.file_wrapper`` (gunicorn, uWSGI) full responses go out
+    with sendfile(). MEDIA_OFFLOAD hands the transfer to the front-end server
+    instead: 'x-sendfile' (Apache, lighttpd) through Flask's USE_X_SENDFILE,
+    or 'x-accel' (nginx) through an X-Accel-Redirect to MEDIA_ACCEL_PREFIX,
+    which must be an ``internal`` location aliased to ``root``.
+    """
+    path = resolve_media_path(root, filename)
+    stat = os.stat(path)
+    download_name = os.path.basename(path)
+
+    if current_app.config.get('MEDIA_OFFLOAD') == 'x-accel':
+        relative = os.path.relpath(path, root).replace(os.sep, '/')
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = current_app.config.get('MEDIA_ACCEL_PREFIX', '/protected-media/').rstrip('/') + '/' + quote(relative)
+        if as_attachment:
+            response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        # nginx answers Range and conditional requests for the internal location itself
+        return response
+
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=file_etag(stat),
+        last_modified=stat.st_mtime,
+        max_age=current_app.config.get('MEDIA_MAX_AGE', 3600),
+    )
@@ -0,0 +1,168 @@
+# backend/app/api/metrics.py
+import bisect
+from threading import Lock
+from app.utils.joblog import get_logger
+
+log = get_logger('metrics')
+
+# Stage durations range from milliseconds (file scan) to an hour (long transcriptions)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative))
+                samples.append((f'{self.name}_sum', labels, round(total, 6)))
+                samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+class CollectedMetric:
+    """Values read at scrape time by a collector."""
+
+    def __init__(self, name, help, type, samples):
+        self.name = name
+        self.help = help
+        self.type = type
+        self._samples = samples
+
+    def samples(self):
+        return self._samples
+
+class MetricsRegistry:
+    """
+    Renders metrics in the Prometheus text exposition format.
+
+    Counters and histograms are updated as jobs run; collectors are called
+    at scrape time for values that already exist elsewhere (queue depth,
+    cache statistics) and return a list of metrics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                log.exception('Metrics collector failed: %s', e)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+def collected(name, help, values, labelname=None, type='gauge'):
+    """Build a collected metric from a single value or, with ``labelname``, a {label: value} dict."""
+    if labelname is None:
+        samples = [(name, (), values)] if values is not None else []
+    else:
+        samples = [(name, ((labelname, label),), value) for label, value in values.items() if value is not None]
+    return CollectedMetric(name, help, type, samples)
+
+def classify_error(message):
+    """Reduce an error message to a small set of classes usable as a label."""
+    text = (message or '').lower()
+    if 'blocked it in your country' in text or 'blocked in your country' in text:
+        return 'geo_blocked'
+    if 'confirm your age' in text or 'age-restricted' in text:
+        return 'age_restricted'
+    if 'unavailable' in text or 'no longer available' in text or 'private video' in text:
+        return 'unavailable'
+    if 'worker process exited' in text or 'out of memory' in text:
+        return 'worker_crash'
+    if 'ffmpeg' in text or 'postprocessing' in text:
+        return 'postprocess'
+    if 'unable to download' in text or 'timed out' in text or 'connection' in text or 'http error' in text:
+        return 'network'
+    return 'other'
+
+registry = MetricsRegistry()
+
+JOBS_FINISHED = registry.counter('ytd_jobs_finished_total', 'Jobs that reached a final status', ['status'])
+JOB_ERRORS = registry.counter('ytd_job_errors_total', 'Failed jobs by error class', ['error_class'])
+DOWNLOADED_BYTES = registry.counter('ytd_downloaded_bytes_total', 'Bytes downloaded by finished jobs')
+STAGE_SECONDS = registry.histogram('ytd_stage_duration_seconds', 'Time spent in each job stage', ['stage'])
+FORMAT_PLANS = registry.counter('ytd_format_plans_total', 'Downloads by planned processing strategy', ['strategy'])
+PLANNED_CPU_SECONDS = registry.counter('ytd_planned_cpu_seconds_total',
+                                       'Estimated CPU seconds of planned post-processing', ['strategy'])
@@ -0,0 +1,110 @@
+# backend/app/api/postprocessing.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from yt_dlp.utils import DownloadCancelled
+from app.api.executors import POSTPROCESS_NAME_PREFIX, ProcessBackend
+
+class PostprocessPool:
+    """
+    Worker processes that merge, remux and convert downloaded files, apart
+    from the download workers. A download's worker (and its host's
+    connection budget) is released as soon as the bytes are on disk, so the
+    next download runs while ffmpeg works on this one.
+
+    ffmpeg, and the hashing and caching of its output, are CPU bound: they
+    run in processes of their own, outside the server's GIL. The pool is
+    sized from the CPU count rather than the download concurrency, and its
+    processes run at a lower priority so that conversions yield the CPU to
+    the server and to the downloads. One thread per process waits on its
+    pipe; cancelling a running task kills its process.
+    """
+
+    def __init__(self):
+        self.workers = os.cpu_count() or 1
+        self.niceness = 0
+        self._process_options = {}
+        self._backend = None
+        self._executor = None
+        self._lock = Lock()
+        self._queued = 0
+        self._running = 0
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def configure(self, workers=None, niceness=0, max_jobs_per_worker=25, memory_limit_mb=4096, settings=None):
+        """``settings`` are the worker_settings() each process starts from."""
+        with self._lock:
+            self.workers = max(1, int(workers or os.cpu_count() or 1))
+            self.niceness = max(0, int(niceness))
+            self._process_options = {
+                'max_jobs_per_worker': max_jobs_per_worker,
+                'memory_limit_mb': memory_limit_mb,
+                'settings': settings,
+            }
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)``; the future can be cancelled with cancel() while still queued."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='postprocess')
+            self.counters['submitted'] += 1
+            self._queued += 1
+            return self._executor.submit(self._run, fn, args)
+
+    def finish(self, state, cancel_event):
+        """
+        Run finish_download on ``state`` in one of the pool's processes and
+        return its results. Called from a submitted task; a set
+        ``cancel_event`` kills the process and raises DownloadCancelled.
+        """
+        with self._lock:
+            if self._backend is None:
+                self._backend = ProcessBackend(niceness=self.niceness, name_prefix=POSTPROCESS_NAME_PREFIX,
+                                               **self._process_options)
+            backend = self._backend
+        return backend.finish(state, cancel_event)
+
+    def cancel(self, future):
+        """Cancel a queued task. Returns False once it has started."""
+        if not future.cancel():
+            return False
+        with self._lock:
+            self._queued -= 1
+            self.counters['cancelled'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            processes = self._backend.stats() if self._backend is not None else {}
+            return dict(self.counters, workers=self.workers, niceness=self.niceness,
+                        queued=self._queued, running=self._running,
+                        processes={key: processes.get(key, 0) for key in
+                                   ('spawned', 'recycled', 'crashed', 'killed', 'idle_workers', 'busy_workers')})
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            backend, self._backend = self._backend, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if backend is not None:
+            backend.shutdown()
+
+    def _run(self, fn, args):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        outcome = 'failed'
+        try:
+            result = fn(*args)
+            outcome = 'completed'
+            return result
+        except DownloadCancelled:
+            outcome = 'cancelled'
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                self.counters[outcome] += 1
+
+postprocess_pool = PostprocessPool()
@@ -0,0 +1,310 @@
+# backend/app/api/progress.py
+import time
+from threading import Lock
+
+COUNTER_NAMES = ('hook_calls', 'published', 'merged', 'dropped')
+
+class ProgressTracker:
+    """
+    Aggregates yt-dlp progress hook calls for one job.
+
+    The hook fires for every chunk written, so calls only update this job's
+    own state (under its own lock) and the result is handed to ``publish``
+    at most every ``min_interval`` seconds, unless progress moved by at least
+    ``min_delta`` percent or the status changed.
+
+    Counters:
+        hook_calls  every call received
+        published   calls that produced an update
+        merged      calls folded into a later update
+        dropped     calls that carried nothing new
+    """
+
+    def __init__(self, publish, min_interval=0.25, min_delta=1.0, smoothing=0.3, clock=time.monotonic):
+        self._publish = publish
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.smoothing = smoothing
+        self._clock = clock
+        self._lock = Lock()
+
+        self._files = {}  # filename -> [downloaded_bytes, total_bytes]
+        self._status = None
+        self._current_file = None
+        self._speed = None
+        self._last_sample = None  # (time, total downloaded bytes)
+        self._last_publish_time = None
+        self._last_progress = None
+
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+
+    def hook(self, d):
+        """yt-dlp progress hook."""
+        with self._lock:
+            self.counters['hook_calls'] += 1
+            status = d.get('status')
+
+            if status == 'downloading':
+                changed = self._record_chunk(d)
+                new_status = 'downloading'
+            elif status == 'finished':
+                filename = d.get('filename') or self._current_file
+                entry = self._files.setdefault(filename, [0, None])
+                size = d.get('total_bytes') or d.get('downloaded_bytes') or entry[1] or entry[0]
+                entry[0] = entry[1] = size
+                changed = True
+                new_status = 'processing'
+            elif status == 'error':
+                changed = True
+                new_status = 'error'
+            elif status == 'discarded':
+                # A partial file given up on (see downloader._download_streamed): its bytes no longer count
+                changed = self._files.pop(d.get('filename'), None) is not None
+                if changed:
+                    self._last_sample = (self._clock(), sum(entry[0] for entry in self._files.values()))
+                new_status = self._status
+            else:
+                changed = False
+                new_status = self._status
+
+            if not changed:
+                self.counters['dropped'] += 1
+                return
+
+            fields = self._snapshot(new_status)
+            if not self._should_publish(fields):
+                self.counters['merged'] += 1
+                return
+
+            self._status = new_status
+            self._last_publish_time = self._clock()
+            self._last_progress = fields['progress']
+            self.counters['published'] += 1
+
+            if status == 'error':
+                fields['error'] = str(d.get('error', 'Download failed'))
+
+        # Publish outside our lock; the receiver takes its own locks
+        self._publish(fields)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+    @property
+    def speed(self):
+        """Smoothed download rate in bytes/s; 0 once the download has finished."""
+        with self._lock:
+            if self._status != 'downloading' or self._speed is None:
+                return 0
+            return self._speed
+
+    def _record_chunk(self, d):
+        filename = d.get('filename') or ''
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+
+        entry = self._files.get(filename)
+        if entry is not None and entry[0] == downloaded and entry[1] == total:
+            return False
+
+        self._files[filename] = [downloaded, total]
+        self._current_file = filename
+
+        now = self._clock()
+        done = sum(entry[0] for entry in self._files.values())
+        if self._last_sample is not None:
+            elapsed = now - self._last_sample[0]
+            if elapsed > 0:
+                rate = max(done - self._last_sample[1], 0) / elapsed
+                # Exponentially weighted moving average smooths out bursty chunks
+                if self._speed is None:
+                    self._speed = rate
+                else:
+                    self._speed = self.smoothing * rate + (1 - self.smoothing) * self._speed
+                self._last_sample = (now, done)
+        else:
+            self._last_sample = (now, done)
+        return True
+
+    def _snapshot(self, status):
+        downloaded = sum(entry[0] for entry in self._files.values())
+        totals = [entry[1] for entry in self._files.values()]
+        total = sum(totals) if totals and all(totals) else None
+
+        if total:
+            progress = round(min(downloaded / total, 1) * 100, 2)
+        else:
+            # If no total bytes, show partial progress based on downloaded
+            progress = min(downloaded / (1024 * 1024), 99)  # Cap at 99%
+
+        eta = None
+        if total and self._speed:
+            eta = max(total - downloaded, 0) / self._speed
+
+        if status == 'processing':
+            progress = 100
+            eta = 0
+
+        fields = {
+            'status': status,
+            'downloaded_bytes': downloaded,
+            'total_bytes': total,
+            'progress': progress,
+            'speed': round(self._speed) if self._speed is not None else None,
+            'eta': round(eta) if eta is not None else None,
+        }
+        if self._current_file:
+            fields['current_file'] = self._current_file
+        return fields
+
+    def _should_publish(self, fields):
+        if self._last_publish_time is None or fields['status'] != self._status:
+            return True
+        if self._clock() - self._last_publish_time >= self.min_interval:
+            return True
+        return abs(fields['progress'] - self._last_progress) >= self.min_delta
+
+class ProgressRegistry:
+    """Keeps live trackers so their counters can be reported in aggregate."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._active = set()
+        self._retired = dict.fromkeys(COUNTER_NAMES, 0)
+
+    def add(self, tracker):
+        with self._lock:
+            self._active.add(tracker)
+
+    def retire(self, tracker):
+        """Fold a finished tracker's counters into the totals."""
+        stats = tracker.stats()
+        with self._lock:
+            self._active.discard(tracker)
+            for name in COUNTER_NAMES:
+                self._retired[name] += stats[name]
+
+    def stats(self):
+        with self._lock:
+            active = list(self._active)
+            totals = dict(self._retired)
+        for tracker in active:
+            for name, value in tracker.stats().items():
+                totals[name] += value
+        totals['active_trackers'] = len(active)
+        return totals
+
+registry = ProgressRegistry()
+
+class AggregateProgress:
+    """
+    Combines the progress of a playlist's child jobs into one parent view.
+
+    Children are added while the playlist is still being expanded, so the
+    aggregate only counts as finished once expansion is done and every
+    known child has reached a final status.
+    """
+
+    def __init__(self, min_interval=0.25, clock=time.monotonic):
+        self.min_interval = min_interval
+        self._clock = clock
+        self._lock = Lock()
+        self._children = {}  # child_id -> {'status', 'downloaded', 'total', 'speed'}
+        self._expanding = True
+        self._last_publish_time = None
+
+    @property
+    def child_ids(self):
+        with self._lock:
+            return list(self._children)
+
+    def add_child(self, child_id):
+        with self._lock:
+            self._children.setdefault(child_id, {'status': 'queued', 'downloaded': 0, 'total': None, 'speed': 0})
+
+    def expansion_done(self):
+        with self._lock:
+            self._expanding = False
+
+    def update(self, child_id, fields):
+        with self._lock:
+            child = self._children.get(child_id)
+            if child is None:
+                return
+            if 'status' in fields:
+                child['status'] = fields['status']
+            if 'downloaded_bytes' in fields:
+                child['downloaded'] = fields['downloaded_bytes'] or 0
+            if 'total_bytes' in fields:
+                child['total'] = fields['total_bytes']
+            if 'speed' in fields:
+                child['speed'] = fields['speed'] or 0
+            if child['status'] in ('completed', 'error', 'cancelled', 'queued'):
+                # Finished or waiting (e.g. for a retry): no longer transferring
+                child['speed'] = 0
+
+    def should_publish(self):
+        """Rate limit for parent updates driven by child progress."""
+        with self._lock:
+            now = self._clock()
+            if self._last_publish_time is not None and now - self._last_publish_time < self.min_interval:
+                return False
+            self._last_publish_time = now
+            return True
+
+    def finished(self):
+        with self._lock:
+            return not self._expanding and all(
+                child['status'] in ('completed', 'error', 'cancelled') for child in self._children.values()
+            )
+
+    def snapshot(self):
+        with self._lock:
+            children = list(self._children.values())
+            expanding = self._expanding
+
+        counts = {'completed': 0, 'error': 0, 'cancelled': 0}
+        downloaded = 0
+        speed = 0
+        known_sizes = []
+        fraction = 0.0
+        unstarted = 0
+
+        for child in children:
+            status = child['status']
+            downloaded += child['downloaded']
+            speed += child['speed']
+            if child['total']:
+                known_sizes.append(child['total'])
+            if status in counts:
+                counts[status] += 1
+                fraction += 1
+            elif child['total']:
+                fraction += min(child['downloaded'] / child['total'], 1)
+            else:
+                unstarted += 1
+
+        entries_total = len(children)
+        progress = round(fraction / entries_total * 100, 2) if entries_total else 0
+
+        # Entries without a size yet are assumed to be as large as the average known one
+        average_size = sum(known_sizes) / len(known_sizes) if known_sizes else None
+        total = sum(known_sizes) + (average_size * unstarted if average_size else 0)
+
+        eta = None
+        if speed and total:
+            eta = round(max(total - downloaded, 0) / speed)
+
+        return {
+            'entries_total': entries_total,
+            'entries_done': counts['completed'],
+            'entries_failed': counts['error'],
+            'entries_cancelled': counts['cancelled'],
+            'entries_expanding': expanding,
+            'downloaded_bytes': downloaded,
+            'total_bytes': round(total) if total else None,
+            'progress': progress,
+            'speed': round(speed),
+            'eta': eta,
+        }
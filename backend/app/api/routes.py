@@ -1,25 +1,83 @@
 # backend/app/api/routes.py
-from flask import jsonify, request, current_app, send_file
+from flask import jsonify, request, current_app, Response, stream_with_context
 from app.api import bp
-from app.api.download_manager import create_job, get_job_status
+from app.api.download_manager import (
+    create_job, get_job_status, cancel_job, get_queue_stats, get_client_job_ids
+)
+from app.api.events import broker, stream_events
+from app.api.media import resolve_media_path, send_media
+from app.api.metrics import registry as metrics_registry
+from app.api.transcription_jobs import create_transcription_job
+from app.database.library import DEFAULT_PAGE_SIZE as LIBRARY_PAGE_SIZE, library
+from app.utils.clipping import parse_ranges
 from app.utils.downloader import fetch_video_metadata
-import os
+from app.utils.transcript_cache import render as render_transcript, transcript_cache
+from app.utils.transcription import check_transcribable, get_transcription_info
+from app.utils.playlist_stream import (
+    DEFAULT_PAGE_SIZE, iter_playlist_entries, playlist_sessions, resolve_entries, summarize_entry
+)
+import json
 
 @bp.route('/metadata', methods=['POST'])
 def get_video_metadata():
-    """Fetch video metadata without downloading"""
+    """
+    Fetch video metadata without downloading.
+    Playlists are paginated with ?cursor=&limit= (or the same keys in the body);
+    ?stream=ndjson streams every playlist entry as one JSON object per line.
+    """
     data = request.get_json()
     if not data or 'url' not in data:
         return jsonify({'error': 'No URL provided'}), 400
 
     url = data.get('url')
+    cursor = request.args.get('cursor', data.get('cursor'))
+    limit = request.args.get('limit', data.get('limit', DEFAULT_PAGE_SIZE))
+
+    if request.args.get('stream') == 'ndjson':
+        return _stream_playlist_ndjson(url)
 
     try:
-        metadata = fetch_video_metadata(url)
+        metadata = fetch_video_metadata(url, cursor=cursor, limit=limit)
         return jsonify(metadata), 200
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+def _stream_playlist_ndjson(url):
+    """One header line, then one line per entry as the flat listing is paged in."""
+    try:
+        session, info = playlist_sessions.open(url)
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+    def generate():
+        if session is None:
+            yield json.dumps({'type': 'video', 'video': summarize_entry(info, url)}) + '\n'
+            return
+
+        yield json.dumps({'type': 'playlist', 'playlist_title': session.title, 'total': session.total}) + '\n'
+        try:
+            for index, entry in enumerate(iter_playlist_entries(session)):
+                yield json.dumps({'type': 'entry', 'index': index, 'video': summarize_entry(entry, url)}) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/metadata/entries', methods=['POST'])
+def resolve_metadata_entries():
+    """Resolve full details for the playlist entries the client is showing"""
+    data = request.get_json()
+    urls = (data or {}).get('urls')
+    if not urls or not isinstance(urls, list):
+        return jsonify({'error': 'No URLs provided'}), 400
+
+    max_entries = current_app.config.get('METADATA_RESOLVE_MAX', 50)
+    if len(urls) > max_entries:
+        return jsonify({'error': f'At most {max_entries} entries per request'}), 400
+
+    videos = resolve_entries(urls, workers=current_app.config.get('METADATA_RESOLVE_WORKERS', 4))
+    return jsonify({'success': True, 'videos': videos}), 200
+
 @bp.route('/download', methods=['POST'])
 def start_download():
     data = request.get_json()
@@ -40,6 +98,8 @@ def start_download():
         # Basic subtitle options
         'subtitles': data.get('subtitles', False),
         'transcribe': data.get('transcribe', False),
+        # Whisper model for transcription ('tiny', 'base', 'small'...); None uses WHISPER_DEFAULT_MODEL
+        'transcription_model': data.get('transcriptionModel'),
 
         # Advanced subtitle options
         'subtitle_language': advanced_opts.get('subtitleOptions', {}).get('language', 'en'),
@@ -53,32 +113,180 @@ def start_download():
         'network_settings': advanced_opts.get('networkSettings', {}),
     }
 
+    # 'interactive' jobs are dispatched ahead of 'bulk' ones
+    priority = data.get('priority', 'interactive')
+
     try:
-        job_id = create_job(url, options)
+        # A malformed time range is the request's fault, not the download's
+        parse_ranges(options['time_range'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        job_id = create_job(url, options, priority=priority, client_id=data.get('client_id'))
         return jsonify({'job_id': job_id}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/download/status/<job_id>')
 def get_download_status_route(job_id):
-    status = get_job_status(job_id)
+    # ?logs=1 adds the job's recent log lines
+    status = get_job_status(job_id, include_logs=request.args.get('logs') in ('1', 'true'))
     if status:
         return jsonify(status)
     else:
         return jsonify({'error': 'Job not found'}), 404
 
+@bp.route('/download/events')
+def download_events_route():
+    """
+    Server-Sent Events stream of job progress.
+    Subscribe with ?job_id=<id> (repeatable) or ?client_id=<id> for all of a client's jobs.
+    """
+    client_id = request.args.get('client_id')
+    job_ids = [job_id for job_id in request.args.getlist('job_id') if get_job_status(job_id)]
+
+    if not client_id and not job_ids:
+        return jsonify({'error': 'No known job_id or client_id provided'}), 404
+
+    # Subscribe before taking the snapshot so no update falls in between
+    sub = broker.subscribe(job_ids=job_ids, client_id=client_id)
+    snapshot_ids = list(job_ids)
+    if client_id:
+        snapshot_ids += [job_id for job_id in get_client_job_ids(client_id) if job_id not in job_ids]
+    snapshots = [status for status in map(get_job_status, snapshot_ids) if status]
+    keepalive = current_app.config.get('EVENTS_KEEPALIVE_SECONDS', 15)
+
+    def generate():
+        try:
+            yield from stream_events(sub, snapshots, keepalive=keepalive)
+        finally:
+            broker.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Disable nginx response buffering
+        }
+    )
+
+@bp.route('/download/cancel/<job_id>', methods=['POST'])
+def cancel_download_route(job_id):
+    if cancel_job(job_id):
+        return jsonify({'job_id': job_id, 'cancelled': True})
+    else:
+        return jsonify({'error': 'Job not found or already finished'}), 404
+
+@bp.route('/transcribe', methods=['POST'])
+def start_transcription():
+    """
+    Transcribe a file that is already in the downloads folder.
+    Progress, status and cancelling go through the /download/status, /download/events
+    and /download/cancel endpoints like any other job.
+    """
+    data = request.json or {}
+    filename = data.get('filename')
+    if not filename:
+        return jsonify({'error': 'No filename provided'}), 400
+
+    try:
+        path = resolve_media_path(current_app.config['UPLOAD_FOLDER'], filename)
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
+
+    error = check_transcribable(path)
+    if error:
+        return jsonify(error), 503
+
+    try:
+        job_id = create_transcription_job(
+            path,
+            language=data.get('language', 'en'),
+            model=data.get('model'),
+            client_id=data.get('client_id'),
+        )
+        return jsonify({'job_id': job_id}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@bp.route('/transcribe', methods=['GET'])
+def transcription_info_route():
+    """Whether Whisper is available, its models, and the transcription queue."""
+    return jsonify(get_transcription_info())
+
+@bp.route('/transcripts/<transcript_id>')
+def transcript_route(transcript_id):
+    """
+    A cached transcript, rendered from its stored segments.
+    ?format=srt|vtt|txt|json (default srt); ?download=1 serves it as an attachment.
+    """
+    transcript = transcript_cache.get(transcript_id)
+    if transcript is None:
+        return jsonify({'error': 'Transcript not found'}), 404
+
+    fmt = request.args.get('format', 'srt')
+    try:
+        body, mimetype = render_transcript(transcript, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = Response(body, mimetype=mimetype)
+    response.charset = 'utf-8'
+    if request.args.get('download') in ('1', 'true'):
+        response.headers['Content-Disposition'] = f'attachment; filename="transcript-{transcript_id}.{fmt}"'
+    return response
+
+@bp.route('/library')
+def library_route():
+    """
+    Finished downloads from the library catalogue, without listing the downloads folder.
+    ?sort=added|title|size|duration|name&order=asc|desc, ?q= searches titles, ?format=mp4;
+    pages of ?limit= items from ?cursor=, continued with the returned next_cursor.
+    """
+    try:
+        offset = int(request.args.get('cursor') or 0)
+        limit = int(request.args.get('limit', LIBRARY_PAGE_SIZE))
+        page = library.query(
+            offset=offset,
+            limit=limit,
+            sort=request.args.get('sort', 'added'),
+            order=request.args.get('order', 'desc'),
+            search=request.args.get('q'),
+            fmt=request.args.get('format'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    end = offset + len(page['items'])
+    page.update(next_cursor=str(end) if end < page['total'] else None, scanning=library.scanning)
+    return jsonify(page)
+
+@bp.route('/download/queue')
+def get_queue_route():
+    return jsonify(get_queue_stats())
+
+@bp.route('/metrics')
+def metrics_route():
+    """Queue, worker, throughput, stage timing and cache metrics in the Prometheus text format."""
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @bp.route('/download/file/<path:filename>')
 def download_file(filename):
+    """
+    Serve a finished download; supports Range requests for resuming and seeking.
+    ?inline=1 serves it for playback in the browser instead of as an attachment.
+    """
     try:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        return send_file(file_path, as_attachment=True)
-    except Exception as e:
+        inline = request.args.get('inline') in ('1', 'true')
+        return send_media(current_app.config['UPLOAD_FOLDER'], filename, as_attachment=not inline)
+    except FileNotFoundError:
         return jsonify({'error': 'File not found'}), 404
 
 @bp.route('/download/thumbnail/<path:filename>')
 def get_thumbnail(filename):
     try:
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        return send_file(file_path, mimetype='image/jpeg')
-    except Exception as e:
+        return send_media(current_app.config['UPLOAD_FOLDER'], filename, as_attachment=False, mimetype='image/jpeg')
+    except FileNotFoundError:
         return jsonify({'error': 'Thumbnail not found'}), 404
\ No newline at end of file
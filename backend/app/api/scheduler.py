@@ -0,0 +1,207 @@
+# backend/app/api/scheduler.py
+import heapq
+import itertools
+from threading import Thread, Condition, Event
+from urllib.parse import urlparse
+from app.utils.joblog import get_logger
+
+log = get_logger('scheduler')
+
+# Lower numbers are dispatched first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+PRIORITIES = {
+    'interactive': PRIORITY_INTERACTIVE,
+    'bulk': PRIORITY_BULK,
+}
+
+def host_key(url):
+    """Normalise a URL's host so mirrors of the same site share a limit."""
+    host = (urlparse(url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host == 'youtu.be':
+        host = 'youtube.com'
+    return host or 'unknown'
+
+class JobScheduler:
+    """
+    Fixed-size worker pool fed from a priority queue.
+
+    Jobs are kept in one heap per host so a worker can always find the best
+    eligible job without rescanning the whole queue: it only compares the
+    head of each host's heap whose host is below its concurrency limit.
+    """
+
+    def __init__(self, workers=3, per_host_limit=2, name='download'):
+        self.workers = max(1, int(workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.name = name
+
+        self._cond = Condition()
+        self._seq = itertools.count()
+        self._host_queues = {}   # host -> heap of (priority, seq, job_id)
+        self._host_active = {}   # host -> number of running jobs
+        self._queued = {}        # job_id -> entry
+        self._running = {}       # job_id -> entry
+        self._threads = []
+        self._stopping = False
+
+        # Cached queue positions, rebuilt lazily when the queue changes
+        self._version = 0
+        self._positions_version = -1
+        self._positions = {}
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._cond:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = Thread(target=self._worker_loop, name=f'{self.name}-worker-{index}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self):
+        """Stop dispatching; running jobs are asked to cancel."""
+        with self._cond:
+            self._stopping = True
+            for entry in self._running.values():
+                entry['cancel_event'].set()
+            self._cond.notify_all()
+
+    def submit(self, job_id, target, args=(), priority=PRIORITY_INTERACTIVE, host='unknown'):
+        """
+        Queue ``target(*args, cancel_event)`` to run on the pool.
+
+        The target receives a threading.Event as its last argument, which is
+        set when the job is cancelled while running.
+        """
+        entry = {
+            'job_id': job_id,
+            'target': target,
+            'args': tuple(args),
+            'priority': priority,
+            'host': host,
+            'seq': next(self._seq),
+            'cancel_event': Event(),
+        }
+
+        with self._cond:
+            heapq.heappush(
+                self._host_queues.setdefault(host, []),
+                (entry['priority'], entry['seq'], job_id)
+            )
+            self._queued[job_id] = entry
+            self._version += 1
+            self._cond.notify()
+
+    def cancel(self, job_id):
+        """
+        Cancel a job.
+
+        Returns 'queued' if the job was removed before it started, 'running'
+        if a running job was signalled, or None if the job is unknown here.
+        """
+        with self._cond:
+            if job_id in self._queued:
+                # Lazy deletion: the stale heap item is skipped on dispatch
+                del self._queued[job_id]
+                self._version += 1
+                return 'queued'
+
+            entry = self._running.get(job_id)
+            if entry is not None:
+                entry['cancel_event'].set()
+                return 'running'
+
+        return None
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job in dispatch order, or None."""
+        with self._cond:
+            if job_id not in self._queued:
+                return None
+
+            if self._positions_version != self._version:
+                ordered = sorted(self._queued.values(), key=lambda e: (e['priority'], e['seq']))
+                self._positions = {e['job_id']: index for index, e in enumerate(ordered, 1)}
+                self._positions_version = self._version
+
+            return self._positions.get(job_id)
+
+    def stats(self):
+        """Snapshot of pool utilisation."""
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'per_host_limit': self.per_host_limit,
+                'queued': len(self._queued),
+                'running': len(self._running),
+                'hosts': {host: count for host, count in self._host_active.items() if count},
+            }
+
+    def _is_live(self, item):
+        entry = self._queued.get(item[2])
+        return entry is not None and entry['seq'] == item[1]
+
+    def _next_entry(self):
+        """Pop the best eligible job. Caller must hold the condition."""
+        best_host = None
+        best_key = None
+
+        for host, heap in self._host_queues.items():
+            if self._host_active.get(host, 0) >= self.per_host_limit:
+                continue
+
+            # Drop cancelled entries sitting at the head of the heap
+            while heap and not self._is_live(heap[0]):
+                heapq.heappop(heap)
+            if not heap:
+                continue
+
+            if best_key is None or heap[0][:2] < best_key:
+                best_key = heap[0][:2]
+                best_host = host
+
+        if best_host is None:
+            return None
+
+        _, _, job_id = heapq.heappop(self._host_queues[best_host])
+        if not self._host_queues[best_host]:
+            del self._host_queues[best_host]
+
+        entry = self._queued.pop(job_id)
+        self._running[job_id] = entry
+        self._host_active[best_host] = self._host_active.get(best_host, 0) + 1
+        self._version += 1
+        return entry
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                entry = None
+                while not self._stopping:
+                    entry = self._next_entry()
+                    if entry is not None:
+                        break
+                    self._cond.wait()
+
+                if entry is None:
+                    return
+
+            try:
+                entry['target'](*entry['args'], entry['cancel_event'])
+            except Exception as e:
+                log.exception('Job %s raised %r', entry['job_id'], e)
+            finally:
+                with self._cond:
+                    # The job may have been resubmitted (retry) and be running again
+                    if self._running.get(entry['job_id']) is entry:
+                        del self._running[entry['job_id']]
+                    self._host_active[entry['host']] -= 1
+                    # A host slot opened up; any idle worker may now be eligible
+                    self._cond.notify_all()
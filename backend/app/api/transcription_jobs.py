@@ -0,0 +1,199 @@
+# backend/app/api/transcription_jobs.py
+import os
+import time
+import uuid
+from threading import Event, Lock
+from app.api import download_manager as manager
+from app.utils.joblog import job_context
+from app.utils.transcription import TranscriptionCancelled, check_transcribable, transcription_worker
+from app.utils.whisper_models import whisper_models
+
+JOB_TYPE = 'transcription'
+
+# Files among a download's outputs that can be transcribed
+MEDIA_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.webm', '.mp3', '.aac', '.wav', '.m4a', '.opus', '.ogg', '.flac')
+
+# Seconds between progress updates of one transcription
+PROGRESS_INTERVAL = 0.5
+
+# Timing stage of a transcription by where its transcript came from
+SOURCE_STAGES = {'whisper': 'transcribe', 'captions': 'transcript_captions', 'cache': 'transcript_cache'}
+
+# job_id -> (future, cancel_event) of queued and running transcriptions
+_active = {}
+_active_lock = Lock()
+
+def create_transcription_job(path, language='en', model=None, client_id=None, source_job_id=None, video_id=None,
+                             captions=None, duration=None):
+    """
+    Queue a transcription of a file that is already on disk.
+    ``video_id`` identifies the video it was downloaded from, for the transcript cache, and
+    ``captions`` is that video's caption track, used instead of Whisper when available.
+    Returns the job id; an unknown model name raises ValueError.
+    """
+    options = {
+        'language': language or 'en',
+        'model': whisper_models.resolve(model),
+        'video_id': video_id,
+        'captions': captions,
+        'duration': duration,
+    }
+    job_id = str(uuid.uuid4())
+    manager._store.add({
+        'job_id': job_id,
+        'type': JOB_TYPE,
+        'status': 'queued',
+        'progress': 0,
+        'url': os.path.basename(path),
+        'file': path,
+        'options': options,
+        'client_id': client_id,
+        'source_job_id': source_job_id,
+        'result': None
+    })
+    _submit(job_id, path, options)
+    return job_id
+
+def handoff(job_id, result, options, client_id=None):
+    """
+    Queue transcriptions of a finished download's media files.
+    Returns the new job ids; records a warning on ``result`` instead if Whisper is missing.
+    """
+    job_ids = []
+    for download in result.get('downloads', []):
+        path = _media_path(options['output_dir'], download)
+        if path is None:
+            continue
+        error = check_transcribable(path, whisper_needed=not download.get('captions'))
+        if error is not None:
+            result['transcription_warning'] = error.get('message') or error['error']
+            continue
+        video_id = download.get('video_id')
+        if video_id and download.get('clip'):
+            # A clip's transcript is not the whole video's
+            video_id = '{}@{}-{}'.format(video_id, *download['clip'])
+        job_ids.append(create_transcription_job(
+            path,
+            language=options.get('subtitle_language', 'en'),
+            model=options.get('transcription_model'),
+            client_id=client_id,
+            source_job_id=job_id,
+            video_id=video_id,
+            captions=download.get('captions'),
+            duration=download.get('duration'),
+        ))
+    return job_ids
+
+def cancel(job):
+    """Cancel a queued or running transcription. Returns False if it is not active."""
+    with _active_lock:
+        entry = _active.get(job['job_id'])
+    if entry is None:
+        return False
+    future, cancel_event = entry
+    if future.cancel():
+        # Still queued; the done callback records the cancellation
+        return True
+    cancel_event.set()
+    manager._update(job['job_id'], status='cancelling')
+    return True
+
+def recover(job):
+    """Re-queue a transcription that was active when the server stopped."""
+    if job['status'] == 'cancelling':
+        manager._update(job['job_id'], status='cancelled')
+    elif job['status'] in ('queued', 'transcribing'):
+        manager._update(job['job_id'], status='queued', progress=0, recovered=True)
+        _submit(job['job_id'], job['file'], job['options'])
+
+def queue_position(job_id):
+    with _active_lock:
+        entry = _active.get(job_id)
+    return transcription_worker.queue_position(entry[0]) if entry else None
+
+def get_stats():
+    return transcription_worker.stats()
+
+def _media_path(output_dir, download):
+    """The media file of one download result, or None if it is not on disk."""
+    candidates = [download.get('filename')] + list(download.get('actual_files') or [])
+    for name in candidates:
+        if name and name.lower().endswith(MEDIA_EXTENSIONS):
+            path = os.path.join(output_dir, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+def _submit(job_id, path, options):
+    cancel_event = Event()
+    state = {'started': None, 'last_publish': 0.0}
+
+    def on_progress(fraction):
+        now = time.time()
+        if state['started'] is None:
+            state['started'] = now
+            manager._update(job_id, status='transcribing', progress=0, started_at=now)
+            return
+        if now - state['last_publish'] < PROGRESS_INTERVAL:
+            return
+        state['last_publish'] = now
+        elapsed = now - state['started']
+        eta = elapsed * (1 - fraction) / fraction if fraction > 0 else None
+        manager._update_progress(
+            job_id, status='transcribing', progress=round(fraction * 100, 1),
+            eta=round(eta) if eta is not None else None,
+        )
+
+    def on_partial(text, chunks_done, chunks_total):
+        # Long files are transcribed in pieces; the text so far is readable before the end
+        manager._update_progress(job_id, partial_text=text, chunks_done=chunks_done, chunks_total=chunks_total)
+
+    with job_context(job_id):
+        future = transcription_worker.submit(
+            path, options['language'], options['model'],
+            on_progress=on_progress, on_partial=on_partial, cancel_event=cancel_event,
+            source_id=options.get('video_id'),
+            captions=options.get('captions'),
+            duration=options.get('duration'),
+        )
+    with _active_lock:
+        _active[job_id] = (future, cancel_event)
+    future.add_done_callback(lambda f: _finished(job_id, state, f))
+
+def _finished(job_id, state, future):
+    with _active_lock:
+        _active.pop(job_id, None)
+
+    job = manager._store.get(job_id)
+    if job is None:
+        return
+
+    finished = time.time()
+    started = state['started'] or finished
+    timings = [{'stage': 'queue_wait', 'offset': 0, 'seconds': round(max(started - job['created_at'], 0), 4)}]
+
+    if future.cancelled():
+        status, result = 'cancelled', None
+    else:
+        try:
+            status, result = 'completed', future.result()
+            timings.append({
+                # Captions and cached transcripts get their own stages, apart from Whisper runs
+                'stage': SOURCE_STAGES.get(result.get('source'), 'transcribe'),
+                'offset': timings[0]['seconds'],
+                'seconds': round(finished - started, 4),
+                'model': result.get('model'),
+            })
+        except TranscriptionCancelled:
+            status, result = 'cancelled', None
+        except Exception as e:
+            status, result = 'error', {'success': False, 'error': str(e), 'file': job.get('file')}
+
+    fields = {'status': status, 'result': result, 'timings': timings}
+    if job.get('partial_text') is not None:
+        # The result has the whole text
+        fields['partial_text'] = None
+    if status == 'completed':
+        fields.update(progress=100, eta=0)
+    manager._update(job_id, **fields)
+    manager._record_job_metrics(status, result, timings)
@@ -3,13 +3,25 @@ import sqlite3
 import os
 from flask import current_app, g
 
+def database_path(app=None):
+    app = app or current_app
+    return os.path.join(app.instance_path, 'youtube_downloader.db')
+
+def connect(path, **kwargs):
+    """
+    Open a connection for use outside the request context (background threads).
+    WAL lets status reads proceed while a writer holds the database.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, **kwargs)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            os.path.join(current_app.instance_path, 'youtube_downloader.db'),
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = connect(database_path())
 
     return g.db
 
@@ -0,0 +1,255 @@
+# backend/app/database/job_store.py
+import copy
+import json
+import os
+import time
+from threading import Thread, Lock, Event
+from app.database.db import connect, database_path
+from app.utils.joblog import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+
+log = get_logger('job_store')
+
+# Jobs in these states will never change again and can be evicted
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at);
+"""
+
+class MemoryJobStore:
+    """
+    Job store backed by a dict. Jobs are lost on restart.
+
+    Also the base class for persistent stores: reads are always served from
+    memory, subclasses only add durability through the _persist, _mark_dirty
+    and _remove hooks.
+    """
+
+    def __init__(self, ttl=3600, maintenance_interval=1.0):
+        self.ttl = ttl
+        self.maintenance_interval = maintenance_interval
+        self._jobs = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background flush/eviction thread."""
+        if self._thread is None:
+            self._thread = Thread(target=self._maintenance_loop, name='job-store')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def add(self, job):
+        now = time.time()
+        job = dict(job, created_at=job.get('created_at', now), updated_at=now)
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._persist(job)
+
+    def get(self, job_id):
+        """Returns a copy of the job, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.copy(job) if job is not None else None
+
+    def list(self, statuses=None):
+        with self._lock:
+            return [
+                copy.copy(job) for job in self._jobs.values()
+                if statuses is None or job['status'] in statuses
+            ]
+
+    def update(self, job_id, **fields):
+        """Apply a state change and persist it immediately."""
+        with self._lock:
+            job = self._apply(job_id, fields)
+            if job is not None:
+                self._persist(job)
+        return job is not None
+
+    def update_progress(self, job_id, **fields):
+        """Apply a high-frequency progress update; persisted in batches."""
+        with self._lock:
+            job = self._apply(job_id, fields)
+            if job is not None:
+                self._mark_dirty(job_id)
+        return job is not None
+
+    def delete(self, job_id):
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._remove([job_id])
+
+    def evict_expired(self, now=None):
+        """Drop finished jobs older than the TTL. Returns how many were evicted."""
+        cutoff = (now or time.time()) - self.ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.get('finished_at') is not None and job['finished_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            if expired:
+                self._remove(expired)
+        return len(expired)
+
+    def flush(self):
+        """Write out any batched progress updates."""
+
+    def _apply(self, job_id, fields):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        job['updated_at'] = time.time()
+        if job['status'] in FINISHED_STATUSES:
+            job.setdefault('finished_at', job['updated_at'])
+        else:
+            job.pop('finished_at', None)
+        return job
+
+    def _persist(self, job):
+        pass
+
+    def _mark_dirty(self, job_id):
+        pass
+
+    def _remove(self, job_ids):
+        pass
+
+    def _maintenance_loop(self):
+        last_eviction = 0
+        while not self._stop.wait(self.maintenance_interval):
+            try:
+                self.flush()
+                # Eviction needs far less precision than flushing
+                if time.time() - last_eviction >= min(60, self.ttl):
+                    self.evict_expired()
+                    last_eviction = time.time()
+            except Exception as e:
+                log.exception('Job store maintenance failed: %s', e)
+
+class SQLiteJobStore(MemoryJobStore):
+    """
+    Job store persisted to SQLite so queued and running jobs survive a restart.
+
+    State changes are written through; progress updates are collected and
+    written in one transaction per maintenance interval.
+
+    One process owns the database at a time (it holds a lock file next to
+    it): two servers recovering the same jobs would download them twice
+    into the same staging directories.
+    """
+
+    def __init__(self, path, ttl=3600, maintenance_interval=1.0):
+        super().__init__(ttl=ttl, maintenance_interval=maintenance_interval)
+        self.path = path
+        self._owner = _claim(path)
+        self._conn = connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._dirty = set()
+        self._load()
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._conn.close()
+        if self._owner is not None:
+            # Closing the file releases the lock
+            self._owner.close()
+            self._owner = None
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [self._row(self._jobs[job_id]) for job_id in self._dirty if job_id in self._jobs]
+            self._dirty.clear()
+            with self._conn:
+                self._conn.executemany(
+                    'UPDATE jobs SET status = ?, updated_at = ?, finished_at = ?, data = ? WHERE job_id = ?',
+                    [(status, updated, finished, data, job_id) for job_id, status, _, updated, finished, data in rows]
+                )
+
+    def _load(self):
+        for row in self._conn.execute('SELECT data FROM jobs'):
+            job = json.loads(row['data'])
+            self._jobs[job['job_id']] = job
+
+    def _row(self, job):
+        return (
+            job['job_id'],
+            job['status'],
+            job['created_at'],
+            job['updated_at'],
+            job.get('finished_at'),
+            json.dumps(job, default=str),
+        )
+
+    def _persist(self, job):
+        # The write-through supersedes any pending batched update
+        self._dirty.discard(job['job_id'])
+        with self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, status, created_at, updated_at, finished_at, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                self._row(job)
+            )
+
+    def _mark_dirty(self, job_id):
+        self._dirty.add(job_id)
+
+    def _remove(self, job_ids):
+        for job_id in job_ids:
+            self._dirty.discard(job_id)
+        with self._conn:
+            self._conn.executemany('DELETE FROM jobs WHERE job_id = ?', [(job_id,) for job_id in job_ids])
+
+def _claim(path):
+    """Lock ``path``'s lock file for this process, or raise if another process holds it."""
+    if fcntl is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    owner = open(path + '.lock', 'a')
+    try:
+        fcntl.flock(owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        owner.close()
+        raise RuntimeError(f'The job database {path} is in use by another server process')
+    return owner
+
+def create_job_store(app):
+    """Build the job store selected by the JOB_STORE config value."""
+    ttl = app.config.get('JOB_TTL_SECONDS', 3600)
+    interval = app.config.get('JOB_FLUSH_INTERVAL', 1.0)
+
+    if app.config.get('JOB_STORE', 'sqlite') == 'memory':
+        store = MemoryJobStore(ttl=ttl, maintenance_interval=interval)
+    else:
+        store = SQLiteJobStore(database_path(app), ttl=ttl, maintenance_interval=interval)
+
+    store.start()
+    return store
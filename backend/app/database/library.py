@@ -0,0 +1,307 @@
+# backend/app/database/library.py
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from app.database.db import connect, database_path
+from app.utils.download_cache import file_digest
+from app.utils.joblog import get_logger
+from app.utils.staging import artifact_kind
+
+log = get_logger('library')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS library (
+    name TEXT PRIMARY KEY,
+    video_id TEXT,
+    title TEXT,
+    format TEXT,
+    quality TEXT,
+    size INTEGER NOT NULL,
+    duration REAL,
+    checksum TEXT,
+    thumbnail TEXT,
+    info_json TEXT,
+    subtitles TEXT,
+    mtime REAL NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_library_added_at ON library(added_at);
+CREATE INDEX IF NOT EXISTS idx_library_title ON library(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_library_size ON library(size);
+CREATE INDEX IF NOT EXISTS idx_library_duration ON library(duration);
+CREATE INDEX IF NOT EXISTS idx_library_video_id ON library(video_id);
+CREATE INDEX IF NOT EXISTS idx_library_format ON library(format);
+"""
+
+# Sort keys accepted by query() and the ORDER BY they map to
+SORT_FIELDS = {
+    'added': 'added_at',
+    'title': 'title COLLATE NOCASE',
+    'size': 'size',
+    'duration': 'duration',
+    'name': 'name',
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Left behind by interrupted downloads; never catalogued
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.tmp', '.temp')
+
+def _sidecar_stem(name, kind):
+    """The media stem a sidecar belongs to: 'Title' for Title.info.json, Title.webp and Title.en.vtt."""
+    if kind == 'info':
+        return name[:-len('.info.json')]
+    stem = os.path.splitext(name)[0]
+    return os.path.splitext(stem)[0] if kind == 'subtitles' else stem
+
+def _quality(info):
+    """Quality label of a file from its info JSON: 1080p for video, 128k for audio."""
+    if info.get('height'):
+        return f"{info['height']}p"
+    if info.get('abr'):
+        return f"{round(info['abr'])}k"
+    return None
+
+class Library:
+    """
+    Catalogue of the finished files in the downloads folder.
+
+    One row per media file, with the video it came from, its size,
+    duration and checksum, and the names of its sidecars (thumbnail, info
+    JSON, subtitles). Rows are added as download jobs complete; on startup
+    a background scan reconciles the table with the folder, hashing and
+    reading the info JSON of new or changed files on a thread pool and
+    skipping files whose size and mtime match their row. Queries only read
+    the table, never the folder.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.db_path = None
+        self._conn = None
+        self._lock = Lock()
+        self._scanning = Event()
+        self.last_scan = None
+
+    @property
+    def enabled(self):
+        return self._conn is not None
+
+    @property
+    def scanning(self):
+        return self._scanning.is_set()
+
+    def configure(self, root, db_path):
+        conn = connect(db_path, check_same_thread=False)
+        conn.executescript(SCHEMA)
+        with self._lock:
+            self.root = root
+            self.db_path = db_path
+            self._conn = conn
+
+    def add_download(self, download):
+        """Catalogue one finished download from its result (artifacts as reported by the downloader)."""
+        if not self.enabled:
+            return
+        artifacts = download.get('artifacts') or [{'name': download.get('filename'), 'kind': 'media'}]
+        sidecars = [artifact['name'] for artifact in artifacts if artifact['kind'] != 'media']
+        for artifact in artifacts:
+            if artifact['kind'] != 'media' or not artifact.get('name'):
+                continue
+            path = os.path.join(self.root, artifact['name'])
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = self._row(artifact['name'], stat, sidecars)
+            row.update(
+                added_at=time.time(),
+                video_id=download.get('video_id'),
+                title=download.get('title'),
+                quality=download.get('quality'),
+                duration=download.get('duration'),
+                checksum=artifact.get('sha256') or file_digest(path),
+            )
+            self._write([row])
+
+    def query(self, offset=0, limit=DEFAULT_PAGE_SIZE, sort='added', order='desc', search=None, fmt=None):
+        """
+        One page of the catalogue. ``search`` matches titles and file names,
+        ``fmt`` the file extension. Unknown sort keys raise ValueError.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort '{sort}'. Choose one of: {', '.join(SORT_FIELDS)}")
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+        offset = max(int(offset), 0)
+
+        where, params = [], []
+        if search:
+            where.append('(title LIKE ? OR name LIKE ?)')
+            params += [f'%{search}%'] * 2
+        if fmt:
+            where.append('format = ?')
+            params.append(fmt.lower())
+        clause = f"WHERE {' AND '.join(where)}" if where else ''
+
+        if not self.enabled:
+            return {'items': [], 'total': 0}
+        with self._lock:
+            total = self._conn.execute(f'SELECT COUNT(*) AS n FROM library {clause}', params).fetchone()['n']
+            rows = self._conn.execute(
+                f'SELECT * FROM library {clause} ORDER BY {SORT_FIELDS[sort]} {direction}, name LIMIT ? OFFSET ?',
+                params + [limit, offset]
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item['subtitles'] = json.loads(item['subtitles'] or '[]')
+            items.append(item)
+        return {'items': items, 'total': total}
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            row = self._conn.execute('SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size FROM library').fetchone()
+        return {'enabled': True, 'entries': row['n'], 'bytes': row['size'],
+                'scanning': self.scanning, 'last_scan': self.last_scan}
+
+    def start_scan(self, workers=4):
+        """Rescan the folder in a background thread."""
+        if not self.enabled or self.scanning:
+            return
+        self._scanning.set()
+        thread = Thread(target=self._scan_thread, args=(workers,), name='library-scan')
+        thread.daemon = True
+        thread.start()
+
+    def scan(self, workers=4):
+        """
+        Reconcile the catalogue with the folder: add new and changed media
+        files, drop rows of files that are gone. Returns the counts.
+        """
+        started = time.time()
+        media, sidecars = {}, {}
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if entry.name.startswith('.') or entry.name.endswith(PARTIAL_SUFFIXES) or not entry.is_file():
+                continue
+            kind = artifact_kind(entry.name)
+            if kind == 'media':
+                media[entry.name] = entry.stat()
+            else:
+                sidecars.setdefault(_sidecar_stem(entry.name, kind), []).append(entry.name)
+
+        with self._lock:
+            known = {row['name']: row for row in self._conn.execute('SELECT name, size, mtime FROM library')}
+
+        changed = []
+        unchanged = []
+        for name, stat in media.items():
+            row = self._row(name, stat, sidecars.get(os.path.splitext(name)[0], []))
+            old = known.get(name)
+            if old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+                unchanged.append(row)
+            else:
+                changed.append(row)
+
+        # Hashing releases the GIL, so several files are read at once
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='library-scan') as pool:
+            changed = list(pool.map(self._describe, changed))
+
+        removed = [name for name in known if name not in media]
+        with self._lock, self._conn:
+            if removed:
+                self._conn.executemany('DELETE FROM library WHERE name = ?', [(name,) for name in removed])
+            # Sidecars may have appeared or gone next to unchanged files
+            self._conn.executemany(
+                'UPDATE library SET thumbnail = ?, info_json = ?, subtitles = ? WHERE name = ?',
+                [(row['thumbnail'], row['info_json'], row['subtitles'], row['name']) for row in unchanged]
+            )
+        self._write(changed)
+
+        counts = {'files': len(media), 'added': len(changed), 'removed': len(removed),
+                  'seconds': round(time.time() - started, 3)}
+        return counts
+
+    def _scan_thread(self, workers):
+        try:
+            self.last_scan = dict(self.scan(workers), finished_at=time.time())
+            log.info('Library scan: %d files, %d new or changed, %d removed in %.1fs',
+                     self.last_scan['files'], self.last_scan['added'], self.last_scan['removed'],
+                     self.last_scan['seconds'])
+        except Exception:
+            log.exception('Library scan failed')
+        finally:
+            self._scanning.clear()
+
+    def _describe(self, row):
+        """Fill in what only the file's contents tell: checksum, and the video details from its info JSON."""
+        path = os.path.join(self.root, row['name'])
+        try:
+            row['checksum'] = file_digest(path)
+        except OSError:
+            pass
+        if row['info_json']:
+            try:
+                with open(os.path.join(self.root, row['info_json']), encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                info = {}
+            if info.get('id'):
+                row['video_id'] = f"{info.get('extractor_key') or info.get('extractor') or 'generic'}:{info['id']}"
+            row.update(title=info.get('title'), duration=info.get('duration'), quality=_quality(info))
+        if not row['title']:
+            row['title'] = os.path.splitext(row['name'])[0]
+        return row
+
+    @staticmethod
+    def _row(name, stat, sidecars):
+        kinds = {}
+        for sidecar in sidecars:
+            kinds.setdefault(artifact_kind(sidecar), []).append(sidecar)
+        return {
+            'name': name,
+            'video_id': None,
+            'title': None,
+            'format': os.path.splitext(name)[1].lstrip('.').lower(),
+            'quality': None,
+            'size': stat.st_size,
+            'duration': None,
+            'checksum': None,
+            'thumbnail': (kinds.get('thumbnail') or [None])[0],
+            'info_json': (kinds.get('info') or [None])[0],
+            'subtitles': json.dumps(sorted(kinds.get('subtitles', []))),
+            'mtime': stat.st_mtime,
+            # yt-dlp sets mtime to the upload date; ctime is when the file was moved into the folder
+            'added_at': stat.st_ctime,
+        }
+
+    def _write(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO library ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(row[column] for column in columns) for row in rows]
+            )
+
+library = Library()
+
+def init_app(app):
+    """Open the catalogue and rescan the downloads folder in the background."""
+    # Imported late: the api package imports this module
+    from app.api.executors import in_reloader_parent
+
+    if in_reloader_parent(app):
+        return
+    library.configure(app.config['UPLOAD_FOLDER'], database_path(app))
+    library.start_scan(app.config.get('LIBRARY_SCAN_WORKERS', 4))
@@ -0,0 +1,270 @@
+"""
+Audio Stream Module
+Converts an audio download while it arrives: the HTTP response is piped into
+ffmpeg, which writes the target codec, so the source file never lands on disk
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, RequestError
+
+# Protocols whose response is the file itself, read front to back
+STREAMABLE_PROTOCOLS = ('http', 'https')
+
+# Containers that are only readable from a pipe when their index (moov) precedes the media data
+MP4_EXTENSIONS = ('mp4', 'm4a', 'm4v', 'mov')
+
+# How much of an MP4 is read to find its index before giving up on streaming
+MP4_HEAD_LIMIT = 1024 * 1024
+
+CHUNK_SIZE = 256 * 1024
+
+# Encoder, muxer and file extension per target container, as FFmpegExtractAudio picks them
+ENCODERS = {'mp3': 'libmp3lame', 'aac': 'aac', 'wav': 'pcm_s16le'}
+MUXERS = {'mp3': 'mp3', 'aac': 'adts', 'wav': 'wav'}
+EXTENSIONS = {'mp3': 'mp3', 'aac': 'm4a', 'wav': 'wav'}
+
+class NotStreamable(Exception):
+    """The source cannot be converted from a pipe; it has to be downloaded to disk first."""
+
+class _ChunkedResponse:
+    """
+    A file read as consecutive Range requests of ``chunk_size`` bytes, as
+    yt-dlp's HTTP downloader reads formats with an http_chunk_size: some
+    sites (YouTube) throttle a response that runs past it. A server that
+    ignores the Range header sends the whole file in the first response.
+    """
+
+    def __init__(self, ydl, url: str, headers: Dict[str, str], chunk_size: int):
+        self.ydl = ydl
+        self.url = url
+        self.headers = headers
+        self.chunk_size = int(chunk_size)
+        self.size = None
+        self._position = 0
+        self._end = None
+        self._response = None
+        self._open()
+
+    def read(self, size: int) -> bytes:
+        while True:
+            data = self._response.read(size)
+            if data:
+                self._position += len(data)
+                return data
+            if self._end is None or self._position <= self._end:
+                # This response is done: the whole file (the range was ignored) or a chunk cut short
+                if self.size and self._position < self.size:
+                    # ffmpeg would finish the truncated file as if it were complete
+                    raise NotStreamable('connection lost: short range response')
+                # ...or the last chunk of a file whose size the server did not give
+                return b''
+            if self.size and self._position >= self.size:
+                return b''
+            self._response.close()
+            try:
+                self._open()
+            except HTTPError as e:
+                if e.status != 416:
+                    raise
+                # A file of unknown size that ended on a chunk boundary
+                return b''
+
+    def close(self):
+        self._response.close()
+
+    def _open(self):
+        end = self._position + self.chunk_size - 1
+        if self.size:
+            end = min(end, self.size - 1)
+        response = self.ydl.urlopen(Request(self.url, headers=dict(self.headers, Range=f'bytes={self._position}-{end}')))
+        if response.status == 206:
+            self._end = end
+            match = re.search(r'/(\d+)\s*$', response.headers.get('Content-Range') or '')
+            if match:
+                self.size = int(match.group(1))
+                self._end = min(end, self.size - 1)
+        elif self._position == 0:
+            self._end = None
+            self.size = int(response.headers.get('Content-Length') or 0) or None
+        else:
+            response.close()
+            raise NotStreamable(f'server answered a range request with status {response.status}')
+        self._response = response
+
+def find_ffmpeg(bundled_dir: Optional[str] = None, tool: str = 'ffmpeg') -> Optional[str]:
+    """``tool`` (ffmpeg or ffprobe) from the bundled directory, else from PATH."""
+    for name in (f'{tool}.exe', tool):
+        if bundled_dir and os.path.isfile(os.path.join(bundled_dir, name)):
+            return os.path.join(bundled_dir, name)
+    return shutil.which(tool)
+
+def unstreamable_reason(fmt: Dict[str, Any]) -> Optional[str]:
+    """Why ``fmt`` cannot be piped into ffmpeg, or None if it can."""
+    protocol = fmt.get('protocol') or 'https'
+    if protocol not in STREAMABLE_PROTOCOLS or fmt.get('fragments'):
+        # Fragments are downloaded (and resumed) piece by piece by yt-dlp
+        return f'fragmented source ({protocol})'
+    if not fmt.get('url'):
+        return 'no direct URL'
+    return None
+
+def ffmpeg_command(ffmpeg: str, container: str, output_path: str, bitrate: Optional[str] = None,
+                   copy: bool = False) -> list:
+    """ffmpeg arguments that read stdin and write ``container`` to ``output_path``."""
+    args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-vn', '-map', '0:a:0']
+    if copy:
+        args += ['-c:a', 'copy']
+    else:
+        args += ['-c:a', ENCODERS[container]]
+        if bitrate and container != 'wav':
+            args += ['-b:a', f'{bitrate}k']
+    return args + ['-f', MUXERS[container], '-y', output_path]
+
+def stream_audio(ydl, fmt: Dict[str, Any], output_path: str, container: str, ffmpeg: str,
+                 bitrate: Optional[str] = None, copy: bool = False,
+                 progress_hooks: Iterable[Callable] = ()) -> int:
+    """
+    Download ``fmt`` through ``ydl`` (its proxy, cookies and headers) and
+    convert it on the fly into ``output_path``. Progress is reported to
+    ``progress_hooks`` as yt-dlp reports a download, so an exception raised
+    by a hook (cancellation) stops ffmpeg and is passed on.
+
+    Raises NotStreamable, with nothing left at ``output_path``, when the
+    source turns out not to be readable front to back, ffmpeg rejects it or
+    the connection breaks: a pipe cannot be resumed, so the caller downloads
+    the file the usual way instead. Returns the number of bytes read.
+
+    A format with an http_chunk_size (in its downloader_options or the
+    YoutubeDL's params) is read in Range requests of that size, as yt-dlp
+    downloads it.
+    """
+    hooks = list(progress_hooks)
+    total = fmt.get('filesize') or fmt.get('filesize_approx')
+    headers = fmt.get('http_headers') or {}
+    chunk_size = (fmt.get('downloader_options') or {}).get('http_chunk_size') or ydl.params.get('http_chunk_size')
+    try:
+        if chunk_size:
+            response = _ChunkedResponse(ydl, fmt['url'], headers, chunk_size)
+            size = response.size
+        else:
+            response = ydl.urlopen(Request(fmt['url'], headers=headers))
+            size = int(response.headers.get('Content-Length') or 0) or None
+    except RequestError as e:
+        # yt-dlp's own download retries
+        raise NotStreamable(f'request failed: {e}')
+    process = None
+    downloaded = 0
+    started = time.time()
+    try:
+        total = total or size
+        head = b''
+        if (fmt.get('ext') or '').lower() in MP4_EXTENSIONS:
+            head = _read_mp4_head(response)
+
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(
+                ffmpeg_command(ffmpeg, container, output_path, bitrate, copy),
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors,
+            )
+            chunk = head
+            while True:
+                if not chunk:
+                    try:
+                        chunk = response.read(CHUNK_SIZE)
+                    except (OSError, RequestError) as e:
+                        raise NotStreamable(f'connection lost: {e}')
+                    if not chunk:
+                        break
+                try:
+                    process.stdin.write(chunk)
+                except BrokenPipeError:
+                    # ffmpeg gave up on the input; its message says why
+                    break
+                downloaded += len(chunk)
+                chunk = b''
+                elapsed = time.time() - started
+                _call(hooks, {
+                    'status': 'downloading',
+                    'filename': output_path,
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'elapsed': elapsed,
+                    'speed': downloaded / elapsed if elapsed > 0 else None,
+                    'info_dict': fmt,
+                })
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            code = process.wait()
+            if code != 0:
+                errors.seek(0)
+                message = errors.read().decode('utf-8', 'replace').strip().splitlines()
+                raise NotStreamable(f"ffmpeg exited with code {code}: {message[-1] if message else 'no output'}")
+    except BaseException:
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    finally:
+        response.close()
+
+    _call(hooks, {
+        'status': 'finished',
+        'filename': output_path,
+        'downloaded_bytes': downloaded,
+        'total_bytes': downloaded,
+        'elapsed': time.time() - started,
+        'info_dict': fmt,
+    })
+    return downloaded
+
+def _call(hooks, d):
+    for hook in hooks:
+        hook(d)
+
+def _read_mp4_head(response) -> bytes:
+    """The start of an MP4, read until its top-level boxes show the index comes first."""
+    head = b''
+    while len(head) < MP4_HEAD_LIMIT:
+        try:
+            chunk = response.read(CHUNK_SIZE)
+        except (OSError, RequestError) as e:
+            raise NotStreamable(f'connection lost: {e}')
+        if not chunk:
+            break
+        head += chunk
+        verdict = _index_first(head)
+        if verdict is not None:
+            if not verdict:
+                raise NotStreamable('MP4 with its index at the end')
+            return head
+    raise NotStreamable('MP4 index not found at the start')
+
+def _index_first(head: bytes) -> Optional[bool]:
+    """Whether the moov (or a fragment's moof) box precedes mdat; None if ``head`` does not tell yet."""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], 'big')
+        box = head[offset + 4:offset + 8]
+        if box in (b'moov', b'moof'):
+            return True
+        if box == b'mdat':
+            return False
+        if size == 1:
+            if offset + 16 > len(head):
+                return None
+            size = int.from_bytes(head[offset + 8:offset + 16], 'big')
+        if size < 8:
+            # Box running to the end of the file, or not an MP4 after all
+            return False
+        offset += size
+    return None
@@ -0,0 +1,426 @@
+"""
+Clipping Module
+Cuts a time range out of a video while fetching as little of it as possible:
+only the fragments that cover the range for DASH and HLS, a keyframe-aligned
+byte-range read for single files. The cut is a stream copy from the nearest
+keyframe; with frame accuracy only the partial GOPs at either edge are re-encoded
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from yt_dlp.downloader.hls import HlsFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import RequestError
+
+# Protocols yt-dlp downloads piece by piece
+FRAGMENTED_PROTOCOLS = ('http_dash_segments', 'm3u8', 'm3u8_native')
+
+# Plan strategies whose streams go into the target container as they are
+COPY_STRATEGIES = ('direct', 'merge', 'remux')
+
+# Seconds searched before a cut point for a keyframe, widened once if there is none
+KEYFRAME_WINDOWS = (10, 60)
+
+# Ranges of a single file closer than this are read in one request; a new one costs a seek
+MERGE_GAP = 10
+
+# Encoders for the re-encoded edges of a frame-accurate cut. Only codecs whose
+# parameter sets MPEG-TS repeats in-band, so the edges and the copied middle can
+# be joined although their encoder settings differ
+EDGE_ENCODERS = {'h264': ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18'],
+                 'hevc': ['-c:v', 'libx265', '-preset', 'veryfast', '-crf', '20']}
+
+# Tags of an HLS media playlist that belong to the segment after them
+SEGMENT_TAGS = ('#EXTINF', '#EXT-X-BYTERANGE', '#EXT-X-DISCONTINUITY', '#EXT-X-PROGRAM-DATE-TIME')
+
+# Timestamps closer than this are the same frame
+EPSILON = 0.001
+
+class ClipError(Exception):
+    """The range cannot be fetched or cut this way."""
+
+def parse_timestamp(value) -> Optional[float]:
+    """
+    Seconds from 'HH:MM:SS', 'MM:SS' or 'SS' (fractions allowed); None if
+    empty. Raises ValueError for anything else, negative times included.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        parts = [float(value)] if isinstance(value, (int, float)) else \
+            [float(part) for part in str(value).strip().split(':')]
+    except ValueError:
+        raise ValueError(f'Invalid timestamp: {value!r}')
+    if any(part < 0 for part in parts):
+        raise ValueError(f'Invalid timestamp: {value!r} is negative')
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return int(seconds) if seconds.is_integer() else seconds
+
+def parse_ranges(time_range) -> List[Dict[str, Any]]:
+    """
+    The requested clips as [{'start', 'end', 'accurate'}] in seconds. A
+    request may give one range or a list of them; empty ranges are skipped.
+    Raises ValueError for a range that does not end after it starts.
+    """
+    ranges = time_range if isinstance(time_range, list) else [time_range]
+    clips = []
+    for item in ranges:
+        if not item or not (item.get('start') or item.get('end')):
+            continue
+        start = parse_timestamp(item.get('start')) or 0
+        end = parse_timestamp(item.get('end'))
+        if end is not None and end <= start:
+            raise ValueError(f"Invalid time range: {item.get('end')!r} is not after {item.get('start') or 0!r}")
+        clips.append({'start': start, 'end': end, 'accurate': bool(item.get('accurate'))})
+    return clips
+
+def envelope(ranges: List[Tuple[float, Optional[float]]]) -> Tuple[float, Optional[float]]:
+    """The single range spanning all of ``ranges`` (end None: to the end of the video)."""
+    ends = [end for _, end in ranges]
+    return min(start for start, _ in ranges), None if None in ends else max(ends)
+
+def windows(ranges: List[Tuple[float, Optional[float]]], gap: float = MERGE_GAP) -> List[List[Optional[float]]]:
+    """``ranges`` merged where they overlap or lie less than ``gap`` seconds apart, in order."""
+    merged = []
+    for start, end in sorted(ranges, key=lambda r: r[0]):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1] + gap):
+            merged[-1][1] = None if end is None or merged[-1][1] is None else max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def plan_clip(ydl, info: Dict[str, Any], format_ids: List[str],
+              ranges: List[Tuple[float, Optional[float]]]) -> Dict[str, Any]:
+    """
+    How to fetch the time ``ranges`` [(start, end)] of ``info``'s formats
+    ``format_ids``, all in one download.
+
+    'fragments': the formats are fragmented, and their fragment lists (DASH)
+    or media playlists (HLS) in ``info`` are narrowed in place to the pieces
+    that cover a range, for yt-dlp to download. 'offsets' has the source
+    time each narrowed format starts at; fragments keep their timestamps,
+    so the source time of a point in the download is its time plus the offset.
+    'ranges': single files, to be read with fetch_ranges().
+
+    Raises ClipError if the formats allow neither.
+    """
+    by_id = {f.get('format_id'): f for f in info.get('formats') or []}
+    formats = [by_id[format_id] for format_id in format_ids if format_id in by_id]
+    if not formats or len(formats) != len(format_ids):
+        raise ClipError('planned formats not listed')
+    source_bytes = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats) or None
+
+    fragmented = [f for f in formats if f.get('fragments') or f.get('protocol') in FRAGMENTED_PROTOCOLS]
+    if not fragmented:
+        if any(not f.get('url') for f in formats):
+            raise ClipError('no direct URL')
+        return {'method': 'ranges', 'formats': formats, 'offsets': {}, 'source_bytes': source_bytes}
+    if len(fragmented) != len(formats):
+        raise ClipError('fragmented and single-file formats mixed')
+
+    offsets = {}
+    for fmt in formats:
+        if fmt.get('fragments'):
+            offsets[fmt['format_id']] = _narrow_fragments(fmt, ranges)
+        else:
+            offsets[fmt['format_id']] = _narrow_playlist(ydl, fmt, ranges)
+        # The size of the whole stream no longer applies
+        fmt.pop('filesize', None)
+        fmt.pop('filesize_approx', None)
+    return {'method': 'fragments', 'formats': formats, 'offsets': offsets, 'source_bytes': source_bytes}
+
+def fetch_ranges(ffmpeg: str, ffprobe: str, formats: List[Dict[str, Any]], start: float, end: Optional[float],
+                 output_path: str) -> float:
+    """
+    Read [start, end] of single-file formats over HTTP into ``output_path``
+    by stream copy. ffmpeg seeks with byte-range requests, reading the
+    file's index and then only the bytes of the range. The read starts
+    exactly at the last keyframe at or before ``start``, so the copy loses
+    nothing; returns that keyframe's time, the source time of the output's 0.
+    """
+    video = next((f for f in formats if f.get('vcodec') != 'none'), None)
+    keyframe = start
+    if video is not None:
+        keyframe = _keyframe_before(ffprobe, _input_args(video), start)
+        if keyframe is None:
+            raise ClipError(f'no keyframe found before {start}s')
+
+    args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y']
+    for fmt in formats:
+        args += ['-ss', _seconds(keyframe)] + _input_args(fmt)
+    if end is not None:
+        args += ['-t', _seconds(end - keyframe)]
+    for index, fmt in enumerate(formats):
+        if fmt.get('vcodec') != 'none':
+            args += ['-map', f'{index}:v:0?']
+        if fmt.get('acodec') != 'none':
+            args += ['-map', f'{index}:a:0?']
+    _run(args + ['-c', 'copy', output_path])
+    return keyframe
+
+def cut(ffmpeg: str, ffprobe: str, source: str, output_path: str, start: float, end: Optional[float],
+        offsets: Dict[str, float], accurate: bool = False) -> Dict[str, Any]:
+    """
+    Cut [start, end] (source times) out of the local file ``source``, whose
+    video starts at source time offsets['video'] and audio at offsets['audio'].
+
+    The video is copied from the last keyframe at or before ``start``. With
+    ``accurate``, it starts at ``start`` itself: the partial GOPs before the
+    first keyframe in the range and after the last one are re-encoded, and
+    everything between them is copied. Returns what was done.
+    """
+    streams, base = _streams(ffprobe, source)
+    video_offset = offsets.get('video', 0.0)
+    audio_offset = offsets.get('audio', video_offset)
+    result = {'start': start, 'end': end, 'accurate': False, 'reencoded_seconds': 0.0}
+
+    if 'video' not in streams:
+        # Every audio frame is a sync point: a copy cuts within a frame of the range
+        _run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-ss', _seconds(start - audio_offset), '-i', source]
+             + _duration(start, end) + ['-map', '0:a', '-c', 'copy', output_path])
+        result['accurate'] = True
+        return result
+
+    keyframe = _keyframe_before(ffprobe, ['-i', source], start - video_offset, base)
+    keyframe = start if keyframe is None else keyframe + video_offset
+    encoder = EDGE_ENCODERS.get(streams['video'])
+    if accurate and encoder is None:
+        result['note'] = f"frame-accurate cuts need {' or '.join(EDGE_ENCODERS)} video; cut at the keyframe"
+    if not accurate or encoder is None or keyframe >= start - EPSILON:
+        # Copy from the keyframe (exact when the range starts on one)
+        _run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y']
+             + _inputs(source, keyframe, video_offset, audio_offset, 'audio' in streams)
+             + _duration(keyframe, end) + _maps('audio' in streams) + ['-c', 'copy', output_path])
+        result.update(start=keyframe, accurate=keyframe >= start - EPSILON)
+        return result
+
+    workdir = tempfile.mkdtemp(prefix='clip-', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        first, last = _keyframes_inside(ffprobe, source, video_offset - base, start, end)
+        pieces = []
+        if first is None:
+            # No keyframe inside the range: all of it is one partial GOP
+            pieces.append(_encode_piece(ffmpeg, source, workdir, 'head', start, end, video_offset, encoder))
+            result['reencoded_seconds'] = (end - start) if end is not None else None
+        else:
+            pieces.append(_encode_piece(ffmpeg, source, workdir, 'head', start, first, video_offset, encoder))
+            tail = last is not None and last > first + EPSILON
+            middle_end = last if tail else end
+            middle = os.path.join(workdir, 'middle.ts')
+            _run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-ss', _seconds(first - video_offset),
+                  '-i', source] + _duration(first, middle_end) + ['-map', '0:v:0', '-c:v', 'copy', '-f', 'mpegts', middle])
+            pieces.append(middle)
+            reencoded = first - start
+            if tail:
+                pieces.append(_encode_piece(ffmpeg, source, workdir, 'tail', last, end, video_offset, encoder))
+                reencoded += end - last
+            result['reencoded_seconds'] = round(reencoded, 3)
+
+        listing = os.path.join(workdir, 'pieces.txt')
+        with open(listing, 'w', encoding='utf-8') as f:
+            f.writelines(f"file '{piece}'\n" for piece in pieces if piece)
+        args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', listing]
+        maps = ['-map', '0:v:0']
+        if 'audio' in streams:
+            args += ['-ss', _seconds(start - audio_offset), '-i', source]
+            maps += ['-map', '1:a:0']
+        _run(args + _duration(start, end) + maps + ['-c', 'copy', output_path])
+        result['accurate'] = True
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _overlaps(position, duration, ranges):
+    return any(position + duration > start and (end is None or position < end) for start, end in ranges)
+
+def _narrow_fragments(fmt, ranges):
+    """Keep the initialisation fragment and the media fragments overlapping a range; returns the first one's start."""
+    fragments = fmt['fragments']
+    init = []
+    if fragments and fragments[0].get('duration') is None:
+        init, fragments = fragments[:1], fragments[1:]
+    if any(fragment.get('duration') is None for fragment in fragments):
+        raise ClipError('fragment durations unknown')
+    kept, offset, position = [], None, 0.0
+    for fragment in fragments:
+        if _overlaps(position, fragment['duration'], ranges):
+            if offset is None:
+                offset = position
+            kept.append(fragment)
+        position += fragment['duration']
+    if not kept:
+        raise ClipError('range outside the stream')
+    fmt['fragments'] = init + kept
+    return offset
+
+def _narrow_playlist(ydl, fmt, ranges):
+    """
+    Fetch an HLS media playlist and keep the segments overlapping a range,
+    for yt-dlp's native HLS downloader; returns the first one's start.
+    """
+    try:
+        response = ydl.urlopen(Request(fmt['url'], headers=fmt.get('http_headers') or {}))
+        playlist = response.read().decode('utf-8', 'replace')
+    except RequestError as e:
+        raise ClipError(f'media playlist unavailable: {e}')
+    if '#EXT-X-STREAM-INF' in playlist:
+        raise ClipError('master playlist, not a media playlist')
+    if not HlsFD.can_download(playlist, fmt):
+        # Handed to ffmpeg, which reads the playlist from the URL and so would fetch all of it
+        raise ClipError('playlist not supported by the native HLS downloader')
+    if re.search(r'(?m)^#EXT-X-KEY:METHOD=AES-128(?!.*IV=)', playlist):
+        # The IVs are the segment numbers, counted through the playlist: no gaps
+        ranges = [envelope(ranges)]
+
+    lines, pending, kept = [], [], 0
+    dropped_before = 0
+    sequence_line = None
+    offset, position, duration = None, 0.0, None
+    for line in playlist.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-BYTERANGE') and '@' not in line:
+            # Offsets implied by the previous segment break when segments are dropped
+            raise ClipError('byte-range segments without explicit offsets')
+        if line.startswith('#EXTINF'):
+            duration = float(line.split(':', 1)[1].split(',')[0])
+            pending.append(line)
+        elif line.startswith(SEGMENT_TAGS):
+            pending.append(line)
+        elif line.startswith('#'):
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE'):
+                sequence_line = len(lines)
+            lines.append(line)
+        else:
+            if duration is None:
+                raise ClipError('segment without a duration')
+            if _overlaps(position, duration, ranges):
+                if offset is None:
+                    offset = position
+                lines.extend(pending + [line])
+                kept += 1
+            elif offset is None:
+                dropped_before += 1
+            position += duration
+            pending, duration = [], None
+    if not kept:
+        raise ClipError('range outside the stream')
+    if sequence_line is not None:
+        # Segment numbers (and the IVs derived from them) stay those of the full playlist
+        sequence = int(lines[sequence_line].split(':', 1)[1])
+        lines[sequence_line] = f'#EXT-X-MEDIA-SEQUENCE:{sequence + dropped_before}'
+    elif dropped_before:
+        lines.insert(1, f'#EXT-X-MEDIA-SEQUENCE:{dropped_before}')
+    fmt['hls_media_playlist_data'] = '\n'.join(lines) + '\n'
+    # Only yt-dlp's own HLS downloader takes a playlist from the info dict
+    fmt['protocol'] = 'm3u8_native'
+    return offset
+
+def _input_args(fmt):
+    headers = fmt.get('http_headers') or {}
+    args = ['-headers', ''.join(f'{name}: {value}\r\n' for name, value in headers.items())] if headers else []
+    return args + ['-i', fmt['url']]
+
+def _inputs(source, at, video_offset, audio_offset, audio):
+    args = ['-ss', _seconds(at - video_offset), '-i', source]
+    if audio:
+        args += ['-ss', _seconds(at - audio_offset), '-i', source]
+    return args
+
+def _maps(audio):
+    return ['-map', '0:v:0'] + (['-map', '1:a:0'] if audio else [])
+
+def _duration(start, end):
+    return ['-t', _seconds(end - start)] if end is not None else []
+
+def _seconds(value):
+    return f'{max(value, 0):.3f}'
+
+def _encode_piece(ffmpeg, source, workdir, name, start, end, offset, encoder):
+    """Re-encode [start, end) of the video alone; seeking with decoding makes it frame-accurate."""
+    if end is not None and end - start <= EPSILON:
+        return None
+    path = os.path.join(workdir, f'{name}.ts')
+    _run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-ss', _seconds(start - offset), '-i', source]
+         + _duration(start, end) + ['-map', '0:v:0'] + encoder + ['-f', 'mpegts', path])
+    return path
+
+def _keyframe_before(ffprobe, input_args, at, base=0.0):
+    """
+    Time of the last keyframe at or before ``at``, or None. Times count from
+    the input's start: ``base`` is its first timestamp, which a file joined
+    from fragments keeps from the full stream.
+    """
+    for window in KEYFRAME_WINDOWS:
+        frames = [t - base for t in _keyframes(ffprobe, input_args, [(base + at - window, base + at + EPSILON)])]
+        before = [t for t in frames if t <= at + EPSILON]
+        if before:
+            return before[-1]
+        if at - window <= 0:
+            break
+    return None
+
+def _keyframes_inside(ffprobe, source, offset, start, end):
+    """
+    Source times of the first keyframe after ``start`` and the last one
+    before ``end`` (None if none); ``offset`` is the source time minus the
+    file's timestamp.
+    """
+    local_start, local_end = start - offset, None if end is None else end - offset
+    window = KEYFRAME_WINDOWS[-1]
+    head = [t for t in _keyframes(ffprobe, ['-i', source], [(local_start, local_start + window)]) if t > local_start + EPSILON]
+    if local_end is not None:
+        head = [t for t in head if t < local_end - EPSILON]
+    if not head:
+        return None, None
+    if local_end is None:
+        return head[0] + offset, None
+    tail = [t for t in _keyframes(ffprobe, ['-i', source], [(local_end - window, local_end)]) if t < local_end - EPSILON]
+    return head[0] + offset, (tail[-1] if tail else head[-1]) + offset
+
+def _keyframes(ffprobe, input_args, intervals: List[Tuple[float, float]]) -> List[float]:
+    """Keyframe times of the first video stream within ``intervals``, from the packet flags (no decoding)."""
+    args = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0', '-read_intervals', ','.join(f'{max(a, 0):.3f}%{b:.3f}' for a, b in intervals)]
+    output = _run(args + input_args)
+    frames = []
+    for line in output.splitlines():
+        pts, _, flags = line.partition(',')
+        if 'K' in flags:
+            try:
+                frames.append(float(pts))
+            except ValueError:
+                continue
+    return sorted(frames)
+
+def _streams(ffprobe, path) -> Tuple[Dict[str, str], float]:
+    """codec_type -> codec_name of the first stream of each type, and the file's first timestamp."""
+    output = _run([ffprobe, '-v', 'error', '-show_entries', 'stream=codec_name,codec_type:format=start_time',
+                   '-of', 'csv=p=0', path])
+    streams, base = {}, 0.0
+    for line in output.splitlines():
+        fields = line.split(',')
+        if len(fields) == 1:
+            try:
+                base = float(fields[0])
+            except ValueError:
+                pass
+        elif fields[1] not in streams:
+            streams[fields[1]] = fields[0]
+    return streams, base
+
+def _run(args) -> str:
+    try:
+        completed = subprocess.run(args, capture_output=True, text=True, errors='replace')
+    except OSError as e:
+        raise ClipError(f'{os.path.basename(args[0])} could not run: {e}')
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        raise ClipError(f"{os.path.basename(args[0])} failed: {lines[-1] if lines else completed.returncode}")
+    return completed.stdout
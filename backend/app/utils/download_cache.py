@@ -0,0 +1,302 @@
+"""
+Download Cache Module
+Keeps finished downloads in a content-addressed store so identical requests
+are served from disk instead of being fetched again
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_cache_entries (
+    key TEXT PRIMARY KEY,
+    download TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_download_cache_entries_last_access ON download_cache_entries(last_access);
+CREATE TABLE IF NOT EXISTS download_cache_files (
+    key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (key, name)
+);
+CREATE INDEX IF NOT EXISTS idx_download_cache_files_digest ON download_cache_files(digest);
+CREATE TABLE IF NOT EXISTS download_cache_objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS download_cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+COUNTER_NAMES = ('hits', 'misses', 'stores', 'evictions', 'bytes_served')
+
+# ydl_opts that decide which bytes end up on disk; everything else (hooks,
+# network tuning, verbosity) does not change the result
+KEY_OPTIONS = (
+    'format', 'merge_output_format', 'postprocessors', 'writesubtitles',
+    'subtitleslangs', 'subtitlesformat', 'writeautomaticsub', 'writethumbnail',
+    'writeinfojson',
+)
+
+def cache_key(info: Dict[str, Any], ydl_opts: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> str:
+    """Key for one video fetched with these options: extractor, video id, format selector and post-processing."""
+    material = {
+        'extractor': info.get('extractor_key') or info.get('extractor'),
+        'id': info.get('id'),
+        'options': {name: ydl_opts.get(name) for name in KEY_OPTIONS},
+        'extra': extra or {},
+    }
+    encoded = json.dumps(material, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(source: str, destination: str) -> bool:
+    """Hardlink ``source`` to ``destination`` (copy across filesystems). Returns True if linked."""
+    temp = f'{destination}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.link(source, temp)
+        linked = True
+    except OSError:
+        shutil.copyfile(source, temp)
+        linked = False
+    # Atomic: readers never see a half-written file
+    os.replace(temp, destination)
+    return linked
+
+class DownloadCache:
+    """
+    Content-addressed store of finished downloads.
+
+    Every artifact of a download (media file, thumbnail, subtitles, info
+    JSON) is stored once under objects/<sha256>; an entry maps a cache key
+    to the artifact names and digests plus the download's result. Hits are
+    materialised in the output directory as hardlinks, so they cost no
+    extra space. The index and the counters live in SQLite so that worker
+    processes share them. Entries are evicted least recently used first
+    once the objects exceed ``max_bytes``.
+    """
+
+    def __init__(self, root: Optional[str] = None, db_path: Optional[str] = None, max_bytes: int = 10 * 1024 ** 3):
+        self.root = None
+        self.db_path = None
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = Lock()
+        if root and db_path:
+            self.configure(root, db_path, max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def configure(self, root: str, db_path: str, max_bytes: int):
+        from app.database.db import connect
+
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        conn = connect(db_path, check_same_thread=False)
+        conn.executescript(SCHEMA)
+        with self._lock:
+            self.root = root
+            self.db_path = db_path
+            self.max_bytes = max_bytes
+            self._conn = conn
+
+    def settings(self) -> Optional[Dict[str, Any]]:
+        """What a worker process needs to open the same cache; None if disabled."""
+        if not self.enabled:
+            return None
+        return {'root': self.root, 'db_path': self.db_path, 'max_bytes': self.max_bytes}
+
+    def lookup(self, key: str, output_dir: str) -> Optional[Dict[str, Any]]:
+        """
+        Materialise a cached download in ``output_dir``.
+        Returns the stored download result, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT download FROM download_cache_entries WHERE key = ?', (key,)
+            ).fetchone()
+            files = self._conn.execute(
+                'SELECT f.name, f.digest, o.size FROM download_cache_files f '
+                'JOIN download_cache_objects o ON o.digest = f.digest WHERE f.key = ?', (key,)
+            ).fetchall()
+
+        if row is None or any(not os.path.exists(self._object_path(f['digest'])) for f in files):
+            if row is not None:
+                # An object went missing behind our back; forget the entry
+                self._delete_entries([key])
+            self._count(misses=1)
+            return None
+
+        served = 0
+        for f in files:
+            destination = os.path.join(output_dir, f['name'])
+            if not self._same_file(self._object_path(f['digest']), destination):
+                link_or_copy(self._object_path(f['digest']), destination)
+            served += f['size']
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE download_cache_entries SET last_access = ? WHERE key = ?', (time.time(), key)
+            )
+        self._count(hits=1, bytes_served=served)
+        return dict(json.loads(row['download']), cached=True)
+
+    def store(self, key: str, paths: List[str], download: Dict[str, Any], digests: Optional[Dict[str, str]] = None):
+        """
+        Add a finished download's artifacts under ``key`` and evict to stay within max_bytes.
+        ``digests`` maps paths to SHA-256 digests already computed, which are not hashed again.
+        """
+        if not self.enabled:
+            return
+
+        digests = digests or {}
+        files = []
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+            digest = digests.get(path) or file_digest(path)
+            obj = self._object_path(digest)
+            if not os.path.exists(obj):
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                link_or_copy(path, obj)
+            files.append((os.path.basename(path), digest, os.path.getsize(obj)))
+
+        if not files:
+            return
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO download_cache_entries (key, download, created_at, last_access) '
+                'VALUES (?, ?, ?, ?)',
+                (key, json.dumps(download, default=str), now, now)
+            )
+            self._conn.execute('DELETE FROM download_cache_files WHERE key = ?', (key,))
+            self._conn.executemany(
+                'INSERT INTO download_cache_files (key, name, digest) VALUES (?, ?, ?)',
+                [(key, name, digest) for name, digest, _ in files]
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO download_cache_objects (digest, size) VALUES (?, ?)',
+                [(digest, size) for _, digest, size in files]
+            )
+        self._count(stores=1)
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the objects fit in max_bytes. Returns entries evicted."""
+        if not self.enabled:
+            return 0
+
+        evicted = 0
+        while True:
+            with self._lock:
+                total = self._conn.execute(
+                    'SELECT COALESCE(SUM(size), 0) AS total FROM download_cache_objects'
+                ).fetchone()['total']
+                if total <= self.max_bytes:
+                    break
+                oldest = self._conn.execute(
+                    'SELECT key FROM download_cache_entries ORDER BY last_access LIMIT 1'
+                ).fetchone()
+            if oldest is None:
+                break
+            self._delete_entries([oldest['key']])
+            evicted += 1
+
+        if evicted:
+            self._count(evictions=evicted)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            counters = {row['name']: row['value'] for row in self._conn.execute(
+                'SELECT name, value FROM download_cache_counters'
+            )}
+            entries = self._conn.execute('SELECT COUNT(*) AS n FROM download_cache_entries').fetchone()['n']
+            objects = self._conn.execute(
+                'SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size FROM download_cache_objects'
+            ).fetchone()
+
+        stats = {name: counters.get(name, 0) for name in COUNTER_NAMES}
+        lookups = stats['hits'] + stats['misses']
+        stats.update(
+            enabled=True,
+            hit_ratio=round(stats['hits'] / lookups, 3) if lookups else None,
+            entries=entries,
+            objects=objects['n'],
+            bytes=objects['size'],
+            max_bytes=self.max_bytes,
+        )
+        return stats
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def _same_file(a, b):
+        try:
+            return os.path.samefile(a, b)
+        except OSError:
+            return False
+
+    def _delete_entries(self, keys):
+        with self._lock, self._conn:
+            placeholders = ','.join('?' * len(keys))
+            self._conn.execute(f'DELETE FROM download_cache_entries WHERE key IN ({placeholders})', keys)
+            self._conn.execute(f'DELETE FROM download_cache_files WHERE key IN ({placeholders})', keys)
+            orphans = [row['digest'] for row in self._conn.execute(
+                'SELECT digest FROM download_cache_objects '
+                'WHERE digest NOT IN (SELECT digest FROM download_cache_files)'
+            )]
+            self._conn.executemany('DELETE FROM download_cache_objects WHERE digest = ?', [(d,) for d in orphans])
+
+        for digest in orphans:
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _count(self, **increments):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO download_cache_counters (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                list(increments.items())
+            )
+
+download_cache = DownloadCache()
+
+def init_app(app):
+    """Open the cache configured by the DOWNLOAD_CACHE_* settings."""
+    if not app.config.get('DOWNLOAD_CACHE_ENABLED', True):
+        return
+    from app.database.db import database_path
+
+    root = app.config.get('DOWNLOAD_CACHE_DIR') or os.path.join(app.config['UPLOAD_FOLDER'], '.cache')
+    download_cache.configure(
+        root,
+        database_path(app),
+        int(app.config.get('DOWNLOAD_CACHE_MAX_GB', 10) * 1024 ** 3),
+    )
@@ -1,19 +1,60 @@
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import yt_dlp
-from typing import Dict, Any, List
-
-def fetch_video_metadata(url: str) -> Dict[str, Any]:
+from typing import Dict, Any, List, Optional, Tuple
+from app.utils.audio_stream import EXTENSIONS as AUDIO_EXTENSIONS, NotStreamable, find_ffmpeg, stream_audio, \
+    unstreamable_reason
+from app.utils.clipping import COPY_STRATEGIES, EPSILON, ClipError, cut as cut_clip, envelope, fetch_ranges, \
+    parse_ranges, plan_clip, windows
+from app.utils.download_cache import cache_key, download_cache, file_digest
+from app.utils.format_planner import AUDIO_CONTAINERS, VIDEO_CONTAINERS, fallback_options, plan_formats
+from app.utils.joblog import YtDlpLogger, get_logger
+from app.utils.metadata_cache import metadata_cache
+from app.utils.staging import ArtifactCollector, discard, publish, staging_dir
+from app.utils.timing import StageTimer
+from yt_dlp.postprocessor import get_postprocessor
+from app.utils.transcript_sources import caption_track
+from app.utils.playlist_stream import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, parse_cursor, playlist_sessions, probe_playlist, summarize_entry
+)
+
+log = get_logger('downloader')
+
+# Output formats whose download is planned from the video's format list
+PLANNED_CONTAINERS = VIDEO_CONTAINERS + AUDIO_CONTAINERS
+
+# Options that hold callables; a deferred post-processing stage sets up its own
+UNSERIALIZABLE_OPTIONS = ('logger', 'progress_hooks', 'postprocessor_hooks', 'download_ranges')
+
+# Options used for metadata-only extraction
+METADATA_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'logger': YtDlpLogger(quiet=True),
+    'extract_flat': False,
+    'skip_download': True,  # Don't download the actual video
+}
+
+def _extract_metadata(url: str) -> Dict[str, Any]:
+    """Run a full extraction and return a JSON-safe info dict."""
+    with yt_dlp.YoutubeDL(METADATA_YDL_OPTS) as ydl:
+        info = ydl.extract_info(url, download=False)
+        if info is None:
+            raise Exception('Could not retrieve video information')
+        return ydl.sanitize_info(info)
+
+def fetch_video_metadata(url: str, cursor: Any = None, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
     """
     Fetch video metadata without downloading.
     Returns thumbnail, title, duration, uploader, and other metadata.
-    """
-    ydl_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': False,
-        'skip_download': True,  # Don't download the actual video
-    }
+    The extracted info is cached so the download that usually follows can reuse it.
 
+    Playlists are listed from a flat extraction, ``limit`` entries starting at
+    ``cursor``; pass the returned next_cursor to get the following page.
+    """
     results = {
         'success': False,
         'videos': [],
@@ -21,63 +62,393 @@ def fetch_video_metadata(url: str) -> Dict[str, Any]:
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-
-            if info is None:
-                results['errors'].append('Could not retrieve video information')
-                return results
-
-            # Handle playlists
-            if 'entries' in info:
-                for entry in info['entries']:
-                    if entry is None:
-                        continue
-
-                    thumbnail_url = None
-                    if entry.get('thumbnails'):
-                        thumbnail_url = entry['thumbnails'][-1]['url']
-                    elif entry.get('thumbnail'):
-                        thumbnail_url = entry['thumbnail']
-
-                    results['videos'].append({
-                        'title': entry.get('title', 'Untitled'),
-                        'duration': entry.get('duration', 0),
-                        'thumbnail_url': thumbnail_url,
-                        'uploader': entry.get('uploader', 'Unknown'),
-                        'view_count': entry.get('view_count', 0),
-                        'upload_date': entry.get('upload_date'),
-                        'description': entry.get('description', '')[:200] if entry.get('description') else '',
-                        'webpage_url': entry.get('webpage_url', url)
-                    })
-            else:
-                # Single video
-                thumbnail_url = None
-                if info.get('thumbnails'):
-                    thumbnail_url = info['thumbnails'][-1]['url']
-                elif info.get('thumbnail'):
-                    thumbnail_url = info['thumbnail']
-
-                results['videos'].append({
-                    'title': info.get('title', 'Untitled'),
-                    'duration': info.get('duration', 0),
-                    'thumbnail_url': thumbnail_url,
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'view_count': info.get('view_count', 0),
-                    'upload_date': info.get('upload_date'),
-                    'description': info.get('description', '')[:200] if info.get('description') else '',
-                    'webpage_url': info.get('webpage_url', url)
-                })
-
-            results['success'] = True
-            results['is_playlist'] = 'entries' in info
-            results['playlist_title'] = info.get('title') if 'entries' in info else None
+        offset = parse_cursor(cursor)
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+
+        session = None
+        info = metadata_cache.get(url)
+        if info is None:
+            session, info = playlist_sessions.open(url)
+
+        if session is not None:
+            # Playlist listed lazily from the flat extraction
+            entries, has_more = session.page(offset, limit)
+            results['videos'] = [summarize_entry(entry, url) for entry in entries]
+            results['playlist_title'] = session.title
+            results['total'] = session.total
+        elif 'entries' in info:
+            # Playlist already fully resolved by an earlier download
+            entries = info['entries'] or []
+            has_more = len(entries) > offset + limit
+            results['videos'] = [summarize_entry(entry, url) for entry in entries[offset:offset + limit] if entry]
+            results['playlist_title'] = info.get('title')
+            results['total'] = len(entries)
+        else:
+            # Single video
+            has_more = False
+            results['videos'].append(summarize_entry(info, url))
+            results['playlist_title'] = None
+
+        results['success'] = True
+        results['is_playlist'] = session is not None or 'entries' in info
+        results['next_cursor'] = str(offset + limit) if has_more else None
 
     except Exception as e:
         results['errors'].append(str(e))
 
     return results
 
+def _downloaded_files(info: Dict[str, Any]) -> List[str]:
+    """Paths of the files yt-dlp wrote for one video, after post-processing."""
+    paths = []
+    # yt-dlp records the written files on each requested download's copy of the info
+    for download in [info] + list(info.get('requested_downloads') or []):
+        paths.append(download.get('filepath') or download.get('_filename'))
+        for thumbnail in download.get('thumbnails') or []:
+            paths.append(thumbnail.get('filepath'))
+        for subtitle in (download.get('requested_subtitles') or {}).values():
+            paths.append(subtitle.get('filepath'))
+        paths.append(download.get('infojson_filename'))
+    return [path for path in dict.fromkeys(paths) if path and os.path.isfile(path)]
+
+def _media_artifact(artifacts: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The media file among a download's artifacts (the largest, if several)."""
+    media = [artifact for artifact in artifacts if artifact['kind'] == 'media']
+    return max(media, key=lambda artifact: artifact['size']) if media else None
+
+def _checksum(artifacts: List[Dict[str, Any]], output_dir: str):
+    """Add the SHA-256 of each media artifact, for the library catalogue and the download cache."""
+    for artifact in artifacts:
+        if artifact['kind'] == 'media':
+            artifact['sha256'] = file_digest(os.path.join(output_dir, artifact['name']))
+
+def _video_id(info: Dict[str, Any]) -> Optional[str]:
+    """Stable identity of a video across formats and URLs: extractor and id."""
+    if not info.get('id'):
+        return None
+    return f"{info.get('extractor_key') or info.get('extractor') or 'generic'}:{info['id']}"
+
+class _DeferringYoutubeDL(yt_dlp.YoutubeDL):
+    """
+    A YoutubeDL that stops once a video's streams are downloaded, keeping
+    the post_process call (merge, fixups, conversions) for finish_download.
+    Files that need no post-processing are finished as usual.
+    """
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.deferred = None
+
+    def post_process(self, filename, info, files_to_move=None):
+        if not info.get('__postprocessors') and not self.params.get('postprocessors'):
+            return super().post_process(filename, info, files_to_move)
+        self.deferred = (filename, files_to_move)
+        info['filepath'] = filename
+        return info
+
+def _download_streamed(ydl, info: Dict[str, Any], plan: Dict[str, Any], ydl_opts: Dict[str, Any],
+                       ffmpeg: Optional[str], timer: StageTimer) -> Optional[Dict[str, Any]]:
+    """
+    Download a planned audio format straight into ffmpeg (see audio_stream)
+    and write its sidecars. Returns the info dict as process_ie_result
+    would, or None if the file has to be downloaded to disk and converted
+    afterwards instead.
+    """
+    fmt = next((f for f in info.get('formats') or [] if f.get('format_id') == plan['options']['format']), None)
+    reason = 'ffmpeg not found' if ffmpeg is None else unstreamable_reason(fmt) if fmt else 'planned format not listed'
+    if reason:
+        log.info('Converting audio after the download: %s', reason)
+        return None
+
+    extract = plan['options']['postprocessors'][0]
+    container = extract['preferredcodec']
+    # The name FFmpegExtractAudio would give the converted file
+    path = os.path.splitext(ydl.prepare_filename(dict(info, **fmt)))[0] + f'.{AUDIO_EXTENSIONS[container]}'
+    try:
+        with timer.span('stream_convert', format_id=fmt['format_id']) as span:
+            span['bytes'] = stream_audio(
+                ydl, fmt, path, container, ffmpeg,
+                bitrate=extract.get('preferredquality'),
+                copy=plan['strategy'] == 'copy',
+                progress_hooks=ydl_opts['progress_hooks'],
+            )
+    except NotStreamable as e:
+        log.info('Converting audio after the download: %s', e)
+        # The bytes streamed so far are not part of the download that follows
+        for hook in ydl_opts['progress_hooks']:
+            hook({'status': 'discarded', 'filename': path})
+        return None
+    log.info('Audio converted while downloading: %s', os.path.basename(path))
+    return _write_sidecars(info, ydl_opts, path)
+
+def _write_sidecars(info: Dict[str, Any], ydl_opts: Dict[str, Any], path: str) -> Optional[Dict[str, Any]]:
+    """
+    Info JSON, thumbnail and subtitles as yt-dlp writes them, without
+    fetching the media again, for a media file written at ``path`` by other means.
+    """
+    sidecar_opts = dict(ydl_opts, skip_download=True, postprocessors=[])
+    with yt_dlp.YoutubeDL(sidecar_opts) as sidecars:
+        info = sidecars.process_ie_result(info, download=True)
+    if info is not None:
+        info['requested_downloads'][0]['filepath'] = path
+    return info
+
+def _plan_clip(ydl, info: Dict[str, Any], plan: Dict[str, Any], clips: List[Dict[str, Any]], format_pref: str,
+               ffprobe: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    How the clipping engine fetches ``clips`` for a planned download (see
+    clipping.plan_clip), or None to leave them to yt-dlp's download_ranges.
+    Fragmented formats are narrowed in ``info``.
+    """
+    if ffprobe is None:
+        log.info('Clipping with yt-dlp: ffprobe not found')
+        return None
+    try:
+        fetch = plan_clip(ydl, info, plan['options']['format'].split('+'), [(c['start'], c['end']) for c in clips])
+    except ClipError as e:
+        log.info('Clipping with yt-dlp: %s', e)
+        return None
+    if fetch['method'] == 'ranges' and (format_pref not in VIDEO_CONTAINERS or plan['strategy'] not in COPY_STRATEGIES):
+        # The ranges are read by stream copy into the target container
+        log.info('Clipping with yt-dlp: the %s plan converts the streams', plan['strategy'])
+        return None
+
+    # Where each kind of stream of the fetched file starts in the video
+    offsets = {}
+    for fmt in fetch['formats']:
+        offset = fetch['offsets'].get(fmt['format_id'])
+        if fmt.get('vcodec') != 'none':
+            offsets['video'] = offset
+        if fmt.get('acodec') != 'none':
+            offsets['audio'] = offset
+    log.info('Clipping %d range(s): fetching %s', len(clips),
+             'only the fragments that cover them' if fetch['method'] == 'fragments' else 'them from the nearest keyframes')
+    return {
+        'method': fetch['method'],
+        'clips': clips,
+        'formats': [fmt['format_id'] for fmt in fetch['formats']],
+        'offsets': offsets,
+        'source_bytes': fetch['source_bytes'],
+    }
+
+def _download_clip(ydl, info: Dict[str, Any], clip_job: Dict[str, Any], ydl_opts: Dict[str, Any], container: str,
+                   ffmpeg: str, ffprobe: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch the clips of single-file formats with ffmpeg (see
+    clipping.fetch_ranges), one read per group of nearby clips, and write
+    the sidecars. Returns the info dict as process_ie_result would. The
+    fetched windows are left for _cut_clips, except that a single clip
+    without frame accuracy is fetched straight into place.
+    """
+    by_id = {f.get('format_id'): f for f in info.get('formats') or []}
+    formats = [by_id[format_id] for format_id in clip_job['formats']]
+    path = ydl.prepare_filename(dict(info, ext=container))
+    clips = clip_job['clips']
+    in_place = len(clips) == 1 and not clips[0]['accurate']
+    clip_job['windows'] = []
+    for index, (start, end) in enumerate(windows([(clip['start'], clip['end']) for clip in clips]), 1):
+        target = path if in_place else f'{os.path.splitext(path)[0]}.fetch{index}.mkv'
+        started = time.time()
+        keyframe = fetch_ranges(ffmpeg, ffprobe, formats, start, end, target)
+        size = os.path.getsize(target)
+        # Reported as a download, to the job's progress and the timer
+        for hook in ydl_opts['progress_hooks']:
+            hook({
+                'status': 'finished',
+                'filename': target,
+                'downloaded_bytes': size,
+                'total_bytes': size,
+                'elapsed': time.time() - started,
+                'info_dict': formats[0],
+            })
+        clip_job['windows'].append({
+            'start': start, 'end': end, 'keyframe': keyframe, 'source': None if in_place else target,
+        })
+        log.info('Fetched %ss to %ss from the keyframe at %ss (%d bytes)', start, end, keyframe, size)
+    return _write_sidecars(info, ydl_opts, path)
+
+def _cut_clips(info: Dict[str, Any], clip_job: Dict[str, Any], timer: StageTimer,
+               context: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Cut the clips out of what was fetched (whole fragments, keyframe-aligned
+    windows, or yt-dlp's download of the range spanning them all), in
+    parallel ffmpeg passes. A single clip replaces the downloaded media;
+    several are written next to it as '<name>.clip<n>.<ext>' and the shared
+    download is removed. Returns the clip report and the clips' files.
+    """
+    clips = clip_job['clips']
+    media = (info.get('requested_downloads') or [info])[0].get('filepath')
+    if not media or clip_job['method'] != 'ranges' and not os.path.isfile(media):
+        # The fetched windows of a ranges download are cut into the media file's place
+        raise ClipError('no media file to cut the clips from')
+    stem, ext = os.path.splitext(media)
+    source = media
+    if len(clips) == 1:
+        outputs = [media]
+        if clip_job['method'] == 'fragments':
+            source = f'{stem}.uncut{ext}'
+            os.replace(media, source)
+    else:
+        outputs = [f'{stem}.clip{index}{ext}' for index in range(1, len(clips) + 1)]
+
+    done = [None] * len(clips)
+    cuts = []  # (index, file to cut from, source time of its streams' start)
+    for index, clip in enumerate(clips):
+        if clip_job['method'] == 'ranges':
+            window = next(w for w in clip_job['windows'] if w['start'] <= clip['start'] and (
+                w['end'] is None or clip['end'] is not None and clip['end'] <= w['end']))
+            if window['source'] is None:
+                # Fetched into place from the keyframe
+                done[index] = {'start': window['keyframe'], 'end': clip['end'],
+                               'accurate': window['keyframe'] >= clip['start'] - EPSILON}
+            else:
+                cuts.append((index, window['source'], {'video': window['keyframe'], 'audio': window['keyframe']}))
+        elif clip_job['method'] == 'download_ranges' and len(clips) == 1:
+            # yt-dlp cut it while downloading
+            done[index] = {'start': clip['start'], 'end': clip['end'], 'accurate': False}
+        else:
+            cuts.append((index, source, clip_job['offsets']))
+
+    def cut_one(index, path, offsets):
+        clip = clips[index]
+        with timer.span('clip_cut', clip=index + 1, accurate=clip['accurate']) as span:
+            result = cut_clip(context['ffmpeg'], context['ffprobe'], path, outputs[index], clip['start'], clip['end'],
+                              offsets, clip['accurate'])
+            span['reencoded_seconds'] = result['reencoded_seconds']
+        return result
+
+    try:
+        if cuts:
+            # Each cut is one or a few ffmpeg processes, mostly copying: one per core
+            with ThreadPoolExecutor(max_workers=min(len(cuts), os.cpu_count() or 1)) as executor:
+                futures = [(index, executor.submit(cut_one, index, path, offsets)) for index, path, offsets in cuts]
+            for index, future in futures:
+                done[index] = future.result()
+    finally:
+        # Everything the clips were cut from: the shared download, the fetched windows
+        for path in {path for _, path, _ in cuts}:
+            if os.path.exists(path):
+                os.remove(path)
+
+    report = {
+        'method': clip_job['method'],
+        'bytes_fetched': clip_job.get('bytes_fetched'),
+        'source_bytes': clip_job.get('source_bytes'),
+        'clips': [dict(result, file=os.path.basename(path)) for result, path in zip(done, outputs)],
+    }
+    if report['bytes_fetched'] and report['source_bytes']:
+        report['fraction'] = round(report['bytes_fetched'] / report['source_bytes'], 4)
+    if len(clips) > 1:
+        log.info('Cut %d clips', len(clips))
+    return report, outputs
+
+def _postprocess_state(ydl: _DeferringYoutubeDL, info: Dict[str, Any], context: Dict[str, Any],
+                       ydl_opts: Dict[str, Any], staging: str, files: List[str], started_at: float) -> Dict[str, Any]:
+    """Everything finish_download needs, as plain data that can cross a process boundary."""
+    filename, files_to_move = ydl.deferred
+    download = (info.get('requested_downloads') or [info])[0]
+    # Merger and fixups chosen while downloading; rebuilt by name in the next stage
+    postprocessors = [type(pp).__name__[:-len('PP')] for pp in download.pop('__postprocessors', None) or []]
+    info = ydl.sanitize_info(dict(info, requested_downloads=[download]), remove_private_keys=False)
+    return {
+        'info': info,
+        'filename': filename,
+        'files_to_move': files_to_move or {},
+        'postprocessors': postprocessors,
+        'ydl_opts': {name: value for name, value in ydl_opts.items() if name not in UNSERIALIZABLE_OPTIONS},
+        'context': context,
+        'staging': staging,
+        'files': files,
+        'started_at': started_at,
+    }
+
+def _finish_single(info: Dict[str, Any], results: Dict[str, Any], timer: StageTimer,
+                   collector: ArtifactCollector, context: Dict[str, Any]):
+    """Publish a downloaded (and post-processed) video and add it to ``results``."""
+    output_dir = context['output_dir']
+    format_pref = context['format']
+    clips = context['clips']
+    clip_files = []
+    if context.get('clip_job') is not None:
+        results['clip'], clip_files = _cut_clips(info, context['clip_job'], timer, context)
+
+    # --- THUMBNAIL EXTRACTION FOR SINGLE VIDEO ---
+    thumbnail_url = None
+    if info.get('thumbnails'):
+        # Get the URL of the highest resolution thumbnail (usually the last in the list)
+        thumbnail_url = info['thumbnails'][-1]['url']
+    elif info.get('thumbnail'):
+        # Fallback to a single 'thumbnail' key if it exists
+        thumbnail_url = info['thumbnail']
+    # ---------------------------------------------
+                
+    # Exactly the files this job wrote, moved from staging into the library
+    with timer.span('publish') as span:
+        artifacts = publish(collector.files(_downloaded_files(info) + clip_files), output_dir)
+        span['files'] = len(artifacts)
+    # Here rather than in the server: in a worker process hashing does not hold the server's GIL
+    with timer.span('checksum'):
+        _checksum(artifacts, output_dir)
+    log.debug('Artifacts: %s', artifacts)
+
+    media = _media_artifact(artifacts)
+    if media:
+        log.info('Downloaded %s (%d bytes)', media['name'], media['size'])
+    else:
+        log.warning('No media file among the downloaded files')
+
+    results['downloads'].append({
+        'title': info.get('title', 'Untitled'),
+        'video_id': _video_id(info),
+        'format': format_pref,
+        'quality': context['quality'],
+        'duration': info.get('duration'),
+        'status': 'completed',
+        'filename': media['name'] if media else f"{info.get('title', 'Untitled')}.{format_pref}",
+        'actual_files': [artifact['name'] for artifact in artifacts],
+        'artifacts': artifacts,
+        'thumbnail_url': thumbnail_url,  # ADDED
+        'size': media['size'] if media else 0,  # ADDED - file size in bytes
+        'clip': [clips[0]['start'], clips[0]['end']] if len(clips) == 1 else None,
+    })
+
+    if len(clips) > 1:
+        # One download per clip: its own media file, and the video's info JSON, thumbnail and subtitles
+        download = results['downloads'].pop()
+        by_name = {artifact['name']: artifact for artifact in artifacts}
+        sidecars = [artifact for artifact in artifacts if artifact['kind'] != 'media']
+        for index, (clip, path) in enumerate(zip(clips, clip_files), 1):
+            media = by_name[os.path.basename(path)]
+            results['downloads'].append(dict(
+                download,
+                filename=media['name'],
+                actual_files=[media['name']] + [artifact['name'] for artifact in sidecars],
+                artifacts=[media] + sidecars,
+                size=media['size'],
+                clip=[clip['start'], clip['end']],
+                clip_index=index,
+            ))
+
+    if context['cache_key'] is not None:
+        try:
+            with timer.span('cache_store'):
+                paths = [os.path.join(output_dir, artifact['name']) for artifact in artifacts]
+                digests = {
+                    os.path.join(output_dir, artifact['name']): artifact['sha256']
+                    for artifact in artifacts if artifact.get('sha256')
+                }
+                download_cache.store(context['cache_key'], paths, results['downloads'][-1], digests)
+        except Exception as e:
+            # The download itself succeeded; caching is best effort
+            log.warning('Could not add download to cache: %s', e)
+
+    # A caption track in the transcription language lets transcription skip Whisper.
+    # Only for whole videos: a clip's audio does not match the video's captions
+    if context['captions'] and not clips:
+        track = caption_track(info, context['subtitle_language'])
+        if track is not None:
+            results['downloads'][-1]['captions'] = track
+
 def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
     # Get the absolute path to ffmpeg
     current_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -87,18 +458,29 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
-    print(f"Output directory: {output_dir}")
-    print(f"FFmpeg directory: {ffmpeg_dir}")
-    print(f"FFmpeg path: {ffmpeg_path}")
-    print(f"FFmpeg exists: {os.path.exists(ffmpeg_path)}")
+    # yt-dlp writes into the job's own staging directory; finished files are moved
+    # into output_dir, so concurrent jobs never see each other's partial files.
+    # A job resumed after a restart passes the same staging_id and finds its .part files
+    staging = staging_dir(output_dir, kwargs.get('staging_id') or uuid.uuid4().hex)
+    os.makedirs(staging, exist_ok=True)
+    collector = ArtifactCollector(staging)
+
+    # Stage spans (extract, download, merge, postprocessors, ...) returned as results['timings']
+    timer = StageTimer()
+    started_at = time.time()
+
+    log.debug('Output directory: %s (staging in %s)', output_dir, staging)
 
     # Configure yt-dlp options with better error handling
     ydl_opts = {
         # Use flexible format selection that works with most videos
         'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best',
-        'outtmpl': os.path.join(output_dir, '%(title)s.%(ext)s'),
-        'quiet': False,  # Enable verbose output for debugging
-        'no_warnings': False,  # Show warnings for debugging
+        'outtmpl': os.path.join(staging, '%(title)s.%(ext)s'),
+        # yt-dlp's output goes through our logging, attributed to the job; no
+        # per-chunk progress lines (progress is reported through the hooks)
+        'quiet': True,
+        'noprogress': True,
+        'logger': YtDlpLogger(),
         'ignoreerrors': False,  # Don't ignore errors - we want to see them
         'extract_flat': False,  # Don't extract playlist info only
         'skip_unavailable_fragments': True,
@@ -106,11 +488,21 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
         'geo_bypass': True,  # Recommended for improved reliability/availability
         'writethumbnail': True,  # Download thumbnail
         'merge_output_format': 'mp4',  # Ensure merged files are mp4
-        'progress_hooks': kwargs.get('progress_hooks', []),  # CRITICAL: Add progress hooks from kwargs
-        'overwrites': True,  # Overwrite existing files (forces re-download for testing)
+        # CRITICAL: Add progress hooks from kwargs; the timer records per-format download spans
+        # and the collector the files written
+        'progress_hooks': list(kwargs.get('progress_hooks', [])) + [timer.progress_hook, collector.progress_hook],
+        'postprocessor_hooks': [timer.postprocessor_hook, collector.postprocessor_hook],
+        # Repeat requests are answered by the download cache before yt-dlp runs; a
+        # miss still overwrites, since names only carry the title, not the format
+        'overwrites': True,
         'nopart': False,  # Use .part files for in-progress downloads
     }
 
+    # Resuming an interrupted job: continue the existing .part files
+    if kwargs.get('resume', False):
+        ydl_opts['overwrites'] = False
+        ydl_opts['continuedl'] = True
+
     # Set FFmpeg location - yt-dlp needs the directory
     if os.path.exists(ffmpeg_path):
         ydl_opts['ffmpeg_location'] = ffmpeg_dir
@@ -118,95 +510,18 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
         ydl_opts['postprocessor_args'] = {
             'ffmpeg': ['-loglevel', 'warning']
         }
-        print("FFmpeg found, using custom location")
+        log.debug('Using bundled FFmpeg in %s', ffmpeg_dir)
     else:
-        print("FFmpeg not found at custom location, using system PATH")
+        log.debug('FFmpeg not found in %s, using system PATH', ffmpeg_dir)
 
     # Handle format preference
     format_pref = kwargs.get('format', 'mp4')
     quality = kwargs.get('quality', 'best')
 
-    # Video formats
-    if format_pref == 'mp4':
-        ydl_opts['merge_output_format'] = 'mp4'
-        if quality == 'best':
-            ydl_opts['format'] = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/bestvideo+bestaudio/best'
-        elif quality == '1080p':
-            ydl_opts['format'] = 'bestvideo[height<=1080][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-        elif quality == '720p':
-            ydl_opts['format'] = 'bestvideo[height<=720][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=720]+bestaudio/best[height<=720]'
-        elif quality == '480p':
-            ydl_opts['format'] = 'bestvideo[height<=480][ext=mp4]+bestaudio[ext=m4a]/bestvideo[height<=480]+bestaudio/best[height<=480]'
-
-    elif format_pref == 'mkv':
-        ydl_opts['merge_output_format'] = 'mkv'
-        if quality == 'best':
-            ydl_opts['format'] = 'bestvideo+bestaudio/best'
-        elif quality == '1080p':
-            ydl_opts['format'] = 'bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-        elif quality == '720p':
-            ydl_opts['format'] = 'bestvideo[height<=720]+bestaudio/best[height<=720]'
-        elif quality == '480p':
-            ydl_opts['format'] = 'bestvideo[height<=480]+bestaudio/best[height<=480]'
-
-    elif format_pref == 'avi':
-        ydl_opts['merge_output_format'] = 'avi'
-        ydl_opts['postprocessors'] = [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'avi',
-        }]
-        if quality == 'best':
-            ydl_opts['format'] = 'bestvideo+bestaudio/best'
-        elif quality == '1080p':
-            ydl_opts['format'] = 'bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-        elif quality == '720p':
-            ydl_opts['format'] = 'bestvideo[height<=720]+bestaudio/best[height<=720]'
-        elif quality == '480p':
-            ydl_opts['format'] = 'bestvideo[height<=480]+bestaudio/best[height<=480]'
-
-    elif format_pref == 'webm':
-        ydl_opts['merge_output_format'] = 'webm'
-        if quality == 'best':
-            ydl_opts['format'] = 'bestvideo[ext=webm]+bestaudio[ext=webm]/bestvideo+bestaudio/best'
-        elif quality == '1080p':
-            ydl_opts['format'] = 'bestvideo[height<=1080][ext=webm]+bestaudio[ext=webm]/bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-        elif quality == '720p':
-            ydl_opts['format'] = 'bestvideo[height<=720][ext=webm]+bestaudio[ext=webm]/bestvideo[height<=720]+bestaudio/best[height<=720]'
-        elif quality == '480p':
-            ydl_opts['format'] = 'bestvideo[height<=480][ext=webm]+bestaudio[ext=webm]/bestvideo[height<=480]+bestaudio/best[height<=480]'
-
-    # Audio formats
-    elif format_pref == 'mp3':
-        # Get bitrate from quality parameter (320, 256, 192, 128)
-        bitrate = quality if quality in ['320', '256', '192', '128'] else '192'
-        ydl_opts.update({
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': bitrate,
-            }]
-        })
-
-    elif format_pref == 'aac':
-        bitrate = quality if quality in ['320', '256', '192', '128'] else '192'
-        ydl_opts.update({
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'aac',
-                'preferredquality': bitrate,
-            }]
-        })
-
-    elif format_pref == 'wav':
-        ydl_opts.update({
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'wav',
-            }]
-        })
+    # Selectors for when the formats are not known in advance; a single video's
+    # formats are planned once it is extracted (see plan_formats below)
+    if format_pref in PLANNED_CONTAINERS:
+        ydl_opts.update(fallback_options(format_pref, quality))
 
     # Handle subtitles
     if kwargs.get('subtitles', False):
@@ -223,48 +538,29 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
         if kwargs.get('subtitle_translate', False):
             ydl_opts['writeautomaticsub'] = True
 
-    # Handle time range (download specific section)
+    # Handle time ranges (download specific sections, one range or a list); clips are the
+    # ranges in seconds. Once the formats are known the clipping engine fetches only what
+    # covers them (see _plan_clip); yt-dlp's download_ranges over the span of all of them,
+    # which needs all of ffmpeg, is the fallback
+    clips = []
+    clip_report = None
     time_range = kwargs.get('time_range', {})
-    if time_range and (time_range.get('start') or time_range.get('end')):
-        start_time = time_range.get('start', '00:00:00')
-        end_time = time_range.get('end', '')
-
-        # Convert HH:MM:SS to seconds
-        def time_to_seconds(time_str):
-            if not time_str:
-                return None
-            parts = time_str.split(':')
-            if len(parts) == 3:
-                h, m, s = parts
-                return int(h) * 3600 + int(m) * 60 + int(s)
-            elif len(parts) == 2:
-                m, s = parts
-                return int(m) * 60 + int(s)
-            return int(parts[0])
-
-        start_sec = time_to_seconds(start_time) if start_time else None
-        end_sec = time_to_seconds(end_time) if end_time else None
-
-        # Add postprocessor for time range extraction
-        if 'postprocessors' not in ydl_opts:
-            ydl_opts['postprocessors'] = []
-
-        ydl_opts['postprocessors'].insert(0, {
-            'key': 'FFmpegVideoRemuxer',
-            'preferedformat': format_pref,
-        })
-
-        # Use download_ranges for yt-dlp
-        if start_sec is not None or end_sec is not None:
-            # Ensure FFmpeg is available for time range downloads
-            if not os.path.exists(ffmpeg_path):
-                print("Warning: FFmpeg required for time range downloads")
-            else:
-                ydl_opts['download_ranges'] = lambda info, *_: [{
-                    'start_time': start_sec,
-                    'end_time': end_sec,
-                }]
-                print(f"Time range: {start_time} to {end_time} ({start_sec}s to {end_sec}s)")
+    ffmpeg = find_ffmpeg(ffmpeg_dir)
+    ffprobe = find_ffmpeg(ffmpeg_dir, 'ffprobe')
+    requested = parse_ranges(time_range)
+    if requested:
+        missing = 'ffmpeg' if ffmpeg is None else 'ffprobe' if ffprobe is None and len(requested) > 1 else None
+        if missing:
+            log.warning('%s required for time range downloads; downloading the whole video', missing)
+            clip_report = {'applied': False, 'reason': f'{missing} not found'}
+        else:
+            clips = requested
+            start_sec, end_sec = envelope([(clip['start'], clip['end']) for clip in clips])
+            ydl_opts['download_ranges'] = lambda info, *_: [{
+                'start_time': start_sec,
+                'end_time': end_sec,
+            }]
+            log.info('Time range: %s', ', '.join(f"{clip['start']}s to {clip['end']}s" for clip in clips))
 
     # Handle network settings
     network_settings = kwargs.get('network_settings', {})
@@ -273,7 +569,7 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
         concurrent = int(network_settings.get('concurrent', 1))
         if concurrent > 1:
             ydl_opts['concurrent_fragment_downloads'] = concurrent
-            print(f"Concurrent fragment downloads: {concurrent}")
+            log.debug('Concurrent fragment downloads: %d', concurrent)
 
         # Segment size (http_chunk_size)
         segment_size = network_settings.get('segment_size')
@@ -281,7 +577,7 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
             # Convert MB to bytes
             chunk_size = int(segment_size) * 1024 * 1024
             ydl_opts['http_chunk_size'] = chunk_size
-            print(f"HTTP chunk size: {segment_size}MB ({chunk_size} bytes)")
+            log.debug('HTTP chunk size: %sMB (%d bytes)', segment_size, chunk_size)
 
     results = {
         'success': False,  # Start as False, set to True only if successful
@@ -289,30 +585,139 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
         'errors': [],
         'skipped': []
     }
+    if clip_report is not None:
+        results['clip'] = clip_report
+
+    # The caller turns a playlist into one job per entry: nothing is downloaded here
+    if kwargs.get('expand_playlists'):
+        try:
+            with timer.span('playlist_probe'):
+                playlist = probe_playlist(url)
+        except Exception as e:
+            # The download below reports the extraction error as usual
+            log.debug('Playlist probe failed: %s', e)
+            playlist = None
+        if playlist is not None:
+            log.info('Playlist %r: to be expanded into entry jobs', playlist['title'])
+            discard(staging)
+            results['playlist'] = playlist
+            results['summary'] = _summary(results)
+            results['timings'] = timer.spans()
+            return results
 
     try:
-        print(f"Starting download for URL: {url}")
-        print(f"yt-dlp options: {ydl_opts}")
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        log.info('Starting download: %s', url)
+        log.debug('yt-dlp options: %r', ydl_opts)
+
+        with ExitStack() as stack:
+            ydl = stack.enter_context(yt_dlp.YoutubeDL(ydl_opts))
             # First, extract info to check what we're dealing with
             try:
-                print("STARTING DOWNLOAD WITH PROGRESS HOOKS ENABLED...")
-                # CRITICAL FIX: Use download=True in single call so hooks fire!
-                info = ydl.extract_info(url, download=True)
+                # Reuse the info dict from a recent preview (or a concurrent download
+                # of the same URL) so the extraction round-trip is skipped
+                with timer.span('extract'):
+                    cached_info = metadata_cache.get_or_extract(
+                        url, lambda u: ydl.sanitize_info(ydl.extract_info(u, download=False))
+                    )
+
+                # A single video's formats are known now: download exactly the streams the cheapest
+                # path needs (direct, then stream copy, re-encoding last) and say what it costs
+                plan = None
+                clip_job = None
+                if cached_info and cached_info.get('_type', 'video') == 'video' and format_pref in PLANNED_CONTAINERS:
+                    with timer.span('plan'):
+                        plan = plan_formats(cached_info, format_pref, quality)
+                    if plan['transcode']:
+                        log.warning('Re-encoding to %s (%s): about %s CPU seconds', format_pref,
+                                    plan['note'] or ', '.join(plan['steps']), plan['estimated_cpu_seconds'])
+                    else:
+                        log.info('Format plan: %s via %s', plan['strategy'], ' + '.join(plan['steps']))
+                    ydl_opts.pop('postprocessors', None)
+                    ydl_opts.update(plan['options'])
+                    if clips:
+                        with timer.span('clip_plan'):
+                            clip_job = _plan_clip(ydl, cached_info, plan, clips, format_pref, ffprobe)
+                        if clip_job is not None:
+                            # The engine fetches the ranges itself
+                            ydl_opts.pop('download_ranges', None)
+                    # Post-processors are set up when a YoutubeDL is created. With deferral, the
+                    # merge and conversions run later in finish_download, off the network slot
+                    ydl_class = _DeferringYoutubeDL if kwargs.get('defer_postprocessing') else yt_dlp.YoutubeDL
+                    ydl = stack.enter_context(ydl_class(ydl_opts))
+                    results['format_plan'] = plan
+
+                # Single videos fetched earlier with the same options come from the download cache.
+                # Not several clips: a cache entry is one download
+                key = None
+                cached_download = None
+                if cached_info and cached_info.get('_type', 'video') == 'video' and len(clips) < 2:
+                    key = cache_key(cached_info, ydl_opts, {'time_range': time_range or None})
+                    with timer.span('cache_lookup') as span:
+                        cached_download = download_cache.lookup(key, output_dir)
+                        span['hit'] = cached_download is not None
+
+                # Audio is converted while it downloads, when the source can be read front to back.
+                # Not when resuming: a pipe has no .part file to continue from
+                streaming = (
+                    cached_download is None and plan is not None and format_pref in AUDIO_CONTAINERS
+                    and plan['strategy'] in ('copy', 'transcode') and not clips
+                    and kwargs.get('stream_audio', True) and not kwargs.get('resume', False)
+                )
+
+                info = None
+                if cached_download is not None:
+                    info = cached_info
+                elif clip_job is not None and clip_job['method'] == 'ranges':
+                    info = _download_clip(ydl, cached_info, clip_job, ydl_opts, format_pref, ffmpeg, ffprobe)
+                elif streaming:
+                    info = _download_streamed(ydl, cached_info, plan, ydl_opts, ffmpeg, timer)
+                if info is None:
+                    # process_ie_result re-runs format selection for these options and downloads
+                    info = ydl.process_ie_result(cached_info, download=True)
                 
                 if info is None:
                     raise Exception("Could not retrieve video information")
 
-                print(f"Video info extracted successfully:")
-                print(f"  Title: {info.get('title', 'Unknown')}")
-                print(f"  Duration: {info.get('duration', 'Unknown')} seconds")
-                print(f"  Uploader: {info.get('uploader', 'Unknown')}")
+                log.info('Extracted %r (%s seconds, uploader %s)', info.get('title'), info.get('duration'), info.get('uploader'))
+
+                if clips and cached_download is None and 'entries' not in info:
+                    if clip_job is None:
+                        # yt-dlp's download_ranges fetched the span of the clips (about from its
+                        # start: it seeks to a keyframe), to be cut into several
+                        clip_job = {
+                            'method': 'download_ranges',
+                            'clips': clips,
+                            'offsets': {'video': start_sec, 'audio': start_sec},
+                            'source_bytes': sum(
+                                f.get('filesize') or f.get('filesize_approx') or 0
+                                for f in info.get('requested_formats') or [info]
+                            ) or None,
+                        }
+                    clip_job['bytes_fetched'] = sum(
+                        span.get('bytes') or 0 for span in timer.spans() if span['stage'] == 'download'
+                    )
+
+                # What finishing a single video needs, here or in the post-processing stage
+                context = {
+                    'output_dir': output_dir,
+                    'format': format_pref,
+                    'quality': quality,
+                    'clips': clips,
+                    'clip_job': clip_job,
+                    'ffmpeg': ffmpeg,
+                    'ffprobe': ffprobe,
+                    'cache_key': key,
+                    'captions': bool(kwargs.get('transcribe') or kwargs.get('find_captions')),
+                    'subtitle_language': kwargs.get('subtitle_language', 'en'),
+                }
 
                 # Handle both single videos and playlists
-                if 'entries' in info:
+                if cached_download is not None:
+                    log.info('Served from the download cache, nothing fetched')
+                    results['downloads'].append(cached_download)
+                elif 'entries' in info:
                     # This is a playlist - already downloaded via extract_info above!
-                    print(f"SUCCESS: Playlist detected: {info.get('title', 'Untitled Playlist')}")
+                    log.info('Playlist: %r', info.get('title'))
                     entries = list(info['entries'])
                     total_videos = len(entries)
 
@@ -332,80 +737,47 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
                             thumbnail_url = entry['thumbnail']
                         # ---------------------------------------------
 
-                        print(f"SUCCESS: Processed video {index}/{total_videos}: {entry.get('title', 'Untitled')}")
+                        log.debug('Processed video %d/%d: %r', index, total_videos, entry.get('title'))
+
+                        with timer.span('publish'):
+                            artifacts = publish(collector.files(_downloaded_files(entry)), output_dir)
+                        with timer.span('checksum'):
+                            _checksum(artifacts, output_dir)
+                        media = _media_artifact(artifacts)
 
                         results['downloads'].append({
                             'title': entry.get('title', 'Untitled'),
+                            'video_id': _video_id(entry),
                             'format': format_pref,
                             'quality': quality,
                             'index': index,
                             'duration': entry.get('duration'),
                             'status': 'completed',
-                            'filename': f"{entry.get('title', 'Untitled')}.{format_pref}",
+                            'filename': media['name'] if media else f"{entry.get('title', 'Untitled')}.{format_pref}",
+                            'artifacts': artifacts,
+                            'size': media['size'] if media else 0,
                             'thumbnail_url': thumbnail_url
                         })
+
+                    # The playlist's own info JSON and thumbnail
+                    publish(collector.files(), output_dir)
+                elif getattr(ydl, 'deferred', None):
+                    # The streams are on disk; merging and converting them is left to the
+                    # post-processing stage (finish_download), which frees the network slot
+                    results['postprocess'] = _postprocess_state(
+                        ydl, info, context, ydl_opts, staging, collector.files(), started_at
+                    )
+                    log.info('Downloaded; post-processing deferred')
                 else:
                     # Single video - already downloaded in extract_info call above!
-                    print("SUCCESS: Single video download completed!")
-
-                    # --- THUMBNAIL EXTRACTION FOR SINGLE VIDEO ---
-                    thumbnail_url = None
-                    if info.get('thumbnails'):
-                        # Get the URL of the highest resolution thumbnail (usually the last in the list)
-                        thumbnail_url = info['thumbnails'][-1]['url']
-                    elif info.get('thumbnail'):
-                        # Fallback to a single 'thumbnail' key if it exists
-                        thumbnail_url = info['thumbnail']
-                    # ---------------------------------------------
-                    
-                    # Check if file was actually created
-                    expected_filename = f"{info.get('title', 'Untitled')}.{format_pref}"
-                    expected_path = os.path.join(output_dir, expected_filename)
-                    
-                    print(f"Expected file: {expected_path}")
-                    
-                    # Look for any files that were created
-                    created_files = []
-                    for file in os.listdir(output_dir):
-                        file_path = os.path.join(output_dir, file)
-                        if os.path.isfile(file_path):
-                            created_files.append(file)
-                    
-                    print(f"Files in output directory: {created_files}")
+                    _finish_single(info, results, timer, collector, context)
 
-                    # Get file size of the main download
-                    file_size = 0
-                    if os.path.exists(expected_path):
-                        file_size = os.path.getsize(expected_path)
-                        print(f"File size: {file_size} bytes ({file_size / 1024 / 1024:.2f} MB)")
-                    else:
-                        # Try to find the actual video file
-                        for file in created_files:
-                            if file.endswith(('.mp4', '.mkv', '.avi', '.webm', '.mp3', '.aac', '.wav')):
-                                file_path = os.path.join(output_dir, file)
-                                file_size = os.path.getsize(file_path)
-                                print(f"Found file: {file} ({file_size / 1024 / 1024:.2f} MB)")
-                                break
-
-                    results['downloads'].append({
-                        'title': info.get('title', 'Untitled'),
-                        'format': format_pref,
-                        'quality': quality,
-                        'duration': info.get('duration'),
-                        'status': 'completed',
-                        'filename': expected_filename,
-                        'actual_files': created_files,
-                        'thumbnail_url': thumbnail_url,  # ADDED
-                        'size': file_size  # ADDED - file size in bytes
-                    })
-                    
                 # Handle transcription if requested
                 if kwargs.get('transcribe', False) and results['downloads']:
-                    print("Transcription requested...")
                     from app.utils.transcription import transcribe_audio, is_transcription_available
 
-                    if not is_transcription_available():
-                        print("Warning: Transcription not available (Whisper not installed)")
+                    if not is_transcription_available() and not any(d.get('captions') for d in results['downloads']):
+                        log.warning('Transcription requested but Whisper is not installed')
                         results['transcription_warning'] = 'Whisper not installed. Install with: pip install openai-whisper'
                     else:
                         for download in results['downloads']:
@@ -414,20 +786,29 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
                             if filename:
                                 file_path = os.path.join(output_dir, filename)
                                 if os.path.exists(file_path):
-                                    print(f"Transcribing: {filename}")
-                                    transcript_result = transcribe_audio(file_path, language=kwargs.get('subtitle_language', 'en'))
+                                    log.info('Transcribing %s', filename)
+                                    with timer.span('transcribe'):
+                                        transcript_result = transcribe_audio(
+                                            file_path,
+                                            language=kwargs.get('subtitle_language', 'en'),
+                                            model=kwargs.get('transcription_model'),
+                                            source_id=download.get('video_id'),
+                                            captions=download.get('captions'),
+                                            duration=download.get('duration'),
+                                        )
                                     download['transcription'] = transcript_result
                                 else:
-                                    print(f"File not found for transcription: {file_path}")
+                                    log.warning('File not found for transcription: %s', file_path)
 
                 # Only set success to True if we have downloads and no errors
                 if results['downloads'] and not results['errors']:
                     results['success'] = True
-                    print("All downloads completed successfully!")
+                    log.info('Download completed')
                     
             except yt_dlp.utils.DownloadError as e:
                 error_msg = str(e)
-                print(f"yt-dlp DownloadError: {error_msg}")
+                # yt-dlp has already logged the error itself
+                log.debug('DownloadError: %s', error_msg)
                 
                 if "blocked it in your country" in error_msg:
                     results['errors'].append({
@@ -450,21 +831,93 @@ def download_and_process(url: str, output_dir: str, **kwargs) -> Dict[str, Any]:
                         'details': error_msg
                     })
                 
+    except yt_dlp.utils.DownloadCancelled:
+        # Cancellation is not a failure; let the job runner record it
+        raise
+
     except Exception as e:
         error_msg = str(e)
-        print(f"Unexpected error: {error_msg}")
+        log.exception('Unexpected error while downloading %s', url)
         results['errors'].append({
             'error': 'Process failed',
             'details': error_msg
         })
 
+    finally:
+        # Published files are gone from it; what is left are .part files and intermediates.
+        # A deferred job's streams stay for finish_download
+        if not results.get('postprocess'):
+            discard(staging)
+
     # Add summary to results
-    results['summary'] = {
+    results['summary'] = _summary(results)
+    results['timings'] = timer.spans()
+
+    log.debug('Results: %r', results['summary'])
+    return results
+
+def finish_download(state: Dict[str, Any], cancel_event=None) -> Dict[str, Any]:
+    """
+    Second stage of a download_and_process call made with
+    defer_postprocessing: run the merge, fixups and conversions on the
+    streams it left in staging, then publish the files. ``state`` is its
+    results['postprocess']. Returns results of the same shape, with the
+    timings continuing those of the first stage.
+    """
+    timer = StageTimer()
+    offset = time.time() - state['started_at']
+    # The first stage's files are still candidates: without a merge, the streams are the result
+    collector = ArtifactCollector(state['staging'], state['files'])
+    results = {'success': False, 'downloads': [], 'errors': [], 'skipped': []}
+    ydl_opts = dict(
+        state['ydl_opts'],
+        logger=YtDlpLogger(),
+        postprocessor_hooks=[timer.postprocessor_hook, collector.postprocessor_hook],
+    )
+
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled('Job cancelled')
+
+    try:
+        check_cancelled()
+        info = state['info']
+        # yt-dlp keeps only what differs from the video's info in requested_downloads
+        download = dict(info, **info['requested_downloads'][0])
+        del download['requested_downloads']
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            download['__postprocessors'] = [get_postprocessor(name)(ydl) for name in state['postprocessors']]
+            info['requested_downloads'] = [ydl.post_process(state['filename'], download, state['files_to_move'])]
+
+        # ffmpeg cannot be stopped halfway, but nothing is published for a job cancelled meanwhile
+        check_cancelled()
+
+        _finish_single(info, results, timer, collector, state['context'])
+        if results['downloads']:
+            results['success'] = True
+            log.info('Post-processing completed')
+
+    except yt_dlp.utils.DownloadCancelled:
+        raise
+
+    except Exception as e:
+        log.error('Post-processing failed: %s', e)
+        results['errors'].append({
+            'error': 'Post-processing failed',
+            'details': str(e)
+        })
+
+    finally:
+        discard(state['staging'])
+
+    results['summary'] = _summary(results)
+    results['timings'] = [dict(span, offset=round(span['offset'] + offset, 4)) for span in timer.spans()]
+    return results
+
+def _summary(results: Dict[str, Any]) -> Dict[str, int]:
+    return {
         'total_attempted': len(results['downloads']) + len(results['errors']) + len(results['skipped']),
         'successful': len(results['downloads']),
         'failed': len(results['errors']),
         'skipped': len(results['skipped'])
     }
-
-    print(f"Final results: {results}")
-    return results
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""
+Format Planner Module
+Picks the formats to download and the processing after them, preferring a
+direct download, then a stream copy (merge or remux), and re-encoding only
+when nothing else yields the requested container
+"""
+from typing import Any, Dict, List, Optional
+
+VIDEO_CONTAINERS = ('mp4', 'mkv', 'webm', 'avi')
+AUDIO_CONTAINERS = ('mp3', 'aac', 'wav')
+
+# Codecs each container takes by stream copy (None: any). Codec names are the
+# part of yt-dlp's vcodec/acodec before the first dot (avc1.64001F -> avc1)
+CONTAINER_CODECS = {
+    'mp4': {
+        'video': ('avc1', 'h264', 'hev1', 'hvc1', 'h265', 'av01', 'vp09', 'vp9'),
+        'audio': ('mp4a', 'aac', 'mp3', 'opus', 'ac-3', 'ec-3'),
+    },
+    'mkv': {'video': None, 'audio': None},
+    'webm': {'video': ('vp8', 'vp9', 'vp09', 'av01'), 'audio': ('opus', 'vorbis')},
+    'avi': {'video': ('avc1', 'h264', 'mp4v', 'mpeg4', 'xvid', 'divx', 'mjpeg'), 'audio': ('mp3', 'mp4a', 'aac', 'ac-3')},
+    # yt-dlp's FFmpegExtractAudio copies the stream when its codec already is the target
+    'mp3': {'audio': ('mp3',)},
+    'aac': {'audio': ('mp4a', 'aac')},
+    'wav': {'audio': ()},
+}
+
+# Codecs preferred over other copyable ones, for players' sake: an mp4 of
+# H.264 and AAC plays nearly everywhere, one of VP9 and Opus does not
+NATIVE_CODECS = {
+    'mp4': {'video': ('avc1', 'h264', 'hev1', 'hvc1', 'h265', 'av01'), 'audio': ('mp4a', 'aac')},
+    'avi': {'video': ('avc1', 'h264', 'mp4v', 'mpeg4', 'xvid', 'divx'), 'audio': ('mp3',)},
+}
+
+# File extensions that already are each container
+CONTAINER_EXTENSIONS = {'mp4': ('mp4', 'm4v'), 'mkv': ('mkv',), 'webm': ('webm',), 'avi': ('avi',)}
+
+HEIGHT_LIMITS = {'1080p': 1080, '720p': 720, '480p': 480}
+AUDIO_BITRATES = ('320', '256', '192', '128')
+
+# Rough CPU seconds per second of media for each kind of step; a video
+# transcode scales with the frame size relative to 1080p
+CPU_SECONDS_PER_MEDIA_SECOND = {
+    'download': 0.0,
+    'merge': 0.002,
+    'remux': 0.002,
+    'copy_audio': 0.002,
+    'decode_audio': 0.005,
+    'transcode_audio': 0.03,
+    'transcode_video': 1.0,
+}
+
+# Steps that re-encode
+TRANSCODE_STEPS = ('decode_audio', 'transcode_audio', 'transcode_video')
+
+class PlanError(Exception):
+    """The formats hold nothing the requested container can be made from."""
+
+def fallback_options(container: str, quality: str = 'best') -> Dict[str, Any]:
+    """
+    yt-dlp options for when the formats are not known up front (playlists
+    downloaded in one go): format selectors that prefer streams the
+    container takes as they are.
+    """
+    if container in AUDIO_CONTAINERS:
+        codecs = {'mp3': '[acodec=mp3]', 'aac': '[acodec^=mp4a]', 'wav': ''}[container]
+        selector = f'bestaudio{codecs}/bestaudio/best' if codecs else 'bestaudio/best'
+        return {'format': selector, 'postprocessors': [_extract_audio(container, quality)]}
+
+    limit = f'[height<={HEIGHT_LIMITS[quality]}]' if quality in HEIGHT_LIMITS else ''
+    preferred = {
+        'mp4': f'bestvideo{limit}[ext=mp4]+bestaudio[ext=m4a]/',
+        'webm': f'bestvideo{limit}[ext=webm]+bestaudio[ext=webm]/',
+        'avi': f'bestvideo{limit}[vcodec^=avc1]+bestaudio[acodec^=mp4a]/',
+    }.get(container, '')
+    return {
+        'format': f'{preferred}bestvideo{limit}+bestaudio/best{limit}',
+        'merge_output_format': container,
+    }
+
+def plan_formats(info: Dict[str, Any], container: str, quality: str = 'best') -> Dict[str, Any]:
+    """
+    The cheapest way to get ``info``'s video in ``container`` at the requested quality.
+
+    Returns the plan: the chosen formats, its steps, whether it transcodes,
+    an estimate of the CPU seconds it costs, and under 'options' the yt-dlp
+    options that carry it out ('format', 'merge_output_format', 'postprocessors').
+    Raises PlanError for a video container when no format has video.
+    """
+    formats = [f for f in info.get('formats') or [] if f.get('format_id') and _is_media(f)]
+    if not formats:
+        # Nothing to inspect; the codecs, and so the cost, are unknown
+        plan = _plan('unplanned', ['download'], fallback_options(container, quality), 'no format list to plan from')
+        plan['transcode'] = None
+    elif container in AUDIO_CONTAINERS:
+        plan = _plan_audio(formats, container, quality)
+    else:
+        plan = _plan_video(formats, container, quality)
+    plan['container'] = container
+    cpu_factor = plan.pop('_cpu_factor')
+    duration = info.get('duration')
+    plan['estimated_cpu_seconds'] = round(cpu_factor * duration, 1) if duration else None
+    return plan
+
+def _plan_video(formats, container, quality):
+    videos = [f for f in formats if _has_video(f)]
+    if not videos:
+        raise PlanError(f'no video stream to make {container} from')
+    limit = HEIGHT_LIMITS.get(quality)
+    if limit and all(f.get('height') and f['height'] > limit for f in videos):
+        # Nothing at or under the requested height: the smallest video there is comes closest
+        lowest = min(f['height'] for f in videos)
+        plan = _plan_video_streams(formats, container, lowest)
+        plan['note'] = '; '.join(filter(None, [f'no video at {limit}p or below, chose {lowest}p', plan['note']]))
+        return plan
+    return _plan_video_streams(formats, container, limit)
+
+def _plan_video_streams(formats, container, limit):
+    """The plan for the best video at most ``limit`` high; at least one video format fits it."""
+    fits = [f for f in formats if not limit or not f.get('height') or f['height'] <= limit]
+    video_only = [f for f in fits if _has_video(f) and not _has_audio(f)]
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    combined = [f for f in fits if _has_video(f) and _has_audio(f)]
+
+    def native_first(rank, kind):
+        return lambda f: (_native(f, container, kind), rank(f))
+
+    candidates = []
+    copy_video = _best([f for f in video_only if _copyable(f, container, 'video')], native_first(_video_rank, 'video'))
+    copy_audio = _best([f for f in audio_only if _copyable(f, container, 'audio')], native_first(_audio_rank, 'audio'))
+    if copy_video and copy_audio:
+        candidates.append((_video_rank(copy_video), 1, [copy_video, copy_audio], ['download', 'merge']))
+    elif copy_video and not audio_only and not combined:
+        # Video without sound is all the site has
+        candidates.append((_video_rank(copy_video), 1, [copy_video], _container_steps(copy_video, container)))
+    copy_combined = _best(
+        [f for f in combined if _copyable(f, container, 'video') and _copyable(f, container, 'audio')], _video_rank
+    )
+    if copy_combined:
+        steps = _container_steps(copy_combined, container)
+        candidates.append((_video_rank(copy_combined), len(steps) - 1, [copy_combined], steps))
+
+    if candidates:
+        # Best quality first; between equal qualities, fewer steps
+        _, _, chosen, steps = max(candidates, key=lambda c: (c[0], -c[1]))
+        best_any = _best(video_only + combined, _video_rank)
+        note = None
+        if best_any and _video_rank(best_any)[0] > _video_rank(chosen[0])[0]:
+            note = f"{best_any.get('height')}p only comes in codecs less suited to {container}; " \
+                   f"chose {chosen[0].get('height')}p without re-encoding"
+        options = {'format': '+'.join(f['format_id'] for f in chosen), 'merge_output_format': container}
+        if 'remux' in steps:
+            options['postprocessors'] = [{'key': 'FFmpegVideoRemuxer', 'preferedformat': container}]
+        strategy = 'direct' if steps == ['download'] else steps[-1]
+        return _plan(strategy, steps, options, note, chosen)
+
+    # No stream of the right codecs: take the best there is and convert it
+    video = _best(video_only, _video_rank)
+    audio = _best(audio_only, _audio_rank)
+    chosen = [video, audio] if video and audio else [_best(combined or video_only, _video_rank)]
+    options = {
+        'format': '+'.join(f['format_id'] for f in chosen),
+        # Streams that do not fit the target container are joined in Matroska first
+        'merge_output_format': 'mkv',
+        'postprocessors': [{'key': 'FFmpegVideoConvertor', 'preferedformat': container}],
+    }
+    steps = ['download', 'merge', 'transcode_video'] if len(chosen) > 1 else ['download', 'transcode_video']
+    height = _video_rank(chosen[0])[0] or 1080
+    plan = _plan('transcode', steps, options, f'no {container}-compatible streams', chosen)
+    # Encoding cost grows with the number of pixels
+    plan['_cpu_factor'] += CPU_SECONDS_PER_MEDIA_SECOND['transcode_video'] * ((height / 1080) ** 2 - 1)
+    return plan
+
+def _plan_audio(formats, container, quality):
+    audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    pool = audio_only or [f for f in formats if _has_audio(f)]
+    copy = _best([f for f in pool if _copyable(f, container, 'audio')], _audio_rank)
+    if copy:
+        chosen, step, strategy = copy, 'copy_audio', 'copy'
+        note = 'source already has the target codec; the requested bitrate does not apply' \
+            if container != 'wav' and quality in AUDIO_BITRATES else None
+    else:
+        chosen = _best(pool, _audio_rank)
+        step = 'decode_audio' if container == 'wav' else 'transcode_audio'
+        strategy, note = 'transcode', None
+    options = {'format': chosen['format_id'], 'postprocessors': [_extract_audio(container, quality)]}
+    return _plan(strategy, ['download', step], options, note, [chosen])
+
+def _plan(strategy, steps, options, note=None, chosen=()):
+    return {
+        'strategy': strategy,
+        'steps': steps,
+        'transcode': any(step in TRANSCODE_STEPS for step in steps),
+        'formats': [_describe(f) for f in chosen],
+        'note': note,
+        'options': options,
+        '_cpu_factor': sum(CPU_SECONDS_PER_MEDIA_SECOND[step] for step in steps),
+    }
+
+def _extract_audio(container, quality):
+    postprocessor = {'key': 'FFmpegExtractAudio', 'preferredcodec': container}
+    if container != 'wav':
+        postprocessor['preferredquality'] = quality if quality in AUDIO_BITRATES else '192'
+    return postprocessor
+
+def _container_steps(fmt, container):
+    """A single file needs a remux unless it already is the container."""
+    if (fmt.get('ext') or '').lower() in CONTAINER_EXTENSIONS[container]:
+        return ['download']
+    return ['download', 'remux']
+
+def _codec(value):
+    return (value or '').split('.')[0].lower()
+
+def _has_video(fmt):
+    # Unknown codecs (None) are treated as present, as yt-dlp does
+    return fmt.get('vcodec') != 'none'
+
+def _has_audio(fmt):
+    return fmt.get('acodec') != 'none'
+
+def _is_media(fmt):
+    # Storyboards and other image formats have neither
+    return (_has_video(fmt) or _has_audio(fmt)) and fmt.get('ext') != 'mhtml'
+
+def _copyable(fmt, container, kind):
+    """Whether ``fmt``'s ``kind`` stream goes into ``container`` without re-encoding."""
+    allowed = CONTAINER_CODECS[container][kind]
+    if allowed is None:
+        return True
+    codec = _codec(fmt.get('vcodec' if kind == 'video' else 'acodec'))
+    if not codec:
+        # Codec not reported: trust a file that already is the container
+        return (fmt.get('ext') or '').lower() in CONTAINER_EXTENSIONS.get(container, (container,))
+    return codec in allowed
+
+def _native(fmt, container, kind):
+    """Whether ``fmt``'s ``kind`` stream is one ``container`` is usually played with."""
+    native = NATIVE_CODECS.get(container)
+    if native is None:
+        return True
+    return _codec(fmt.get('vcodec' if kind == 'video' else 'acodec')) in native[kind]
+
+def _video_rank(fmt):
+    return (fmt.get('height') or 0, fmt.get('fps') or 0, fmt.get('tbr') or 0)
+
+def _audio_rank(fmt):
+    return (fmt.get('abr') or fmt.get('tbr') or 0, fmt.get('asr') or 0)
+
+def _best(formats: List[Dict[str, Any]], rank) -> Optional[Dict[str, Any]]:
+    return max(formats, key=rank) if formats else None
+
+def _describe(fmt):
+    return {
+        'format_id': fmt['format_id'],
+        'ext': fmt.get('ext'),
+        'vcodec': fmt.get('vcodec'),
+        'acodec': fmt.get('acodec'),
+        'height': fmt.get('height'),
+    }
@@ -0,0 +1,212 @@
+"""
+Job Logging Module
+Leveled logging with per-job context, and a ring buffer of each job's recent lines
+"""
+import logging
+import sys
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+LOGGER_NAME = 'ytd'
+CONSOLE_FORMAT = '%(asctime)s %(levelname)-7s [%(job)s] %(name)s: %(message)s'
+
+_current_job = ContextVar('job_id', default=None)
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app's hierarchy, e.g. get_logger('downloader') -> 'ytd.downloader'."""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+def current_job_id() -> Optional[str]:
+    return _current_job.get()
+
+@contextmanager
+def job_context(job_id: str):
+    """Attribute everything logged on this thread to ``job_id`` until the block exits."""
+    token = _current_job.set(job_id)
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+class JobContextFilter(logging.Filter):
+    """Stamps records with the job they belong to (``job_id``, and ``job`` for formatting)."""
+
+    def filter(self, record):
+        if getattr(record, 'job_id', None) is None:
+            record.job_id = _current_job.get()
+        record.job = record.job_id or '-'
+        return True
+
+class JobLogBuffer(logging.Handler):
+    """
+    Keeps the last ``lines_per_job`` lines of each job for the status API.
+
+    Only records that carry a job id are kept, and only the most recently
+    active ``max_jobs`` jobs; older buffers are dropped whole. The message is
+    formatted once, when the record is stored.
+    """
+
+    def __init__(self, lines_per_job=200, max_jobs=1000, level=logging.INFO):
+        super().__init__(level)
+        self.lines_per_job = lines_per_job
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._buffer_lock = Lock()
+        self.addFilter(JobContextFilter())
+
+    def emit(self, record):
+        if record.job_id is None:
+            return
+        try:
+            message = record.getMessage()
+        except Exception:
+            self.handleError(record)
+            return
+        if record.exc_info:
+            message = f'{message}\n{logging.Formatter().formatException(record.exc_info)}'
+        self.append(record.job_id, {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': message,
+        })
+
+    def append(self, job_id: str, line: Dict[str, Any]):
+        with self._buffer_lock:
+            lines = self._jobs.get(job_id)
+            if lines is None:
+                lines = self._jobs[job_id] = deque(maxlen=self.lines_per_job)
+                while len(self._jobs) > self.max_jobs:
+                    self._jobs.popitem(last=False)
+            else:
+                self._jobs.move_to_end(job_id)
+            lines.append(line)
+
+    def lines(self, job_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._buffer_lock:
+            lines = list(self._jobs.get(job_id, ()))
+        return lines[-limit:] if limit else lines
+
+    def discard(self, job_id: str):
+        with self._buffer_lock:
+            self._jobs.pop(job_id, None)
+
+class YtDlpLogger:
+    """
+    Routes yt-dlp's output through our logging, attributed to the current job.
+
+    yt-dlp sends its screen output (including progress lines, unless
+    ``noprogress`` is set) to ``debug``; those stay at DEBUG so a normal run
+    only logs yt-dlp's warnings and errors. ``quiet`` logs those at DEBUG
+    too, for extractions whose caller reports the failure itself (yt-dlp
+    ignores ``no_warnings`` once a logger is set).
+    """
+
+    def __init__(self, job_id: Optional[str] = None, quiet: bool = False):
+        self._logger = get_logger('yt_dlp')
+        self._warning_level = logging.DEBUG if quiet else logging.WARNING
+        self._error_level = logging.DEBUG if quiet else logging.ERROR
+        # yt-dlp's concurrent fragment threads do not inherit the job context
+        self._extra = {'job_id': job_id or current_job_id()}
+
+    def debug(self, message):
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(message, extra=self._extra)
+
+    def info(self, message):
+        self._logger.info(message, extra=self._extra)
+
+    def warning(self, message):
+        if self._logger.isEnabledFor(self._warning_level):
+            self._logger.log(self._warning_level, message, extra=self._extra)
+
+    def error(self, message):
+        if self._logger.isEnabledFor(self._error_level):
+            self._logger.log(self._error_level, message, extra=self._extra)
+
+class RelayHandler(logging.Handler):
+    """Sends records from a worker process to the server, which logs them as its own."""
+
+    def __init__(self, send):
+        super().__init__()
+        self._send = send
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message = f'{message}\n{logging.Formatter().formatException(record.exc_info)}'
+            self._send({
+                'name': record.name,
+                'levelno': record.levelno,
+                'levelname': record.levelname,
+                'msg': message,
+                'created': record.created,
+                'job_id': getattr(record, 'job_id', None),
+            })
+        except Exception:
+            self.handleError(record)
+
+def relay(fields: Dict[str, Any]):
+    """Log a record received from a worker process through the server's handlers."""
+    record = logging.makeLogRecord(fields)
+    logger = logging.getLogger(record.name)
+    if logger.isEnabledFor(record.levelno):
+        logger.handle(record)
+
+job_logs = JobLogBuffer()
+
+def _level(value, default):
+    if isinstance(value, int):
+        return value
+    return logging.getLevelName(str(value or default).upper())
+
+def configure(level='INFO', job_level='INFO', lines_per_job=200, stream=None):
+    """
+    Console output at ``level`` and per-job buffers at ``job_level``.
+
+    The app logger's own level is the lower of the two, so a call below
+    both returns before the message is formatted.
+    """
+    level = _level(level, 'INFO')
+    job_level = _level(job_level, 'INFO')
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(min(level, job_level))
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    console = logging.StreamHandler(stream or sys.stderr)
+    console.setLevel(level)
+    console.addFilter(JobContextFilter())
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    logger.addHandler(console)
+
+    job_logs.setLevel(job_level)
+    job_logs.lines_per_job = lines_per_job
+    logger.addHandler(job_logs)
+
+def settings() -> Dict[str, Any]:
+    """Levels a worker process needs to gate its records the same way."""
+    return {'level': logging.getLogger(LOGGER_NAME).getEffectiveLevel()}
+
+def configure_worker(level, send):
+    """In a worker process: relay every enabled record to the server through ``send``."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(RelayHandler(send))
+
+def init_app(app):
+    """Configure logging from the LOG_LEVEL, JOB_LOG_LEVEL and JOB_LOG_LINES settings."""
+    configure(
+        level=app.config.get('LOG_LEVEL', 'INFO'),
+        job_level=app.config.get('JOB_LOG_LEVEL', 'INFO'),
+        lines_per_job=app.config.get('JOB_LOG_LINES', 200),
+    )
@@ -0,0 +1,378 @@
+"""
+Long Media Transcription Module
+Splits long recordings at pauses and transcribes the pieces in parallel worker processes
+"""
+import itertools
+import multiprocessing
+import os
+import subprocess
+import tempfile
+from collections import deque
+from multiprocessing.connection import wait
+from threading import Condition, Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.utils import joblog
+from app.utils.whisper_models import whisper_models
+
+# Whisper's input format: 16 kHz mono, stored as 16-bit PCM between the processes
+SAMPLE_RATE = 16000
+
+# Names of chunk worker processes start with this; see executors.in_worker_process()
+PROCESS_NAME_PREFIX = 'transcription-process'
+
+# Voice activity detection: 30 ms frames, silent when within SILENCE_MARGIN_DB
+# of the quietest tenth of the recording, and at least that far below its median
+# (a recording with few pauses has a quietest tenth that is mostly speech)
+FRAME_SECONDS = 0.03
+SILENCE_MARGIN_DB = 8.0
+
+class ChunkFailed(Exception):
+    """A chunk could not be transcribed, or its worker process died."""
+
+def media_duration(path: str) -> Optional[float]:
+    """Duration of a media file in seconds, from ffprobe; None if it cannot be read."""
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            capture_output=True, text=True, timeout=30, check=True,
+        ).stdout
+        return float(output.strip())
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+def extract_pcm(path: str) -> str:
+    """
+    Decode the audio of ``path`` once into a temporary raw PCM file that the
+    worker processes memory-map. The caller removes the file.
+    """
+    fd, pcm_path = tempfile.mkstemp(suffix='.pcm', prefix='transcribe-')
+    os.close(fd)
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', path, '-vn',
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(SAMPLE_RATE), pcm_path,
+    ]
+    try:
+        subprocess.run(command, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        os.remove(pcm_path)
+        raise RuntimeError(f'Could not decode audio: {e.stderr.strip()[-500:]}') from e
+    except OSError:
+        os.remove(pcm_path)
+        raise
+    return pcm_path
+
+def frame_energy(samples) -> 'numpy.ndarray':
+    """Loudness of each FRAME_SECONDS frame of int16 ``samples`` in dBFS."""
+    import numpy as np
+
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    frames = len(samples) // frame
+    energy = np.empty(frames, dtype=np.float32)
+    # A block at a time, so a two hour file is never converted to floats at once
+    block = 20000
+    for first in range(0, frames, block):
+        last = min(first + block, frames)
+        chunk = np.asarray(samples[first * frame:last * frame], dtype=np.float32).reshape(-1, frame) / 32768.0
+        energy[first:last] = 10 * np.log10(np.mean(chunk * chunk, axis=1) + 1e-10)
+    return energy
+
+def _quietest_point(energy, silent) -> int:
+    """Middle of the longest pause in a window of frames, or its quietest frame if it has none."""
+    import numpy as np
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    starts, ends = edges[::2], edges[1::2]
+    if len(starts):
+        longest = int(np.argmax(ends - starts))
+        return int((starts[longest] + ends[longest]) // 2)
+    smoothed = np.convolve(energy, np.ones(10) / 10, mode='same')
+    return int(np.argmin(smoothed))
+
+def find_split_points(energy, target_seconds: float, search_seconds: float) -> List[int]:
+    """
+    Frame indexes to cut a recording at: about every ``target_seconds``, at
+    the longest pause within ``search_seconds`` either side, so no cut lands
+    in the middle of a word.
+    """
+    import numpy as np
+
+    if not len(energy):
+        return []
+    floor, median = np.percentile(energy, [10, 50])
+    silent = energy < min(floor + SILENCE_MARGIN_DB, median - SILENCE_MARGIN_DB)
+    target = max(int(target_seconds / FRAME_SECONDS), 1)
+    search = min(int(search_seconds / FRAME_SECONDS), target // 2)
+
+    points = []
+    start = 0
+    # The last piece may run up to target + search rather than leaving a sliver
+    while len(energy) - start > target + search:
+        low, high = start + target - search, start + target + search + 1
+        points.append(low + _quietest_point(energy[low:high], silent[low:high]))
+        start = points[-1]
+    return points
+
+def split_at_pauses(pcm_path: str, target_seconds: float, search_seconds: float = 30) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges of the pieces of a PCM file, cut at pauses."""
+    import numpy as np
+
+    samples = np.memmap(pcm_path, dtype=np.int16, mode='r')
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    cuts = [point * frame for point in find_split_points(frame_energy(samples), target_seconds, search_seconds)]
+    bounds = [0] + cuts + [len(samples)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def stitch(pieces: List[Tuple[float, Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Join the results of consecutive pieces, given as (offset seconds, result),
+    into one Whisper result with timestamps relative to the whole recording.
+    """
+    segments = []
+    for offset, result in pieces:
+        for segment in result.get('segments', []):
+            segment = dict(segment, id=len(segments))
+            segment['start'] = round(segment['start'] + offset, 3)
+            segment['end'] = round(segment['end'] + offset, 3)
+            if segment.get('words'):
+                segment['words'] = [
+                    dict(word, start=round(word['start'] + offset, 3), end=round(word['end'] + offset, 3))
+                    for word in segment['words']
+                ]
+            segments.append(segment)
+    return {
+        'text': ''.join(result.get('text', '') for _, result in pieces),
+        'segments': segments,
+        'language': next((result.get('language') for _, result in pieces if result.get('language')), None),
+    }
+
+def _run_task(task: Dict[str, Any]) -> Any:
+    """Transcribe (or detect the language of) one piece of a PCM file, inside a worker process."""
+    import numpy as np
+
+    samples = np.memmap(task['pcm_path'], dtype=np.int16, mode='r')[task['start']:task['end']]
+    audio = np.asarray(samples, dtype=np.float32) / 32768.0
+
+    with whisper_models.acquire(task['model']) as model:
+        if task['kind'] == 'detect':
+            import whisper
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels).to(model.device)
+            _, probs = model.detect_language(mel)
+            return max(probs, key=probs.get)
+        return model.transcribe(
+            audio,
+            language=task['language'],
+            fp16=False,  # Disable FP16 for CPU compatibility
+            verbose=None,
+        )
+
+def _worker_main(conn, settings):
+    """Entry point of a chunk worker process: run tasks sent over ``conn`` until told to stop."""
+    send_lock = Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    joblog.configure_worker(settings.get('log_level', 'INFO'), lambda record: send(('log', record)))
+    if settings.get('whisper_models'):
+        whisper_models.configure(**settings['whisper_models'])
+    if settings.get('threads'):
+        try:
+            import torch
+            # The processes split the cores between them instead of each using all
+            torch.set_num_threads(settings['threads'])
+        except ImportError:
+            pass
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] != 'run':
+            return
+        try:
+            send(('result', _run_task(message[1])))
+        except MemoryError:
+            send(('error', 'Transcription process ran out of memory'))
+            return
+        except Exception as e:
+            send(('error', str(e)))
+
+class _ChunkProcess:
+    """One chunk worker process and the server's end of its pipe."""
+
+    def __init__(self, ctx, name, settings):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, settings), name=name)
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, force=False):
+        if not force:
+            try:
+                self.conn.send(('stop',))
+            except (OSError, ValueError):
+                force = True
+        if force and self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=2)
+        self.conn.close()
+
+class ChunkPool:
+    """
+    Worker processes that transcribe the pieces of long recordings.
+
+    A file longer than ``long_media_seconds`` is decoded once to 16 kHz PCM,
+    cut at pauses into pieces of about ``chunk_seconds``, and the pieces are
+    spread over ``processes`` processes, each with its own warm model and a
+    share of the cores. Pieces of several files can be in flight at once;
+    they queue for the next free process.
+
+    Cancelling kills the processes still working for that file.
+    """
+
+    def __init__(self, processes: int = 1, chunk_seconds: float = 300, long_media_seconds: float = 1200,
+                 settings: Optional[Dict[str, Any]] = None):
+        self.processes = max(1, int(processes))
+        self.chunk_seconds = chunk_seconds
+        self.long_media_seconds = long_media_seconds
+        # Passed to each new process
+        self.settings = settings or {}
+        # Forking a threaded server is unsafe; spawn is also the only option on Windows
+        self._ctx = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._alive = 0
+        self._cond = Condition()
+        self._ids = itertools.count(1)
+        self.counters = {'chunks': 0, 'spawned': 0, 'crashed': 0, 'killed': 0}
+
+    def configure(self, processes=None, chunk_seconds=None, long_media_seconds=None, settings=None):
+        with self._cond:
+            if processes is not None:
+                self.processes = max(1, int(processes))
+            if chunk_seconds is not None:
+                self.chunk_seconds = chunk_seconds
+            if long_media_seconds is not None:
+                self.long_media_seconds = long_media_seconds
+            if settings is not None:
+                self.settings = settings
+
+    def should_split(self, path: str) -> bool:
+        """Whether ``path`` is long enough to be worth transcribing in pieces."""
+        if self.processes < 2:
+            return False
+        duration = media_duration(path)
+        return duration is not None and duration >= self.long_media_seconds
+
+    def map(self, tasks: List[Dict[str, Any]], on_result: Callable[[int, Any], None], cancel_event=None) -> bool:
+        """
+        Run ``tasks`` on the pool, calling ``on_result(index, result)`` on this
+        thread as each one finishes. Returns False if ``cancel_event`` was set
+        first; raises ChunkFailed if a task fails.
+        """
+        pending = deque(enumerate(tasks))
+        running = {}  # conn -> (process, task index)
+        try:
+            while pending or running:
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                while pending:
+                    # With nothing of ours running, wait a little for a free process
+                    worker = self._checkout(timeout=0 if running else 0.2)
+                    if worker is None:
+                        break
+                    index, task = pending.popleft()
+                    worker.conn.send(('run', task))
+                    running[worker.conn] = (worker, index)
+
+                for conn in wait(list(running), timeout=0.2):
+                    worker, index = running[conn]
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        del running[conn]
+                        worker.process.join(timeout=1)
+                        self._discard(worker, 'crashed')
+                        raise ChunkFailed(f'Transcription process exited with code {worker.process.exitcode}')
+                    if message[0] == 'log':
+                        # Logged on the transcription's thread, so it is attributed to its job
+                        joblog.relay(message[1])
+                        continue
+                    del running[conn]
+                    self._checkin(worker)
+                    if message[0] == 'error':
+                        raise ChunkFailed(message[1])
+                    with self._cond:
+                        self.counters['chunks'] += 1
+                    on_result(index, message[1])
+            return True
+        finally:
+            # Cancelled or failed: the rest of the file's pieces are not wanted
+            for worker, _ in running.values():
+                self._discard(worker, 'killed')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(
+                self.counters,
+                processes=self.processes,
+                alive=self._alive,
+                idle=len(self._idle),
+                chunk_seconds=self.chunk_seconds,
+                long_media_seconds=self.long_media_seconds,
+            )
+
+    def shutdown(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._alive -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def _checkout(self, timeout):
+        with self._cond:
+            while True:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.process.is_alive():
+                        return worker
+                    self._alive -= 1
+                if self._alive < self.processes:
+                    self._alive += 1
+                    self.counters['spawned'] += 1
+                    name = f'{PROCESS_NAME_PREFIX}-{next(self._ids)}'
+                    break
+                if timeout <= 0 or not self._cond.wait(timeout):
+                    return None
+                timeout = 0
+        try:
+            return _ChunkProcess(self._ctx, name, self.settings)
+        except BaseException:
+            with self._cond:
+                self._alive -= 1
+                self._cond.notify_all()
+            raise
+
+    def _checkin(self, worker):
+        with self._cond:
+            if self._alive > self.processes:
+                # The pool was shrunk while this process was busy
+                self._alive -= 1
+                retire = True
+            else:
+                self._idle.append(worker)
+                retire = False
+            self._cond.notify_all()
+        if retire:
+            worker.stop()
+
+    def _discard(self, worker, reason):
+        with self._cond:
+            self._alive -= 1
+            self.counters[reason] += 1
+            self._cond.notify_all()
+        worker.stop(force=True)
+
+chunk_pool = ChunkPool()
@@ -0,0 +1,249 @@
+"""
+Metadata Cache Module
+Caches yt-dlp info dicts so previews and downloads share one extraction
+"""
+import json
+import time
+from collections import OrderedDict
+from threading import Lock, Event
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+# Query parameters that never change what a URL points to
+TRACKING_PARAMS = {'feature', 'si', 'pp', 'ab_channel', 'fbclid', 'gclid'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata_cache (
+    key TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_metadata_cache_fetched_at ON metadata_cache(fetched_at);
+"""
+
+def normalize_url(url: str) -> str:
+    """
+    Reduce equivalent video URLs to one cache key.
+
+    youtu.be/<id>, /shorts/<id> and m./www. hosts all map to the canonical
+    youtube.com/watch?v=<id> form; tracking parameters and fragments are dropped.
+    """
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or 'https').lower()
+    if scheme == 'http':
+        scheme = 'https'
+    host = (parsed.hostname or '').lower()
+    path = parsed.path
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
+    ]
+
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+
+    if host == 'youtu.be' and path.strip('/'):
+        query.insert(0, ('v', path.strip('/')))
+        host, path = 'youtube.com', '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query.insert(0, ('v', path[len('/shorts/'):].strip('/')))
+        path = '/watch'
+
+    if host in ('youtube.com', 'music.youtube.com'):
+        # Only the video and playlist ids select content; 't', 'index' etc. do not
+        query = [(key, value) for key, value in query if key in ('v', 'list')]
+
+    if parsed.port:
+        host = f'{host}:{parsed.port}'
+
+    return urlunparse((scheme, host, path, '', urlencode(sorted(query)), ''))
+
+class _Flight:
+    """An extraction in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+class MetadataCache:
+    """
+    LRU cache of sanitized info dicts keyed by normalized URL.
+
+    Entries are stored as JSON so every caller gets its own copy (yt-dlp
+    mutates info dicts while downloading). An optional SQLite tier keeps
+    entries across restarts. Concurrent misses for the same key are merged
+    into a single extraction.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 900, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (fetched_at, json)
+        self._flights = {}
+        self._lock = Lock()
+        self.db_path = None
+        self._conn = None
+        self._conn_lock = Lock()
+        self.counters = {'hits': 0, 'sqlite_hits': 0, 'misses': 0, 'coalesced': 0}
+        if db_path:
+            self.enable_sqlite(db_path)
+
+    def enable_sqlite(self, db_path: str):
+        from app.database.db import connect
+
+        conn = connect(db_path, check_same_thread=False)
+        conn.executescript(SCHEMA)
+        with self._conn_lock:
+            self.db_path = db_path
+            self._conn = conn
+
+    def configure(self, max_entries: int, ttl: float, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if db_path:
+            self.enable_sqlite(db_path)
+
+    def settings(self) -> Dict[str, Any]:
+        """What a worker process needs to share this cache: through its SQLite tier, if enabled."""
+        return {'max_entries': self.max_entries, 'ttl': self.ttl, 'db_path': self.db_path}
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return a fresh copy of the cached info dict, or None."""
+        key = normalize_url(url)
+        with self._lock:
+            data = self._get_memory(key)
+            if data is not None:
+                self.counters['hits'] += 1
+                return json.loads(data)
+
+        row = self._get_sqlite(key)
+        if row is not None:
+            fetched_at, data = row
+            with self._lock:
+                self.counters['sqlite_hits'] += 1
+                self._put_memory(key, data, fetched_at)
+            return json.loads(data)
+        return None
+
+    def put(self, url: str, info: Dict[str, Any]):
+        key = normalize_url(url)
+        data = json.dumps(info)
+        with self._lock:
+            self._put_memory(key, data)
+        self._put_sqlite(key, data)
+
+    def get_or_extract(self, url: str, extract: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Return the cached info dict for ``url`` or run ``extract(url)`` once.
+        ``extract`` must return a JSON-serialisable (sanitized) info dict.
+        """
+        info = self.get(url)
+        if info is not None:
+            return info
+
+        key = normalize_url(url)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.counters['misses'] += 1
+            else:
+                self.counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return json.loads(flight.result)
+
+        try:
+            info = extract(url)
+            flight.result = json.dumps(info)
+            with self._lock:
+                self._put_memory(key, flight.result)
+            self._put_sqlite(key, flight.result)
+            return info
+        except Exception as e:
+            # Failures are not cached; the next request retries
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self._conn_lock:
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute('DELETE FROM metadata_cache')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+        stats['sqlite'] = self._conn is not None
+        return stats
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put_memory(self, key, data, fetched_at=None):
+        self._entries[key] = (fetched_at or time.time(), data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_sqlite(self, key):
+        with self._conn_lock:
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                'SELECT fetched_at, info FROM metadata_cache WHERE key = ? AND fetched_at >= ?',
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return (row['fetched_at'], row['info']) if row else None
+
+    def _put_sqlite(self, key, data):
+        with self._conn_lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO metadata_cache (key, info, fetched_at) VALUES (?, ?, ?)',
+                    (key, data, time.time())
+                )
+                # Expired rows are useless; prune them while we hold the writer
+                self._conn.execute(
+                    'DELETE FROM metadata_cache WHERE fetched_at < ?',
+                    (time.time() - self.ttl,)
+                )
+
+metadata_cache = MetadataCache()
+
+def init_app(app):
+    """
+    Apply the METADATA_CACHE_* settings to the shared cache. Downloads in
+    worker processes (DOWNLOAD_BACKEND=process) only see what previews
+    extracted through the SQLite tier, so it is always on for them.
+    """
+    from app.database.db import database_path
+
+    shared = app.config.get('METADATA_CACHE_SQLITE', False) or app.config.get('DOWNLOAD_BACKEND', 'process') == 'process'
+    metadata_cache.configure(
+        app.config.get('METADATA_CACHE_SIZE', 256),
+        app.config.get('METADATA_CACHE_TTL', 900),
+        database_path(app) if shared else None,
+    )
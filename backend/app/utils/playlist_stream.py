@@ -0,0 +1,205 @@
+"""
+Playlist Streaming Module
+Lists playlist entries page by page from a flat extraction, resolving
+full per-entry details only when they are asked for
+"""
+import time
+import yt_dlp
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from yt_dlp.utils import LazyList
+from app.utils.joblog import YtDlpLogger
+from app.utils.metadata_cache import metadata_cache, normalize_url
+
+FLAT_YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'logger': YtDlpLogger(quiet=True),
+    'extract_flat': 'in_playlist',
+    'skip_download': True,
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class PlaylistSession:
+    """
+    A flat playlist listing that is consumed lazily.
+
+    The extractor's entry generator is wrapped in a LazyList, so asking for
+    page N only pulls the upstream pages needed to reach it. The YoutubeDL
+    instance stays open for as long as the generator may still need it.
+    """
+
+    def __init__(self, ydl, info):
+        self.ydl = ydl
+        self.title = info.get('title')
+        self.playlist_id = info.get('id')
+        self.total = info.get('playlist_count')
+        self.created_at = time.time()
+        self._entries = LazyList(info.get('entries') or [])
+        self._lock = Lock()
+
+    def page(self, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Returns (entries, has_more) for ``limit`` entries starting at ``offset``."""
+        with self._lock:
+            # Fetch one extra entry to learn whether another page exists
+            window = self._entries[offset:offset + limit + 1]
+            if len(window) <= limit and self.total is None:
+                self.total = offset + len(window)
+        return [entry for entry in window[:limit] if entry], len(window) > limit
+
+    def close(self):
+        self.ydl.close()
+
+class PlaylistSessions:
+    """Small LRU of open playlist sessions keyed by normalized URL."""
+
+    def __init__(self, max_sessions: int = 32, ttl: float = 900):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+    def open(self, url: str) -> Tuple[Optional[PlaylistSession], Optional[Dict[str, Any]]]:
+        """
+        Returns (session, None) for playlists, or (None, info) for single videos.
+        Single-video info is processed, sanitized and stored in the metadata cache.
+        """
+        key = normalize_url(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and time.time() - session.created_at <= self.ttl:
+                self._sessions.move_to_end(key)
+                return session, None
+
+        cached = metadata_cache.get(url)
+        if cached is not None and 'entries' not in cached:
+            return None, cached
+
+        ydl = yt_dlp.YoutubeDL(FLAT_YDL_OPTS)
+        try:
+            info = ydl.extract_info(url, download=False, process=False)
+            if info is None:
+                raise Exception('Could not retrieve video information')
+
+            if info.get('_type') != 'playlist':
+                # A plain video (or a redirect): resolve it fully, it is one request either way
+                if info.get('_type') in ('url', 'url_transparent'):
+                    info = ydl.extract_info(url, download=False)
+                else:
+                    info = ydl.process_ie_result(info, download=False)
+                info = ydl.sanitize_info(info)
+                metadata_cache.put(url, info)
+                ydl.close()
+                return None, info
+        except Exception:
+            ydl.close()
+            raise
+
+        session = PlaylistSession(ydl, info)
+        with self._lock:
+            old = self._sessions.pop(key, None)
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                evicted.close()
+        if old is not None:
+            old.close()
+        return session, None
+
+playlist_sessions = PlaylistSessions()
+
+def probe_playlist(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Flat probe of ``url``: for a playlist its title, id and the URL and title
+    of every entry, paged in from the flat listing (with the error that
+    stopped the listing early, if one did); None for a single video.
+    A single video is resolved (it is one request either way) and left in
+    the metadata cache for the download.
+    """
+    cached = metadata_cache.get(url)
+    if cached is not None and 'entries' not in cached:
+        return None
+    with yt_dlp.YoutubeDL(FLAT_YDL_OPTS) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        if info is None:
+            raise Exception('Could not retrieve video information')
+        if info.get('_type') == 'playlist':
+            entries, error = [], None
+            try:
+                for entry in info.get('entries') or []:
+                    if entry:
+                        entries.append({'url': summarize_entry(entry, url)['webpage_url'], 'title': entry.get('title')})
+            except Exception as e:
+                # The entries listed so far still run
+                error = str(e)
+            return {'title': info.get('title'), 'id': info.get('id'), 'entries': entries, 'error': error}
+        if info.get('_type') in ('url', 'url_transparent'):
+            info = ydl.extract_info(url, download=False)
+        else:
+            info = ydl.process_ie_result(info, download=False)
+        metadata_cache.put(url, ydl.sanitize_info(info))
+    return None
+
+def summarize_entry(entry: Dict[str, Any], fallback_url: str) -> Dict[str, Any]:
+    """The fields the preview shows for one video; works for flat and full entries."""
+    thumbnail_url = None
+    if entry.get('thumbnails'):
+        thumbnail_url = entry['thumbnails'][-1]['url']
+    elif entry.get('thumbnail'):
+        thumbnail_url = entry['thumbnail']
+
+    webpage_url = entry.get('webpage_url')
+    if not webpage_url and entry.get('_type') in ('url', 'url_transparent'):
+        webpage_url = entry.get('url')
+
+    return {
+        'id': entry.get('id'),
+        'title': entry.get('title', 'Untitled'),
+        'duration': entry.get('duration', 0),
+        'thumbnail_url': thumbnail_url,
+        'uploader': entry.get('uploader') or entry.get('channel') or 'Unknown',
+        'view_count': entry.get('view_count', 0),
+        'upload_date': entry.get('upload_date'),
+        'description': entry.get('description', '')[:200] if entry.get('description') else '',
+        'webpage_url': webpage_url or fallback_url
+    }
+
+def parse_cursor(cursor: Any) -> int:
+    """Cursors are opaque to clients; currently the offset of the next entry."""
+    try:
+        return max(int(cursor or 0), 0)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+
+def iter_playlist_entries(session: PlaylistSession, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield every entry of a playlist, pulling upstream pages as needed."""
+    offset = 0
+    while True:
+        entries, has_more = session.page(offset, page_size)
+        yield from entries
+        if not has_more:
+            return
+        offset += page_size
+
+def resolve_entries(urls: List[str], workers: int = 4) -> List[Dict[str, Any]]:
+    """
+    Fully extract the given entry URLs in parallel (through the metadata cache).
+    Results keep the order of ``urls``; failures are reported per entry.
+    """
+    from app.utils.downloader import _extract_metadata
+
+    def resolve(url):
+        try:
+            info = metadata_cache.get_or_extract(url, _extract_metadata)
+            return dict(summarize_entry(info, url), success=True, requested_url=url)
+        except Exception as e:
+            return {'requested_url': url, 'webpage_url': url, 'success': False, 'error': str(e)}
+
+    if not urls:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as executor:
+        return list(executor.map(resolve, urls))
@@ -0,0 +1,104 @@
+"""
+Staging Module
+Per-job working directories for downloads, and exact tracking of the files
+a job produced
+"""
+import os
+import shutil
+from typing import Any, Dict, Iterable, List, Optional
+
+# Staging directories live here, inside the downloads folder so that moving a
+# finished file into the library is a rename on the same filesystem
+STAGING_DIRNAME = '.staging'
+
+SUBTITLE_EXTENSIONS = ('.srt', '.vtt', '.ass', '.ssa', '.lrc', '.ttml', '.json3', '.srv1', '.srv2', '.srv3')
+THUMBNAIL_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def staging_dir(output_dir: str, job_key: str) -> str:
+    """The staging directory of one job under ``output_dir``."""
+    return os.path.join(output_dir, STAGING_DIRNAME, job_key)
+
+def artifact_kind(path: str) -> str:
+    """'media', 'thumbnail', 'subtitles' or 'info', from a file's name."""
+    name = path.lower()
+    if name.endswith('.info.json'):
+        return 'info'
+    if name.endswith(SUBTITLE_EXTENSIONS):
+        return 'subtitles'
+    if name.endswith(THUMBNAIL_EXTENSIONS):
+        return 'thumbnail'
+    return 'media'
+
+class ArtifactCollector:
+    """
+    Records the files yt-dlp reports writing, through its progress and
+    postprocessor hooks. Together with the paths in the final info dict
+    (requested_downloads, thumbnails, subtitles) this is the exact set of a
+    job's outputs; intermediate files that a merge or conversion deleted
+    are dropped because they are no longer on disk.
+    """
+
+    def __init__(self, root: str, paths: Iterable[str] = ()):
+        self.root = os.path.abspath(root)
+        self._paths = list(paths)
+
+    def progress_hook(self, d):
+        if d.get('status') == 'finished':
+            self._add(d.get('filename'))
+
+    def postprocessor_hook(self, d):
+        if d.get('status') == 'finished':
+            self._add((d.get('info_dict') or {}).get('filepath'))
+
+    def files(self, extra: Iterable[str] = ()) -> List[str]:
+        """Collected paths plus ``extra`` that exist inside the staging directory, media first."""
+        paths = []
+        for path in list(extra) + self._paths:
+            if not path:
+                continue
+            path = os.path.abspath(path)
+            if path not in paths and os.path.isfile(path) and os.path.commonpath([self.root, path]) == self.root:
+                paths.append(path)
+        return sorted(paths, key=lambda p: artifact_kind(p) != 'media')
+
+    def _add(self, path):
+        if path and path not in self._paths:
+            self._paths.append(path)
+
+def publish(paths: Iterable[str], output_dir: str) -> List[Dict[str, Any]]:
+    """
+    Move staged files into ``output_dir``, replacing files of the same name.
+    Each move is a rename, so the library never shows a partial file.
+    Returns the artifacts as {'name', 'size', 'kind'}; files already moved are skipped.
+    """
+    artifacts = []
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        name = os.path.basename(path)
+        destination = os.path.join(output_dir, name)
+        os.replace(path, destination)
+        artifacts.append({'name': name, 'size': os.path.getsize(destination), 'kind': artifact_kind(name)})
+    return artifacts
+
+def discard(path: str):
+    """Remove a staging directory and whatever was left in it (.part files, intermediates)."""
+    shutil.rmtree(path, ignore_errors=True)
+
+def clear_stale(output_dir: str, keep: Optional[Iterable[str]] = None) -> int:
+    """
+    Remove staging directories of jobs that are gone, e.g. killed with their
+    worker or interrupted by a restart and not resumed. Returns how many.
+    """
+    root = os.path.join(output_dir, STAGING_DIRNAME)
+    keep = set(keep or ())
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    removed = 0
+    for name in names:
+        if name not in keep:
+            discard(os.path.join(root, name))
+            removed += 1
+    return removed
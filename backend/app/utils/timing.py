@@ -0,0 +1,78 @@
+"""
+Stage Timing Module
+Records how long each stage of a download took, as structured spans
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+# yt-dlp postprocessors that merge separately downloaded streams
+MERGE_POSTPROCESSORS = ('Merger', 'FFmpegMerger')
+
+class StageTimer:
+    """
+    Collects spans for one download: extract, download (per format), merge,
+    each postprocessor, transcribe, file scan...
+
+    Spans are plain dicts so they survive pickling back from a worker
+    process and JSON encoding into the job store. ``offset`` is the start
+    relative to the timer's creation.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._origin = clock()
+        self._spans = []
+        self._open_downloads = {}  # filename -> (start, format_id)
+        self._open_postprocessors = {}  # postprocessor -> start
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        start = self._clock()
+        try:
+            yield attrs
+        finally:
+            self._add(stage, start, self._clock(), attrs)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        return list(self._spans)
+
+    def progress_hook(self, d):
+        """yt-dlp progress hook: one 'download' span per downloaded file/format."""
+        filename = d.get('filename')
+        if d.get('status') == 'downloading' and filename not in self._open_downloads:
+            format_id = (d.get('info_dict') or {}).get('format_id')
+            self._open_downloads[filename] = (self._clock(), format_id)
+        elif d.get('status') == 'finished':
+            start, format_id = self._open_downloads.pop(filename, (None, None))
+            end = self._clock()
+            if start is None:
+                # Finished without a chunk reported (e.g. already on disk)
+                start = end - (d.get('elapsed') or 0)
+                format_id = (d.get('info_dict') or {}).get('format_id')
+            size = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            seconds = end - start
+            self._add('download', start, end, {
+                'format_id': format_id,
+                'bytes': size,
+                'bytes_per_second': round(size / seconds) if seconds > 0 else None,
+            })
+
+    def postprocessor_hook(self, d):
+        """yt-dlp postprocessor hook: a 'merge' span or one 'postprocess:<name>' span per postprocessor."""
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            self._open_postprocessors[name] = self._clock()
+        elif d.get('status') == 'finished' and name in self._open_postprocessors:
+            start = self._open_postprocessors.pop(name)
+            stage = 'merge' if name in MERGE_POSTPROCESSORS else f'postprocess:{name}'
+            self._add(stage, start, self._clock(), {})
+
+    def _add(self, stage, start, end, attrs):
+        span = {
+            'stage': stage,
+            'offset': round(start - self._origin, 4),
+            'seconds': round(end - start, 4),
+        }
+        span.update({key: value for key, value in attrs.items() if value is not None})
+        self._spans.append(span)
@@ -0,0 +1,241 @@
+"""
+Transcript Cache Module
+Keeps finished transcripts by audio fingerprint and source video, and renders
+them as SRT, VTT or plain text on demand
+"""
+import hashlib
+import json
+import subprocess
+import time
+import uuid
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    language TEXT,
+    text TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_last_access ON transcripts(last_access);
+CREATE TABLE IF NOT EXISTS transcript_keys (
+    key TEXT PRIMARY KEY,
+    transcript_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcript_keys_transcript_id ON transcript_keys(transcript_id);
+"""
+
+COUNTER_NAMES = ('hits', 'misses', 'stores', 'evictions')
+
+# Segment fields kept; Whisper's tokens and decoding statistics are not needed to render captions
+SEGMENT_FIELDS = ('start', 'end', 'text', 'words')
+
+FORMATS = {
+    'srt': 'application/x-subrip',
+    'vtt': 'text/vtt',
+    'txt': 'text/plain',
+    'json': 'application/json',
+}
+
+def transcript_key(kind: str, ident: str, model: str, language: str) -> str:
+    """
+    Key for one source transcribed with one model and language. ``kind`` is
+    'audio' (``ident`` is an audio fingerprint) or 'video' (an extractor video id).
+    """
+    encoded = json.dumps([kind, ident, model, language])
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+def audio_fingerprint(path: str) -> Optional[str]:
+    """
+    SHA-256 of a file's first audio stream decoded to Whisper's 16 kHz mono,
+    so the same audio in another container (or a remux) has the same
+    fingerprint. None if ffmpeg cannot decode it.
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-i', path, '-map', '0:a:0', '-ac', '1', '-ar', '16000',
+        '-f', 'hash', '-hash', 'sha256', '-',
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    name, _, digest = output.strip().partition('=')
+    return digest if name == 'SHA256' and digest else None
+
+def _timestamp(seconds: float, separator: str) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}'
+
+def render(transcript: Dict[str, Any], fmt: str) -> Tuple[str, str]:
+    """A stored transcript as (body, mimetype) in one of FORMATS; unknown formats raise ValueError."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown transcript format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+
+    segments = transcript['segments']
+    if fmt == 'txt':
+        body = transcript['text'].strip() + '\n'
+    elif fmt == 'json':
+        body = json.dumps(transcript, ensure_ascii=False)
+    elif fmt == 'srt':
+        body = '\n'.join(
+            f"{index}\n{_timestamp(s['start'], ',')} --> {_timestamp(s['end'], ',')}\n{s['text'].strip()}\n"
+            for index, s in enumerate(segments, 1)
+        )
+    else:
+        body = 'WEBVTT\n\n' + '\n'.join(
+            f"{_timestamp(s['start'], '.')} --> {_timestamp(s['end'], '.')}\n{s['text'].strip()}\n"
+            for s in segments
+        )
+    return body, FORMATS[fmt]
+
+class TranscriptCache:
+    """
+    Finished transcripts in SQLite.
+
+    A transcript is stored once, with only the segment fields needed to
+    render it, and is reachable under several keys: the fingerprint of the
+    decoded audio and, when it came from a download, the extractor's video
+    id (each with model and language). Re-downloading a video in another
+    format therefore hits on the video id without decoding anything, and
+    the same audio from another source hits on the fingerprint. The least
+    recently used transcripts beyond ``max_entries`` are dropped.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 5000):
+        self.db_path = None
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = Lock()
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+        if db_path:
+            self.configure(db_path, max_entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def configure(self, db_path: str, max_entries: int):
+        from app.database.db import connect
+
+        conn = connect(db_path, check_same_thread=False)
+        conn.executescript(SCHEMA)
+        with self._lock:
+            self.db_path = db_path
+            self.max_entries = max_entries
+            self._conn = conn
+
+    def lookup(self, keys: List[str], count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        The transcript stored under the first of ``keys`` that has one, or None.
+        ``count_miss=False`` is for a quick first try that is followed by a full lookup.
+        """
+        if not self.enabled or not keys:
+            return None
+        with self._lock, self._conn:
+            for key in keys:
+                row = self._conn.execute(
+                    'SELECT t.* FROM transcript_keys k JOIN transcripts t ON t.id = k.transcript_id WHERE k.key = ?',
+                    (key,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute('UPDATE transcripts SET last_access = ? WHERE id = ?', (time.time(), row['id']))
+                    self._add_keys(row['id'], keys)
+                    self.counters['hits'] += 1
+                    return self._transcript(row)
+            if count_miss:
+                self.counters['misses'] += 1
+        return None
+
+    def get(self, transcript_id: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM transcripts WHERE id = ?', (transcript_id,)).fetchone()
+        return self._transcript(row) if row is not None else None
+
+    def store(self, keys: List[str], model: str, result: Dict[str, Any]) -> Optional[str]:
+        """Add a Whisper result under ``keys``. Returns its transcript id, or None if the cache is off."""
+        if not self.enabled:
+            return None
+        segments = [
+            {name: segment[name] for name in SEGMENT_FIELDS if segment.get(name) is not None}
+            for segment in result.get('segments', [])
+        ]
+        transcript_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO transcripts (id, model, language, text, segments, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (transcript_id, model, result.get('language'), result['text'],
+                 json.dumps(segments, ensure_ascii=False, separators=(',', ':')), now, now)
+            )
+            self._add_keys(transcript_id, keys)
+            self.counters['stores'] += 1
+        self.evict()
+        return transcript_id
+
+    def evict(self) -> int:
+        """Drop least recently used transcripts beyond max_entries. Returns how many were dropped."""
+        if not self.enabled:
+            return 0
+        with self._lock, self._conn:
+            stale = [row['id'] for row in self._conn.execute(
+                'SELECT id FROM transcripts ORDER BY last_access DESC LIMIT -1 OFFSET ?', (self.max_entries,)
+            )]
+            if stale:
+                placeholders = ','.join('?' * len(stale))
+                self._conn.execute(f'DELETE FROM transcripts WHERE id IN ({placeholders})', stale)
+                self._conn.execute(f'DELETE FROM transcript_keys WHERE transcript_id IN ({placeholders})', stale)
+                self.counters['evictions'] += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) AS n FROM transcripts').fetchone()['n']
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['misses']
+        stats.update(
+            enabled=True,
+            hit_ratio=round(stats['hits'] / lookups, 3) if lookups else None,
+            entries=entries,
+            max_entries=self.max_entries,
+        )
+        return stats
+
+    def _add_keys(self, transcript_id, keys):
+        """Point ``keys`` at a transcript. Caller holds the lock, in a transaction."""
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO transcript_keys (key, transcript_id) VALUES (?, ?)',
+            [(key, transcript_id) for key in keys]
+        )
+
+    @staticmethod
+    def _transcript(row):
+        return {
+            'id': row['id'],
+            'model': row['model'],
+            'language': row['language'],
+            'text': row['text'],
+            'segments': json.loads(row['segments']),
+            'created_at': row['created_at'],
+        }
+
+transcript_cache = TranscriptCache()
+
+def init_app(app):
+    """Open the cache configured by the TRANSCRIPT_CACHE_* settings."""
+    if not app.config.get('TRANSCRIPT_CACHE_ENABLED', True):
+        return
+    from app.database.db import database_path
+
+    transcript_cache.configure(database_path(app), app.config.get('TRANSCRIPT_CACHE_MAX_ENTRIES', 5000))
@@ -0,0 +1,122 @@
+"""
+Transcript Sources Module
+Finds a video's own caption tracks and turns them into transcripts, so
+Whisper only runs for videos without captions
+"""
+import html
+import json
+import re
+from typing import Any, Dict, List, Optional
+from app.utils.joblog import YtDlpLogger, get_logger
+
+log = get_logger('transcription')
+
+# Caption formats we can read, best first: json3 (YouTube) has clean per-event
+# timing; WebVTT and SRT are offered by most other sites
+CAPTION_FORMATS = ('json3', 'vtt', 'srt')
+
+_TIMING = re.compile(
+    r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})\s+-->\s+(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})'
+)
+_TAG = re.compile(r'<[^>]*>')
+
+def _match_language(tracks: Dict[str, Any], language: str) -> Optional[str]:
+    """Key of the track for ``language`` (exact, then regional variants like en-US)."""
+    if language in tracks:
+        return language
+    for key in tracks:
+        if key.split('-')[0] == language:
+            return key
+    return None
+
+def caption_track(info: Dict[str, Any], language: str) -> Optional[Dict[str, Any]]:
+    """
+    The best caption track of a video in ``language`` ('auto' means the
+    video's own language), uploaded captions before automatic ones.
+    Returns {'language', 'automatic', 'ext', 'url'} or None.
+    """
+    if language == 'auto':
+        language = info.get('language')
+        if not language:
+            return None
+
+    for automatic, tracks in ((False, info.get('subtitles')), (True, info.get('automatic_captions'))):
+        key = _match_language(tracks or {}, language)
+        if key is None:
+            continue
+        by_ext = {fmt.get('ext'): fmt for fmt in tracks[key] if fmt.get('url')}
+        for ext in CAPTION_FORMATS:
+            if ext in by_ext:
+                return {'language': key, 'automatic': automatic, 'ext': ext, 'url': by_ext[ext]['url']}
+    return None
+
+def _seconds(hours, minutes, seconds, milliseconds) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000
+
+def parse_json3(data: str) -> List[Dict[str, Any]]:
+    """Segments of a YouTube json3 caption file."""
+    segments = []
+    for event in json.loads(data).get('events', []):
+        text = ''.join(seg.get('utf8', '') for seg in event.get('segs') or []).replace('\n', ' ').strip()
+        if not text:
+            continue
+        start = event.get('tStartMs', 0) / 1000
+        segments.append({'start': start, 'end': start + event.get('dDurationMs', 0) / 1000, 'text': text})
+    return segments
+
+def parse_cues(data: str) -> List[Dict[str, Any]]:
+    """
+    Segments of a WebVTT or SRT file. Automatic captions repeat the previous
+    cue's line while a new one scrolls in; only the new lines are kept.
+    """
+    segments = []
+    previous = []
+    for block in re.split(r'\r?\n\s*\r?\n', data.replace('\ufeff', '')):
+        lines = block.strip().splitlines()
+        for index, line in enumerate(lines):
+            timing = _TIMING.search(line)
+            if timing:
+                break
+        else:
+            continue
+        text_lines = [html.unescape(_TAG.sub('', line)).strip() for line in lines[index + 1:]]
+        text_lines = [line for line in text_lines if line]
+        new_lines = [line for line in text_lines if line not in previous]
+        previous = text_lines
+        if not new_lines:
+            continue
+        groups = timing.groups()
+        segments.append({
+            'start': _seconds(*groups[:4]),
+            'end': _seconds(*groups[4:]),
+            'text': ' '.join(new_lines),
+        })
+    return segments
+
+def fetch_captions(track: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Download a caption track and normalize it into a Whisper-shaped result
+    ({'text', 'segments', 'language'}). None if it cannot be fetched or is empty.
+    """
+    import yt_dlp
+
+    try:
+        with yt_dlp.YoutubeDL({'quiet': True, 'logger': YtDlpLogger(quiet=True)}) as ydl:
+            data = ydl.urlopen(track['url']).read().decode('utf-8', 'replace')
+        segments = parse_json3(data) if track['ext'] == 'json3' else parse_cues(data)
+    except Exception as e:
+        log.warning('Could not fetch %s captions: %s', track['language'], e)
+        return None
+
+    if not segments:
+        return None
+    # Rolling captions overlap; end each segment no later than the next one starts
+    for segment, following in zip(segments, segments[1:]):
+        segment['end'] = max(segment['start'], min(segment['end'], following['start']))
+    for number, segment in enumerate(segments):
+        segment.update(id=number, start=round(segment['start'], 3), end=round(segment['end'], 3))
+    return {
+        'text': ' '.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': track['language'],
+    }
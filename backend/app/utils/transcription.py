@@ -2,26 +2,74 @@
 Audio Transcription Module
 Provides transcription services for downloaded audio/video files
 """
+import importlib
 import os
-import subprocess
 import json
-from typing import Dict, Any, Optional
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from threading import Condition, Thread
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from app.utils import joblog
+from app.utils.joblog import current_job_id, get_logger, job_context
+from app.utils.long_transcription import SAMPLE_RATE, chunk_pool, extract_pcm, media_duration, split_at_pauses, stitch
+from app.utils.transcript_cache import audio_fingerprint, transcript_cache, transcript_key
+from app.utils.transcript_sources import fetch_captions
+from app.utils.whisper_models import MODEL_SIZES_MB, SECONDS_PER_AUDIO_SECOND, whisper_models
 
-def transcribe_audio(audio_file_path: str, language: str = 'en') -> Dict[str, Any]:
+log = get_logger('transcription')
+
+# Model name under which caption transcripts are kept in the transcript cache
+CAPTIONS_MODEL = 'captions'
+
+class TranscriptionCancelled(Exception):
+    """The transcription was cancelled while it ran."""
+
+def transcribe_audio(audio_file_path: str, language: str = 'en', model: Optional[str] = None,
+                     source_id: Optional[str] = None, captions: Optional[Dict[str, Any]] = None,
+                     duration: Optional[float] = None) -> Dict[str, Any]:
     """
     Transcribe audio file to text
 
-    This function attempts to use Whisper (OpenAI's speech recognition model)
-    if available, otherwise falls back to a simple placeholder.
+    The file is queued for the transcription workers, which run it on a
+    Whisper model kept loaded between files. Blocks until it is done.
 
     Args:
         audio_file_path: Path to the audio/video file
         language: Language code (e.g., 'en', 'es', 'fr')
+        model: Whisper model name ('tiny', 'base', 'small'...); defaults to WHISPER_DEFAULT_MODEL
+        source_id: Extractor video id the file was downloaded from, for the transcript cache
+        captions: The video's caption track in ``language`` (see transcript_sources.caption_track),
+            used instead of Whisper when it can be fetched
+        duration: Length of the media in seconds, if known
 
     Returns:
         Dict with transcription result
     """
+    error = check_transcribable(audio_file_path, whisper_needed=captions is None)
+    if error:
+        return error
+
+    try:
+        model = whisper_models.resolve(model)
+        return transcription_worker.submit(
+            audio_file_path, language, model, source_id=source_id, captions=captions, duration=duration
+        ).result()
+    except Exception as e:
+        log.exception('Transcription of %s failed', audio_file_path)
+        return {
+            'success': False,
+            'error': str(e),
+            'file': audio_file_path
+        }
 
+def check_transcribable(audio_file_path: str, whisper_needed: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    The error result for a file that cannot be transcribed here, or None.
+    Without ``whisper_needed`` (captions are available) a missing Whisper is not an error.
+    """
     if not os.path.exists(audio_file_path):
         return {
             'success': False,
@@ -29,64 +77,492 @@ def transcribe_audio(audio_file_path: str, language: str = 'en') -> Dict[str, An
             'file': audio_file_path
         }
 
-    print(f"Attempting transcription of: {audio_file_path}")
+    if whisper_needed and not is_transcription_available():
+        log.warning('Whisper not installed. Install with: pip install openai-whisper')
+        return {
+            'success': False,
+            'error': 'Whisper not installed',
+            'message': 'To enable transcription, install Whisper: pip install openai-whisper',
+            'note': 'Whisper requires PyTorch. See: https://github.com/openai/whisper'
+        }
+    return None
+
+# Progress callback of the transcription running on this thread
+_progress = ContextVar('transcription_progress', default=None)
 
-    # Try to use Whisper if installed
-    try:
-        import whisper
+class _ProgressBar:
+    """Stands in for tqdm inside whisper.transcribe and reports the frames done to the running thread's callback."""
+
+    def __init__(self, *args, total=None, **kwargs):
+        self.total = total
+        self.n = 0
+        self._callback = _progress.get()
+
+    def __enter__(self):
+        return self
 
-        print("Loading Whisper model...")
-        # Use base model for balance of speed and accuracy
-        # Options: tiny, base, small, medium, large
-        model = whisper.load_model("base")
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, n=1):
+        self.n += n
+        if self._callback is not None:
+            self._callback(self.n, self.total)
+
+    def close(self):
+        pass
+
+def _install_progress_bar():
+    module = importlib.import_module('whisper.transcribe')
+    if not isinstance(getattr(module, 'tqdm', None), SimpleNamespace):
+        module.tqdm = SimpleNamespace(tqdm=_ProgressBar)
+
+def _transcribe_file(model, model_name: str, audio_file_path: str, language: str,
+                     on_progress: Optional[Callable] = None, cancel_event=None,
+                     cache_keys: Sequence[str] = ()) -> Dict[str, Any]:
+    """Run one file through a loaded model and save the transcript next to it."""
+    def report(done, total):
+        # Whisper reports after each 30 second window; a cancel takes effect there
+        if cancel_event is not None and cancel_event.is_set():
+            raise TranscriptionCancelled('Transcription cancelled')
+        if on_progress is not None and total:
+            on_progress(min(done / total, 1.0))
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise TranscriptionCancelled('Transcription cancelled')
 
-        print("Transcribing audio...")
+    log.info('Transcribing %s with Whisper %s', audio_file_path, model_name)
+    if on_progress is not None:
+        on_progress(0.0)
+    _install_progress_bar()
+    token = _progress.set(report)
+    try:
         result = model.transcribe(
             audio_file_path,
             language=language if language != 'auto' else None,
-            fp16=False  # Disable FP16 for CPU compatibility
+            fp16=False,  # Disable FP16 for CPU compatibility
+            verbose=None,  # No console output; progress goes through report()
         )
+    finally:
+        _progress.reset(token)
 
-        # Save transcription to text file
-        transcript_path = audio_file_path.rsplit('.', 1)[0] + '.transcript.txt'
-        with open(transcript_path, 'w', encoding='utf-8') as f:
-            f.write(result['text'])
+    return _save_transcript(audio_file_path, model_name, result, cache_keys)
+
+def _transcribe_long_file(model_name: str, audio_file_path: str, language: str,
+                          on_progress: Optional[Callable] = None, on_partial: Optional[Callable] = None,
+                          cancel_event=None, cache_keys: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Transcribe a long file in pieces on the chunk process pool.
+
+    The audio is decoded once, cut at pauses and the pieces transcribed in
+    parallel; ``on_partial(text, done, total)`` gets the text of the pieces
+    finished so far from the start of the file, as it grows.
+    """
+    started = time.monotonic()
+    pcm_path = extract_pcm(audio_file_path)
+    try:
+        bounds = split_at_pauses(pcm_path, chunk_pool.chunk_seconds)
+        log.info('Transcribing %s with Whisper %s in %d pieces', audio_file_path, model_name, len(bounds))
+        if on_progress is not None:
+            on_progress(0.0)
+
+        def task(kind, start, end, language=None):
+            return {'kind': kind, 'pcm_path': pcm_path, 'start': start, 'end': end,
+                    'model': model_name, 'language': language}
+
+        if language == 'auto':
+            # Detect once so every piece is transcribed in the same language
+            detected = []
+            start = bounds[0][0]
+            if not chunk_pool.map([task('detect', start, start + 30 * SAMPLE_RATE)],
+                                  lambda index, result: detected.append(result), cancel_event):
+                raise TranscriptionCancelled('Transcription cancelled')
+            language = detected[0]
+            log.info('Detected language: %s', language)
+
+        total = bounds[-1][1]
+        results = {}
+        state = {'done': 0, 'published': 0}
+
+        def on_result(index, result):
+            results[index] = result
+            state['done'] += bounds[index][1] - bounds[index][0]
+            if on_progress is not None:
+                on_progress(state['done'] / total)
+            # Publish only what extends the text from the start of the file
+            contiguous = state['published']
+            while contiguous in results:
+                contiguous += 1
+            if on_partial is not None and contiguous > state['published']:
+                state['published'] = contiguous
+                on_partial(''.join(results[i]['text'] for i in range(contiguous)), contiguous, len(bounds))
+
+        tasks = [task('chunk', start, end, language) for start, end in bounds]
+        if not chunk_pool.map(tasks, on_result, cancel_event):
+            raise TranscriptionCancelled('Transcription cancelled')
+    finally:
+        os.remove(pcm_path)
+
+    result = stitch([(bounds[i][0] / SAMPLE_RATE, results[i]) for i in range(len(bounds))])
+    result['language'] = result.get('language') or language
+    log.info('Transcribed %d pieces in %.1fs', len(bounds), time.monotonic() - started)
+    return dict(_save_transcript(audio_file_path, model_name, result, cache_keys), chunks=len(bounds))
+
+def _save_transcript(audio_file_path: str, model_name: str, result: Dict[str, Any],
+                     cache_keys: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Keep a Whisper result in the transcript cache and write its text next to
+    the audio file. Without the cache the full result goes to a JSON file
+    there instead, as the only copy of the timestamps.
+    """
+    # Save transcription to text file
+    transcript_path = audio_file_path.rsplit('.', 1)[0] + '.transcript.txt'
+    with open(transcript_path, 'w', encoding='utf-8') as f:
+        f.write(result['text'])
+
+    summary = {
+        'success': True,
+        'text': result['text'],
+        'language': result.get('language'),
+        'model': model_name,
+        'segments': len(result.get('segments', [])),
+        'transcript_file': transcript_path,
+    }
 
-        # Save full result with timestamps to JSON
+    transcript_id = transcript_cache.store(list(cache_keys), model_name, result) if cache_keys else None
+    if transcript_id is not None:
+        # SRT, VTT and JSON are rendered from the cache by /api/transcripts/<id>
+        summary['transcript_id'] = transcript_id
+    else:
         transcript_json_path = audio_file_path.rsplit('.', 1)[0] + '.transcript.json'
         with open(transcript_json_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+            json.dump(result, f, ensure_ascii=False)
+        summary['transcript_json'] = transcript_json_path
 
-        print(f"Transcription saved to: {transcript_path}")
+    log.info('Transcription saved to %s', transcript_path)
+    return summary
 
-        return {
-            'success': True,
-            'text': result['text'],
-            'language': result.get('language'),
-            'segments': len(result.get('segments', [])),
-            'transcript_file': transcript_path,
-            'transcript_json': transcript_json_path
-        }
+def _cached_summary(audio_file_path: str, transcript: Dict[str, Any]) -> Dict[str, Any]:
+    """The result for a transcript found in the cache; its text is written next to the audio file."""
+    transcript_path = audio_file_path.rsplit('.', 1)[0] + '.transcript.txt'
+    if not os.path.exists(transcript_path):
+        with open(transcript_path, 'w', encoding='utf-8') as f:
+            f.write(transcript['text'])
+    log.info('Transcript of %s found in the cache', audio_file_path)
+    return {
+        'success': True,
+        'text': transcript['text'],
+        'language': transcript['language'],
+        'model': transcript['model'],
+        'segments': len(transcript['segments']),
+        'transcript_file': transcript_path,
+        'transcript_id': transcript['id'],
+        'cached': True,
+        'source': 'captions' if transcript['model'] == CAPTIONS_MODEL else 'cache',
+    }
 
-    except ImportError:
-        # Whisper not installed
-        print("Whisper not installed. Install with: pip install openai-whisper")
+def _caption_summary(request) -> Optional[Dict[str, Any]]:
+    """The result for a request transcribed from the video's own captions, or None if they are unusable."""
+    track = request.captions
+    kind = 'automatic' if track.get('automatic') else 'uploaded'
+    keys = []
+    if request.source_id and transcript_cache.enabled:
+        keys.append(transcript_key('captions', request.source_id, kind, track['language']))
+    transcript = transcript_cache.lookup(keys, count_miss=False)
+    if transcript is not None:
+        summary = _cached_summary(request.path, transcript)
+    else:
+        result = fetch_captions(track)
+        if result is None:
+            return None
+        summary = _save_transcript(request.path, CAPTIONS_MODEL, result, keys)
+    log.info('Transcribed %s from its %s %s captions', request.path, kind, track['language'])
+    return dict(summary, source='captions', captions={'language': track['language'], 'kind': kind})
 
-        # Try to use ffmpeg to extract text if available (won't work, but shows intent)
-        return {
-            'success': False,
-            'error': 'Whisper not installed',
-            'message': 'To enable transcription, install Whisper: pip install openai-whisper',
-            'note': 'Whisper requires PyTorch. See: https://github.com/openai/whisper'
-        }
+def _cache_keys(request, fingerprint: bool = True) -> List[str]:
+    """Keys a request's transcript is cached under: its source video, and the decoded audio."""
+    if not transcript_cache.enabled:
+        return []
+    keys = []
+    if request.source_id:
+        keys.append(transcript_key('video', request.source_id, request.model, request.language))
+    if fingerprint:
+        digest = audio_fingerprint(request.path)
+        if digest is not None:
+            keys.append(transcript_key('audio', digest, request.model, request.language))
+    return keys
 
-    except Exception as e:
-        print(f"Transcription error: {e}")
-        return {
-            'success': False,
-            'error': str(e),
-            'file': audio_file_path
+class _Request:
+    __slots__ = ('path', 'language', 'model', 'source_id', 'captions', 'duration', 'on_progress', 'on_partial',
+                 'cancel_event', 'job_id', 'future')
+
+    def __init__(self, path, language, model, source_id, captions, duration, on_progress, on_partial, cancel_event):
+        self.path = path
+        self.language = language
+        self.model = model
+        self.source_id = source_id
+        self.captions = captions
+        self.duration = duration
+        self.on_progress = on_progress
+        self.on_partial = on_partial
+        self.cancel_event = cancel_event
+        self.job_id = current_job_id()
+        self.future = Future()
+
+class TranscriptionWorker:
+    """
+    A pool of threads that run queued transcriptions against warm models.
+
+    Each thread keeps the model instance it last used checked out for as
+    long as the queue holds more files for that model, and takes those
+    first, so a run of files (a playlist) is transcribed back to back on a
+    warm model. With nothing queued a thread hands its instance back to the
+    registry and unloads models that have been idle for too long.
+
+    Whisper is CPU bound and already uses several cores per file, so the
+    pool is sized from the CPU count rather than the download concurrency.
+    Files longer than the chunk pool's threshold are instead split and
+    spread over its processes; the thread only coordinates them.
+
+    Whisper is the last resort: a transcript cached for the source video,
+    or the video's own captions, are used without queueing at all. Looking
+    them up (an HTTP fetch for captions, ffprobe for the time saved) runs on
+    a few I/O threads of its own, so submitting never waits on it.
+    """
+
+    def __init__(self, registry, workers: int = 1, idle_check_seconds: float = 30, io_workers: int = 4):
+        self.registry = registry
+        self.workers = max(1, int(workers))
+        self.idle_check_seconds = idle_check_seconds
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='transcription-io')
+        self._queue = deque()
+        self._cond = Condition()
+        self._threads = []
+        self._running = 0
+        self.counters = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'warm_reuses': 0, 'chunked': 0,
+            'cache_hits': 0, 'caption_hits': 0,
         }
+        # Measured Whisper seconds per second of audio, by model
+        self._speed = {}
+        self.seconds_saved = 0.0
+
+    def configure(self, workers: int):
+        with self._cond:
+            self.workers = max(1, int(workers))
+
+    def submit(self, audio_file_path: str, language: str, model: str, on_progress: Optional[Callable] = None,
+               on_partial: Optional[Callable] = None, cancel_event=None, source_id: Optional[str] = None,
+               captions: Optional[Dict[str, Any]] = None, duration: Optional[float] = None) -> Future:
+        """
+        Queue a file. The future resolves to the transcription result; it
+        raises TranscriptionCancelled if ``cancel_event`` was set, and can be
+        cancelled with future.cancel() while still queued. ``on_partial`` is
+        only called for long files transcribed in pieces.
+
+        ``source_id`` identifies the video the file was downloaded from, and
+        ``captions`` is its caption track in the requested language; a
+        transcript cached for the video, or the captions, resolve the future
+        without queueing for Whisper. The result's ``source`` says which was
+        used. Returns at once either way: the lookup runs on an I/O thread.
+        """
+        request = _Request(
+            audio_file_path, language, model, source_id, captions, duration, on_progress, on_partial, cancel_event
+        )
+        with self._cond:
+            self.counters['submitted'] += 1
+        if request.source_id or request.captions:
+            self._io.submit(self._resolve, request)
+        else:
+            self._enqueue(request)
+        return request.future
+
+    def _resolve(self, request):
+        """On an I/O thread: answer ``request`` without Whisper if possible, else queue it."""
+        if request.future.cancelled():
+            return
+        try:
+            result = self._without_whisper(request)
+        except Exception as e:
+            # Whisper still works without the shortcut
+            with job_context(request.job_id):
+                log.warning('Cached transcript and caption lookup failed: %s', e)
+            result = None
+        if result is None:
+            self._enqueue(request)
+        elif request.future.set_running_or_notify_cancel():
+            request.future.set_result(result)
+            self._count('completed')
+
+    def _enqueue(self, request):
+        with self._cond:
+            self._queue.append(request)
+            if len(self._threads) < self.workers:
+                thread = Thread(target=self._run, name=f'transcription-{len(self._threads) + 1}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+
+    def queue_position(self, future: Future) -> Optional[int]:
+        """1-based position of a queued request, or None once it has started."""
+        with self._cond:
+            for position, request in enumerate(self._queue, 1):
+                if request.future is future:
+                    return position
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(
+                self.counters,
+                seconds_saved=round(self.seconds_saved, 1),
+                seconds_per_audio_second={model: round(speed, 3) for model, speed in self._speed.items()},
+                workers=self.workers,
+                threads=len(self._threads),
+                running=self._running,
+                queued=len(self._queue),
+                models=self.registry.stats(),
+                chunk_pool=chunk_pool.stats(),
+            )
+
+    def _without_whisper(self, request) -> Optional[Dict[str, Any]]:
+        """A transcript cached for the source video, or one from the video's captions; None if neither."""
+        started = time.monotonic()
+        with job_context(request.job_id):
+            result = None
+            if request.source_id:
+                transcript = transcript_cache.lookup(_cache_keys(request, fingerprint=False), count_miss=False)
+                if transcript is not None:
+                    result = _cached_summary(request.path, transcript)
+                    self._count('cache_hits')
+            if result is None and request.captions:
+                result = _caption_summary(request)
+                if result is not None:
+                    self._count('caption_hits')
+            if result is not None:
+                self._record_saving(request, result, time.monotonic() - started)
+        return result
+
+    def _estimate_seconds(self, request) -> Optional[float]:
+        """How long Whisper would take on a request's file here."""
+        duration = request.duration or media_duration(request.path)
+        if not duration:
+            return None
+        family = request.model.split('.')[0].split('-')[0]
+        speed = self._speed.get(request.model) or SECONDS_PER_AUDIO_SECOND.get(family)
+        return duration * speed if speed else None
+
+    def _record_saving(self, request, result, seconds):
+        estimate = self._estimate_seconds(request)
+        if estimate is None:
+            return
+        saved = max(estimate - seconds, 0)
+        result['seconds_saved'] = round(saved, 1)
+        with self._cond:
+            self.seconds_saved += saved
+        log.info('Transcript from %s saved about %.0fs of Whisper', result['source'], saved)
+
+    def _record_speed(self, request, seconds):
+        duration = request.duration or media_duration(request.path)
+        if not duration:
+            return
+        with self._cond:
+            previous = self._speed.get(request.model)
+            measured = seconds / duration
+            # Moving average, so one unusual file does not swing the estimate
+            self._speed[request.model] = measured if previous is None else 0.7 * previous + 0.3 * measured
+
+    def _take(self, preferred):
+        """Next request, preferring one for the model this thread holds. Caller holds the lock."""
+        if preferred is not None:
+            for request in self._queue:
+                if request.model == preferred:
+                    self._queue.remove(request)
+                    return request
+        return self._queue.popleft() if self._queue else None
+
+    def _run(self):
+        held = None
+        try:
+            while True:
+                with self._cond:
+                    while not self._queue and held is None:
+                        if not self._cond.wait(self.idle_check_seconds):
+                            self.registry.evict_idle()
+                    request = self._take(held.name if held is not None else None)
+
+                chunked = request is not None and chunk_pool.should_split(request.path)
+                if held is not None and (request is None or chunked or held.name != request.model):
+                    # Nothing more for the warm model right now
+                    self.registry.checkin(held)
+                    held = None
+                if request is None or not request.future.set_running_or_notify_cancel():
+                    continue
+
+                with self._cond:
+                    self._running += 1
+                try:
+                    with job_context(request.job_id):
+                        started = time.monotonic()
+                        cache_keys = _cache_keys(request)
+                        transcript = transcript_cache.lookup(cache_keys)
+                        if transcript is not None:
+                            self._count('cache_hits')
+                            result = _cached_summary(request.path, transcript)
+                            self._record_saving(request, result, time.monotonic() - started)
+                        elif chunked:
+                            self._count('chunked')
+                            result = _transcribe_long_file(
+                                request.model, request.path, request.language,
+                                request.on_progress, request.on_partial, request.cancel_event, cache_keys,
+                            )
+                        else:
+                            if held is None:
+                                held = self.registry.checkout(request.model)
+                            else:
+                                self._count('warm_reuses')
+                            result = _transcribe_file(
+                                held.model, request.model, request.path, request.language,
+                                request.on_progress, request.cancel_event, cache_keys,
+                            )
+                        if transcript is None:
+                            result['source'] = 'whisper'
+                            self._record_speed(request, time.monotonic() - started)
+                    request.future.set_result(result)
+                    self._count('completed')
+                except TranscriptionCancelled as e:
+                    request.future.set_exception(e)
+                    self._count('cancelled')
+                except Exception as e:
+                    request.future.set_exception(e)
+                    self._count('failed')
+                finally:
+                    with self._cond:
+                        self._running -= 1
+        finally:
+            if held is not None:
+                self.registry.checkin(held)
+
+    def _count(self, name):
+        with self._cond:
+            self.counters[name] += 1
+
+transcription_worker = TranscriptionWorker(whisper_models)
+
+def init_app(app):
+    """Size the transcription pool and the chunk process pool from the TRANSCRIPTION_* settings."""
+    transcription_worker.configure(app.config.get('TRANSCRIPTION_WORKERS', 1))
+    processes = max(1, app.config.get('TRANSCRIPTION_CHUNK_PROCESSES', 1))
+    chunk_pool.configure(
+        processes=processes,
+        chunk_seconds=app.config.get('TRANSCRIPTION_CHUNK_SECONDS', 300),
+        long_media_seconds=app.config.get('TRANSCRIPTION_LONG_MEDIA_SECONDS', 1200),
+        settings={
+            'whisper_models': whisper_models.settings(),
+            'log_level': joblog.settings()['level'],
+            'threads': max(1, (os.cpu_count() or 1) // processes),
+        },
+    )
 
 def is_transcription_available() -> bool:
     """Check if transcription is available (Whisper installed)"""
@@ -106,13 +582,10 @@ def get_transcription_info() -> Dict[str, Any]:
     }
 
     if available:
-        try:
-            import whisper
-            info['models'] = ['tiny', 'base', 'small', 'medium', 'large']
-            info['default_model'] = 'base'
-            info['languages'] = 'auto-detect or specify'
-        except:
-            pass
+        info['models'] = list(MODEL_SIZES_MB)
+        info['default_model'] = whisper_models.default_model
+        info['languages'] = 'auto-detect or specify'
+        info['worker'] = transcription_worker.stats()
     else:
         info['install_command'] = 'pip install openai-whisper'
         info['note'] = 'Requires PyTorch'
@@ -0,0 +1,249 @@
+"""
+Whisper Model Registry
+Keeps loaded Whisper models resident between transcriptions, within a memory budget
+"""
+import gc
+import time
+from contextlib import contextmanager
+from threading import Condition
+from typing import Any, Callable, Dict, Optional
+from app.utils.joblog import get_logger
+
+log = get_logger('whisper')
+
+# Approximate resident size of each model in MB (fp32 weights), used to plan
+# the budget before a model is loaded; the measured size replaces it after
+MODEL_SIZES_MB = {
+    'tiny': 150, 'tiny.en': 150,
+    'base': 290, 'base.en': 290,
+    'small': 970, 'small.en': 970,
+    'medium': 3060, 'medium.en': 3060,
+    'turbo': 3240,
+    'large': 6170, 'large-v1': 6170, 'large-v2': 6170, 'large-v3': 6170,
+}
+
+# Rough CPU time per second of audio for each model family; a starting point
+# for estimates until the transcription worker has measured its own runs
+SECONDS_PER_AUDIO_SECOND = {
+    'tiny': 0.05, 'base': 0.1, 'small': 0.3, 'medium': 0.9, 'turbo': 0.6, 'large': 1.8,
+}
+
+DEFAULT_MODEL = 'base'
+
+def _load_whisper(name: str, device: Optional[str]):
+    import whisper
+    return whisper.load_model(name, device=device)
+
+def _measured_mb(model) -> Optional[int]:
+    """Size of a loaded torch model's parameters and buffers in MB."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return round(sum(t.numel() * t.element_size() for t in tensors) / (1024 * 1024))
+    except Exception:
+        return None
+
+class _Entry:
+    __slots__ = ('name', 'model', 'size_mb', 'in_use', 'last_used')
+
+    def __init__(self, name, model, size_mb):
+        self.name = name
+        self.model = model
+        self.size_mb = size_mb
+        self.in_use = True
+        self.last_used = time.monotonic()
+
+class ModelRegistry:
+    """
+    Loaded Whisper models, keyed by model name ('tiny', 'base', 'small'...).
+
+    A model stays loaded after use and is reused by the next transcription
+    that asks for it. Whisper installs hooks on the model for each call, so
+    an instance serves one transcription at a time; concurrent requests for
+    the same model get another instance while the budget allows it, and
+    otherwise wait for one to be checked in.
+
+    Instances unused for ``idle_seconds`` are unloaded by evict_idle().
+    Before another instance is loaded, the least recently used idle ones
+    are unloaded until it fits in ``budget_mb``. An instance in use is never
+    unloaded; if nothing of the requested model is loaded and the budget
+    cannot be met, the load goes ahead anyway rather than failing.
+    """
+
+    def __init__(self, budget_mb: int = 4096, idle_seconds: float = 600, device: Optional[str] = None,
+                 default_model: str = DEFAULT_MODEL, loader: Callable = _load_whisper):
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self.device = device
+        self.default_model = default_model
+        self._loader = loader
+        self._entries = []
+        self._loading = {}  # name -> instances being loaded
+        self._cond = Condition()
+        self.counters = {'hits': 0, 'loads': 0, 'evictions': 0, 'waits': 0}
+
+    def configure(self, budget_mb=None, idle_seconds=None, device=None, default_model=None):
+        with self._cond:
+            if budget_mb is not None:
+                self.budget_mb = budget_mb
+            if idle_seconds is not None:
+                self.idle_seconds = idle_seconds
+            if device is not None:
+                self.device = device or None
+            if default_model:
+                self.default_model = default_model
+
+    def settings(self) -> Dict[str, Any]:
+        """What a worker process needs to configure its own registry the same way."""
+        return {
+            'budget_mb': self.budget_mb,
+            'idle_seconds': self.idle_seconds,
+            'device': self.device,
+            'default_model': self.default_model,
+        }
+
+    def resolve(self, name: Optional[str]) -> str:
+        """The model to use for a request; unknown names raise ValueError."""
+        name = name or self.default_model
+        if name not in MODEL_SIZES_MB:
+            raise ValueError(f"Unknown Whisper model '{name}'. Choose one of: {', '.join(MODEL_SIZES_MB)}")
+        return name
+
+    @contextmanager
+    def acquire(self, name: Optional[str] = None):
+        """Use a model instance, loading one if needed; it is not evicted until the block exits."""
+        entry = self.checkout(name)
+        try:
+            yield entry.model
+        finally:
+            self.checkin(entry)
+
+    def checkout(self, name: Optional[str] = None) -> _Entry:
+        """Take an instance for exclusive use; hand it back with checkin(). ``entry.model`` is the model."""
+        name = self.resolve(name)
+        with self._cond:
+            waited = False
+            while True:
+                for entry in self._entries:
+                    if entry.name == name and not entry.in_use:
+                        entry.in_use = True
+                        self.counters['hits'] += 1
+                        return entry
+                loaded = sum(1 for entry in self._entries if entry.name == name) + self._loading.get(name, 0)
+                if loaded == 0 or self._fits(MODEL_SIZES_MB[name]):
+                    break
+                if not waited:
+                    self.counters['waits'] += 1
+                    waited = True
+                # Every instance of this model is busy and another does not fit
+                self._cond.wait()
+
+            self._loading[name] = self._loading.get(name, 0) + 1
+            freed = self._make_room(MODEL_SIZES_MB[name])
+
+        if freed:
+            self._collect()
+        try:
+            started = time.monotonic()
+            model = self._loader(name, self.device)
+            size_mb = _measured_mb(model) or MODEL_SIZES_MB[name]
+            log.info('Loaded Whisper model %s (%d MB) in %.1fs', name, size_mb, time.monotonic() - started)
+        finally:
+            with self._cond:
+                self._loading[name] -= 1
+                self._cond.notify_all()
+
+        with self._cond:
+            entry = _Entry(name, model, size_mb)
+            self._entries.append(entry)
+            self.counters['loads'] += 1
+            return entry
+
+    def checkin(self, entry: _Entry):
+        with self._cond:
+            entry.in_use = False
+            entry.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    def evict_idle(self) -> int:
+        """Unload instances unused for idle_seconds. Returns how many were unloaded."""
+        now = time.monotonic()
+        with self._cond:
+            idle = [
+                entry for entry in self._entries
+                if not entry.in_use and now - entry.last_used >= self.idle_seconds
+            ]
+            for entry in idle:
+                self._unload(entry, 'idle')
+        if idle:
+            self._collect()
+        return len(idle)
+
+    def clear(self):
+        with self._cond:
+            for entry in [entry for entry in self._entries if not entry.in_use]:
+                self._unload(entry, 'cleared')
+        self._collect()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            models = {}
+            for entry in self._entries:
+                model = models.setdefault(entry.name, {'instances': 0, 'in_use': 0, 'size_mb': 0})
+                model['instances'] += 1
+                model['in_use'] += int(entry.in_use)
+                model['size_mb'] += entry.size_mb
+                model['idle_seconds'] = min(
+                    model.get('idle_seconds', float('inf')),
+                    0 if entry.in_use else round(now - entry.last_used)
+                )
+            return dict(self.counters, budget_mb=self.budget_mb, resident_mb=self._resident_mb(), models=models)
+
+    def _fits(self, needed_mb):
+        """Whether ``needed_mb`` more fits once idle instances are unloaded. Caller holds the lock."""
+        busy = sum(entry.size_mb for entry in self._entries if entry.in_use)
+        loading = sum(MODEL_SIZES_MB[name] * count for name, count in self._loading.items())
+        return busy + loading + needed_mb <= self.budget_mb
+
+    def _make_room(self, needed_mb):
+        """Unload idle instances, least recently used first, until ``needed_mb`` fits. Caller holds the lock."""
+        freed = 0
+        for entry in sorted((e for e in self._entries if not e.in_use), key=lambda e: e.last_used):
+            if self._resident_mb() + needed_mb <= self.budget_mb:
+                break
+            self._unload(entry, 'budget')
+            freed += 1
+        if self._resident_mb() + needed_mb > self.budget_mb:
+            log.warning('Whisper models in use exceed the %d MB budget', self.budget_mb)
+        return freed
+
+    def _unload(self, entry, reason):
+        self._entries.remove(entry)
+        entry.model = None
+        self.counters['evictions'] += 1
+        log.info('Unloaded Whisper model %s (%s)', entry.name, reason)
+
+    def _resident_mb(self):
+        return sum(entry.size_mb for entry in self._entries)
+
+    @staticmethod
+    def _collect():
+        # Release the weights now rather than whenever the collector next runs
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+whisper_models = ModelRegistry()
+
+def init_app(app):
+    """Configure the registry from the WHISPER_* settings."""
+    whisper_models.configure(
+        budget_mb=app.config.get('WHISPER_MEMORY_BUDGET_MB', 4096),
+        idle_seconds=app.config.get('WHISPER_IDLE_SECONDS', 600),
+        device=app.config.get('WHISPER_DEVICE'),
+        default_model=app.config.get('WHISPER_DEFAULT_MODEL', DEFAULT_MODEL),
+    )
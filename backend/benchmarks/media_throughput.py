@@ -0,0 +1,159 @@
+"""
+Media Serving Benchmark
+Compares the previous /api/download/file handler (plain send_file) with the
+Range/ETag media path, for full downloads, resumed downloads and revalidation.
+
+Usage (from backend/):
+    python benchmarks/media_throughput.py [--size-mb 512] [--runs 3] [--output results.json]
+    python benchmarks/media_throughput.py --base-url http://127.0.0.1:8000/api/download/file
+
+By default both handlers run in-process on Werkzeug's threaded server. To
+measure sendfile() or X-Accel-Redirect offload, start the app under
+gunicorn/nginx with a file named media-benchmark.bin in its UPLOAD_FOLDER
+and pass --base-url (only the new path is measured then).
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from threading import Thread
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, send_file
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app.api.media import send_media
+
+FILENAME = 'media-benchmark.bin'
+CHUNK_SIZE = 1024 * 1024
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+def build_app(root):
+    app = Flask(__name__)
+    app.config['MEDIA_MAX_AGE'] = 0
+
+    @app.route('/legacy/<path:filename>')
+    def legacy(filename):
+        # The handler as it was before the media path existed
+        return send_file(os.path.join(root, filename), as_attachment=True)
+
+    @app.route('/media/<path:filename>')
+    def media(filename):
+        return send_media(root, filename)
+
+    return app
+
+def request(base_url, headers=None, sink=None):
+    """GET ``base_url/FILENAME``; returns (status, headers, bytes received, peak bytes held in memory)."""
+    parsed = urlparse(base_url)
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+    conn.request('GET', f"{parsed.path.rstrip('/')}/{FILENAME}", headers=headers or {})
+    response = conn.getresponse()
+
+    received = 0
+    held = 0
+    buffered = []
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        received += len(chunk)
+        if sink is None:
+            # Like the old frontend: the whole body is kept in memory (as a blob)
+            buffered.append(chunk)
+            held = received
+        else:
+            sink.write(chunk)
+    conn.close()
+    return response.status, dict(response.getheaders()), received, held
+
+def measure(base_url, size, runs, streamed):
+    results = {}
+    scratch = tempfile.TemporaryFile()
+
+    timings = []
+    peak = 0
+    for _ in range(runs):
+        scratch.seek(0)
+        start = time.perf_counter()
+        status, headers, received, held = request(base_url, sink=scratch if streamed else None)
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, held)
+        assert status == 200 and received == size, (status, received)
+    best = min(timings)
+    results['full'] = {
+        'seconds': round(best, 4),
+        'mb_per_s': round(size / best / 1e6, 1),
+        'peak_client_memory_mb': round(peak / 1e6, 1),
+    }
+
+    # Resume from the middle of the file
+    offset = size // 2
+    start = time.perf_counter()
+    status, headers, received, _ = request(base_url, {'Range': f'bytes={offset}-'}, sink=scratch)
+    results['resume_half'] = {
+        'status': status,
+        'bytes': received,
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+    # Revalidation with the ETag from the previous response
+    etag = headers.get('ETag')
+    if etag:
+        start = time.perf_counter()
+        status, _, received, _ = request(base_url, {'If-None-Match': etag}, sink=scratch)
+        results['revalidate'] = {
+            'status': status,
+            'bytes': received,
+            'seconds': round(time.perf_counter() - start, 4),
+        }
+
+    scratch.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--base-url', help='Measure an already running media endpoint instead')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    report = {'size_bytes': size, 'runs': args.runs}
+
+    if args.base_url:
+        report['external'] = measure(args.base_url, size, args.runs, streamed=True)
+    else:
+        root = tempfile.mkdtemp(prefix='media-bench-')
+        try:
+            with open(os.path.join(root, FILENAME), 'wb') as f:
+                for _ in range(args.size_mb):
+                    f.write(os.urandom(1024 * 1024))
+
+            server = make_server('127.0.0.1', 0, build_app(root), threaded=True, request_handler=QuietHandler)
+            Thread(target=server.serve_forever, daemon=True).start()
+            base = f'http://127.0.0.1:{server.server_port}'
+            try:
+                report['legacy_blob'] = measure(f'{base}/legacy', size, args.runs, streamed=False)
+                report['media_streamed'] = measure(f'{base}/media', size, args.runs, streamed=True)
+            finally:
+                server.shutdown()
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
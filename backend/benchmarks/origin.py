@@ -0,0 +1,189 @@
+"""
+Benchmark Media Origin
+Local HTTP server with synthetic media for the offline benchmarks
+
+    /progressive/<id>.mp4   one file holding video and audio
+    /dash/<id>/video.mp4    video-only stream
+    /dash/<id>/audio.m4a    audio-only stream
+
+Every id serves the same bytes. When ffmpeg is available the files are real
+(generated test patterns), so merging and post-processing do real work;
+otherwise they are random bytes and only the progressive scenario can run.
+Range requests are supported, and ``rate_mbps`` throttles each connection to
+emulate a remote origin.
+"""
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+ROUTES = {
+    'progressive': ('progressive.mp4', 'video/mp4'),
+    'video': ('video.mp4', 'video/mp4'),
+    'audio': ('audio.m4a', 'audio/mp4'),
+}
+
+def find_ffmpeg():
+    """ffmpeg from backend/ffmpeg (as the downloader uses it) or from PATH."""
+    bundled = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ffmpeg')
+    for name in ('ffmpeg.exe', 'ffmpeg'):
+        if os.path.isfile(os.path.join(bundled, name)):
+            return os.path.join(bundled, name)
+    return shutil.which('ffmpeg')
+
+def _write_random(path, size):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, 1024 * 1024)
+            f.write(os.urandom(chunk))
+            remaining -= chunk
+
+def _encode(ffmpeg, path, size, duration, video, audio):
+    """Encode a test pattern at a bitrate that lands near ``size`` bytes."""
+    bitrate = max(int(size * 8 / duration), 64000)
+    args = [ffmpeg, '-y', '-loglevel', 'error']
+    if video:
+        args += ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={duration}']
+    if audio:
+        args += ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}']
+    if video:
+        args += ['-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', str(bitrate)]
+    if audio:
+        args += ['-c:a', 'aac', '-b:a', '128k']
+    subprocess.run(args + ['-movflags', '+faststart', path], check=True)
+
+def build_media(directory, size, duration=10):
+    """Create the served files; returns True if they are real (ffmpeg-encoded) media."""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        try:
+            _encode(ffmpeg, os.path.join(directory, 'progressive.mp4'), size, duration, video=True, audio=True)
+            _encode(ffmpeg, os.path.join(directory, 'video.mp4'), size, duration, video=True, audio=False)
+            _encode(ffmpeg, os.path.join(directory, 'audio.m4a'), size // 8, duration, video=False, audio=True)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"ffmpeg could not encode test media ({e}); serving random bytes")
+
+    _write_random(os.path.join(directory, 'progressive.mp4'), size)
+    _write_random(os.path.join(directory, 'video.mp4'), size)
+    _write_random(os.path.join(directory, 'audio.m4a'), size // 8)
+    return False
+
+class MediaOrigin:
+    """The origin server, run on a background thread."""
+
+    def __init__(self, size=4 * 1024 * 1024, rate_mbps=None, host='127.0.0.1', port=0):
+        self.directory = tempfile.mkdtemp(prefix='bench-origin-')
+        self.real_media = build_media(self.directory, size)
+        self.rate_mbps = rate_mbps
+        self.requests = 0
+        self.bytes_sent = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def size_of(self, route):
+        return os.path.getsize(os.path.join(self.directory, ROUTES[route][0]))
+
+    def start(self):
+        self._thread = Thread(target=self._server.serve_forever, name='bench-origin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _handler_class(self):
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(body=False)
+
+            def do_GET(self):
+                self._serve(body=True)
+
+            def _serve(self, body):
+                route = self._route()
+                if route is None:
+                    self.send_error(404)
+                    return
+                filename, content_type = ROUTES[route]
+                path = os.path.join(origin.directory, filename)
+                size = os.path.getsize(path)
+
+                start, end = 0, size - 1
+                match = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(size - int(match.group(2)), 0)
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                else:
+                    self.send_response(200)
+
+                length = end - start + 1
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(length))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                origin.requests += 1
+                if body:
+                    self._send_range(path, start, length)
+
+            def _route(self):
+                path = self.path.split('?', 1)[0]
+                if re.fullmatch(r'/progressive/[\w-]+\.mp4', path):
+                    return 'progressive'
+                match = re.fullmatch(r'/dash/[\w-]+/(video\.mp4|audio\.m4a)', path)
+                if match:
+                    return 'video' if match.group(1) == 'video.mp4' else 'audio'
+                return None
+
+            def _send_range(self, path, start, length):
+                chunk_size = 64 * 1024
+                # Seconds one chunk takes at the emulated rate
+                delay = chunk_size * 8 / (origin.rate_mbps * 1e6) if origin.rate_mbps else 0
+                with open(path, 'rb') as f:
+                    f.seek(start)
+                    remaining = length
+                    while remaining > 0:
+                        chunk = f.read(min(chunk_size, remaining))
+                        if not chunk:
+                            break
+                        try:
+                            self.wfile.write(chunk)
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+                        remaining -= len(chunk)
+                        origin.bytes_sent += len(chunk)
+                        if delay:
+                            time.sleep(delay)
+
+        return Handler
@@ -0,0 +1,325 @@
+"""
+Offline Benchmark Suite
+Runs download jobs against the local media origin (benchmarks/origin.py) and
+the bench.invalid extractor stub, so no request leaves the machine.
+
+Measures, per concurrency level and scenario:
+    - download_and_process throughput (MB/s, jobs/s)
+    - job latency percentiles (submission to completion)
+    - progress hook calls and their cost
+    - merge/post-process time (last stream finished to job done)
+    - peak memory of the server process and its worker processes
+
+Scenarios:
+    progressive     one mp4 file, downloaded as is
+    dash            separate video and audio streams, merged
+    audio           audio converted to mp3 while it downloads (piped into ffmpeg)
+    audio-buffered  the same audio downloaded to disk first and converted afterwards
+
+Usage (from backend/):
+    python benchmarks/run_benchmarks.py [--levels 1,8,64] [--size-mb 4] [--backend process|thread]
+                                        [--scenarios progressive,dash,audio,audio-buffered]
+                                        [--rate-mbps 200] [--output FILE]
+
+Results are written as JSON to benchmarks/results/<timestamp>-<commit>.json
+(or --output) so runs can be compared across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+# Makes yt_dlp_plugins/extractor/bench.py visible to yt-dlp (also in spawned workers)
+sys.path.insert(0, BENCH_DIR)
+
+import multiprocessing
+import yt_dlp
+from config import Config
+from app import create_app
+from app.api import download_manager
+from app.api.progress import ProgressTracker, registry as progress_registry
+from origin import MediaOrigin
+
+# Scenario -> (bench.invalid URL kind, job options)
+SCENARIOS = {
+    'progressive': ('progressive', {'format': 'mp4'}),
+    'dash': ('dash', {'format': 'mp4'}),
+    'audio': ('audio', {'format': 'mp3'}),
+    'audio-buffered': ('audio', {'format': 'mp3', 'stream_audio': False}),
+}
+
+# Scenarios that need real media (and so ffmpeg) at the origin
+FFMPEG_SCENARIOS = ('dash', 'audio', 'audio-buffered')
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return round(ordered[index], 4)
+
+def rss_bytes(pid):
+    """Resident set size of a process (Linux /proc); None where unavailable."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+class MemorySampler:
+    """Samples the RSS of this process and its worker processes until stopped."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_server = 0
+        self.peak_total = 0
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            server = rss_bytes(os.getpid())
+            if server is None:
+                return
+            children = [rss_bytes(child.pid) or 0 for child in multiprocessing.active_children()]
+            self.peak_server = max(self.peak_server, server)
+            self.peak_total = max(self.peak_total, server + sum(children))
+
+class TimingBackend:
+    """
+    Wraps the configured execution backend to note when each job's last
+    stream finished downloading; post-processing runs from then until the
+    job is done, which may be after the backend returned (on the
+    post-processing pool).
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.last_finished = {}  # job_id -> time.time() of its last finished stream
+        self._lock = Lock()
+
+    def run(self, url, options, on_progress, cancel_event):
+        job_id = options.get('staging_id')
+
+        def timed_progress(d):
+            if d.get('status') == 'finished':
+                with self._lock:
+                    self.last_finished[job_id] = time.time()
+            on_progress(d)
+
+        return self.inner.run(url, options, timed_progress, cancel_event)
+
+    def stats(self):
+        return self.inner.stats()
+
+    def shutdown(self):
+        self.inner.shutdown()
+
+def hook_microbenchmark(calls=200000):
+    """Cost of one progress hook call in the tracker, without any download."""
+    tracker = ProgressTracker(lambda fields: None)
+    start = time.perf_counter()
+    for i in range(calls):
+        tracker.hook({
+            'status': 'downloading',
+            'filename': 'bench.mp4',
+            'downloaded_bytes': i * 1024,
+            'total_bytes': calls * 1024,
+        })
+    elapsed = time.perf_counter() - start
+    stats = tracker.stats()
+    return {
+        'calls': calls,
+        'ns_per_call': round(elapsed / calls * 1e9),
+        'published': stats['published'],
+    }
+
+def run_level(level, scenario, jobs, args, output_dir):
+    class BenchConfig(Config):
+        UPLOAD_FOLDER = output_dir
+        JOB_STORE = 'memory'
+        DOWNLOAD_WORKERS = level
+        DOWNLOAD_PER_HOST_LIMIT = level
+        DOWNLOAD_BACKEND = args.backend
+        DOWNLOAD_CACHE_ENABLED = False
+        METADATA_CACHE_SQLITE = False
+
+    create_app(BenchConfig)
+    timing = download_manager._backend = TimingBackend(download_manager._get_backend())
+    hooks_before = progress_registry.stats()
+
+    run_id = f'{int(time.time() * 1000):x}'
+    kind, scenario_options = SCENARIOS[scenario]
+    options = dict({'output_dir': output_dir, 'quality': 'best'}, **scenario_options)
+
+    with MemorySampler() as memory:
+        start = time.perf_counter()
+        job_ids = [
+            download_manager.create_job(f'https://bench.invalid/{kind}/{run_id}-{scenario}-{level}-{index}', dict(options))
+            for index in range(jobs)
+        ]
+        pending = set(job_ids)
+        while pending:
+            for job_id in list(pending):
+                if download_manager.get_job_status(job_id)['status'] in ('completed', 'error', 'cancelled'):
+                    pending.discard(job_id)
+            time.sleep(0.02)
+        wall = time.perf_counter() - start
+
+    hooks_after = progress_registry.stats()
+    jobs_info = [download_manager._store.get(job_id) for job_id in job_ids]
+    download_manager.shutdown()
+
+    latencies = [job['finished_at'] - job['created_at'] for job in jobs_info]
+    post_process = [
+        max(job['finished_at'] - timing.last_finished[job['job_id']], 0)
+        for job in jobs_info if job['job_id'] in timing.last_finished
+    ]
+    succeeded = [job for job in jobs_info if job['status'] == 'completed' and (job.get('result') or {}).get('success')]
+    total_bytes = sum(
+        download.get('size') or 0
+        for job in succeeded for download in job['result'].get('downloads', [])
+    )
+    failures = [
+        (job.get('result') or {}).get('errors') or (job.get('result') or {}).get('error')
+        for job in jobs_info if job not in succeeded
+    ]
+
+    return {
+        'level': level,
+        'scenario': scenario,
+        'jobs': jobs,
+        'succeeded': len(succeeded),
+        'failures': failures[:5],
+        'wall_seconds': round(wall, 3),
+        'jobs_per_second': round(jobs / wall, 2),
+        'throughput_mb_per_s': round(total_bytes / wall / 1e6, 2),
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p99': percentile(latencies, 0.99),
+            'max': round(max(latencies), 4) if latencies else None,
+        },
+        'post_process_seconds': {
+            'p50': percentile(post_process, 0.50),
+            'p90': percentile(post_process, 0.90),
+            'max': round(max(post_process), 4) if post_process else None,
+        },
+        'progress_hooks': {
+            name: hooks_after[name] - hooks_before[name]
+            for name in ('hook_calls', 'published', 'merged', 'dropped')
+        },
+        'peak_rss_mb': {
+            'server': round(memory.peak_server / 1e6, 1) if memory.peak_server else None,
+            'server_and_workers': round(memory.peak_total / 1e6, 1) if memory.peak_total else None,
+        },
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='1,8,64', help='Comma-separated concurrent job counts')
+    parser.add_argument('--jobs', type=int, help='Jobs per level (default: twice the level, at least 4)')
+    parser.add_argument('--size-mb', type=float, default=4, help='Approximate size of each media file')
+    parser.add_argument('--rate-mbps', type=float, help='Per-connection bandwidth of the origin')
+    parser.add_argument('--backend', choices=('process', 'thread'), default=Config.DOWNLOAD_BACKEND)
+    parser.add_argument('--scenarios', default='progressive,dash,audio,audio-buffered')
+    parser.add_argument('--output', help='JSON file to write (default: benchmarks/results/)')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',') if level]
+    origin = MediaOrigin(size=int(args.size_mb * 1024 * 1024), rate_mbps=args.rate_mbps).start()
+    os.environ['BENCH_ORIGIN'] = origin.url
+    os.environ['BENCH_PROGRESSIVE_SIZE'] = str(origin.size_of('progressive'))
+    os.environ['BENCH_VIDEO_SIZE'] = str(origin.size_of('video'))
+    os.environ['BENCH_AUDIO_SIZE'] = str(origin.size_of('audio'))
+
+    scenarios = [scenario for scenario in args.scenarios.split(',') if scenario]
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    skipped = {}
+    for scenario in FFMPEG_SCENARIOS:
+        if scenario in scenarios and not origin.real_media:
+            # Random bytes cannot be merged or converted; these need ffmpeg to produce real streams
+            scenarios.remove(scenario)
+            skipped[scenario] = 'ffmpeg not found'
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'yt_dlp': yt_dlp.version.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {
+            'backend': args.backend,
+            'levels': levels,
+            'size_mb': args.size_mb,
+            'rate_mbps': args.rate_mbps,
+            'real_media': origin.real_media,
+        },
+        'skipped_scenarios': skipped,
+        'hook_microbenchmark': hook_microbenchmark(),
+        'runs': [],
+    }
+
+    try:
+        for scenario in scenarios:
+            for level in levels:
+                output_dir = tempfile.mkdtemp(prefix='bench-downloads-')
+                try:
+                    jobs = args.jobs or max(level * 2, 4)
+                    print(f"Running {scenario} at concurrency {level} ({jobs} jobs)...", file=sys.stderr)
+                    report['runs'].append(run_level(level, scenario, jobs, args, output_dir))
+                finally:
+                    shutil.rmtree(output_dir, ignore_errors=True)
+    finally:
+        origin.stop()
+        report['origin'] = {'requests': origin.requests, 'bytes_sent': origin.bytes_sent}
+
+    output = args.output
+    if not output:
+        results_dir = os.path.join(BENCH_DIR, 'results')
+        os.makedirs(results_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(results_dir, f"{stamp}-{report['commit'] or 'nocommit'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    print(json.dumps(report, indent=2, default=str))
+    print(f"Results written to {output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
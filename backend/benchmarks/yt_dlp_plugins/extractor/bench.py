@@ -0,0 +1,68 @@
+"""
+Benchmark Extractor
+yt-dlp extractor stub for bench.invalid URLs; resolves them to the local
+media origin without any network round-trip
+
+    https://bench.invalid/progressive/<id>
+    https://bench.invalid/dash/<id>
+    https://bench.invalid/audio/<id>      the DASH audio stream alone
+
+Loaded as a yt-dlp plugin when backend/benchmarks is on sys.path. The origin
+address is read from the BENCH_ORIGIN environment variable.
+"""
+import os
+from yt_dlp.extractor.common import InfoExtractor
+
+class BenchIE(InfoExtractor):
+    IE_NAME = 'bench'
+    _VALID_URL = r'https?://bench\.invalid/(?P<kind>progressive|dash|audio)/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        kind, video_id = self._match_valid_url(url).group('kind', 'id')
+        origin = os.environ.get('BENCH_ORIGIN', 'http://127.0.0.1:8765').rstrip('/')
+        duration = 10
+
+        if kind == 'progressive':
+            formats = [{
+                'format_id': 'progressive',
+                'url': f'{origin}/progressive/{video_id}.mp4',
+                'ext': 'mp4',
+                'vcodec': 'avc1.64001f',
+                'acodec': 'mp4a.40.2',
+                'width': 1280,
+                'height': 720,
+                'filesize': int(os.environ.get('BENCH_PROGRESSIVE_SIZE', 0)) or None,
+            }]
+        elif kind == 'audio':
+            formats = [self._audio_format(origin, video_id)]
+        else:
+            formats = [{
+                'format_id': 'video',
+                'url': f'{origin}/dash/{video_id}/video.mp4',
+                'ext': 'mp4',
+                'vcodec': 'avc1.64001f',
+                'acodec': 'none',
+                'width': 1280,
+                'height': 720,
+                'filesize': int(os.environ.get('BENCH_VIDEO_SIZE', 0)) or None,
+            }, self._audio_format(origin, video_id)]
+
+        return {
+            'id': video_id,
+            'title': f'bench-{kind}-{video_id}',
+            'duration': duration,
+            'uploader': 'benchmark',
+            'formats': formats,
+        }
+
+    @staticmethod
+    def _audio_format(origin, video_id):
+        return {
+            'format_id': 'audio',
+            'url': f'{origin}/dash/{video_id}/audio.m4a',
+            'ext': 'm4a',
+            'vcodec': 'none',
+            'acodec': 'mp4a.40.2',
+            'abr': 128,
+            'filesize': int(os.environ.get('BENCH_AUDIO_SIZE', 0)) or None,
+        }
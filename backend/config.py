@@ -4,6 +4,95 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'downloads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB max-limit
+
+    # Media serving: '' (Flask streams the file), 'x-sendfile' (Apache/lighttpd) or 'x-accel' (nginx)
+    MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')
+    USE_X_SENDFILE = MEDIA_OFFLOAD == 'x-sendfile'
+    # nginx `internal` location aliased to UPLOAD_FOLDER, used with MEDIA_OFFLOAD=x-accel
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+    MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+
+    # Download worker pool
+    DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 3))
+    DOWNLOAD_PER_HOST_LIMIT = int(os.environ.get('DOWNLOAD_PER_HOST_LIMIT', 2))
+
+    # Where downloads run: 'process' (worker processes, off the server's GIL) or 'thread'
+    DOWNLOAD_BACKEND = os.environ.get('DOWNLOAD_BACKEND', 'process')
+    # Worker processes are replaced after this many jobs
+    DOWNLOAD_WORKER_MAX_JOBS = int(os.environ.get('DOWNLOAD_WORKER_MAX_JOBS', 25))
+    # Address-space limit per worker process in MB (0 = unlimited; not enforced on Windows)
+    DOWNLOAD_WORKER_MEMORY_MB = int(os.environ.get('DOWNLOAD_WORKER_MEMORY_MB', 4096))
+
+    # Merging and converting (ffmpeg) run on their own pool of worker processes, so a download
+    # worker is free once the bytes are on disk. ffmpeg is CPU bound: one process per core, run
+    # at this much higher a nice value (not on Windows) so it yields to the server and the downloads
+    POSTPROCESS_WORKERS = int(os.environ.get('POSTPROCESS_WORKERS', os.cpu_count() or 1))
+    POSTPROCESS_NICENESS = int(os.environ.get('POSTPROCESS_NICENESS', 10))
+
+    # Finished downloads are kept content-addressed and reused for identical requests
+    DOWNLOAD_CACHE_ENABLED = os.environ.get('DOWNLOAD_CACHE_ENABLED', '1') == '1'
+    # Defaults to UPLOAD_FOLDER/.cache; must be on the same filesystem for hardlinks
+    DOWNLOAD_CACHE_DIR = os.environ.get('DOWNLOAD_CACHE_DIR')
+    DOWNLOAD_CACHE_MAX_GB = float(os.environ.get('DOWNLOAD_CACHE_MAX_GB', 10))
+
+    # The library catalogue is reconciled with UPLOAD_FOLDER at startup; new files are hashed on this many threads
+    LIBRARY_SCAN_WORKERS = int(os.environ.get('LIBRARY_SCAN_WORKERS', min(8, os.cpu_count() or 1)))
+
+    # Playlist entries run as separate jobs; a failed entry is retried this many times
+    PLAYLIST_ENTRY_RETRIES = int(os.environ.get('PLAYLIST_ENTRY_RETRIES', 2))
+
+    # Job store: 'sqlite' survives restarts, 'memory' does not
+    JOB_STORE = os.environ.get('JOB_STORE', 'sqlite')
+    JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 3600))  # Keep finished jobs for an hour
+    JOB_FLUSH_INTERVAL = 1.0  # Seconds between batched progress writes
+
+    # Progress hook updates are published at most this often, unless
+    # progress moved by at least PROGRESS_MIN_DELTA percent
+    PROGRESS_MIN_INTERVAL = 0.25  # seconds
+    PROGRESS_MIN_DELTA = 1.0
+
+    # Metadata cache shared by /api/metadata and downloads
+    METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 256))
+    METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 900))  # Stream URLs expire after a few hours
+    # Keep entries in SQLite across restarts; always on with the process backend, whose
+    # workers share the server's entries through it
+    METADATA_CACHE_SQLITE = os.environ.get('METADATA_CACHE_SQLITE', '0') == '1'
+
+    # Lazy resolution of playlist entry details (/api/metadata/entries)
+    METADATA_RESOLVE_WORKERS = 4
+    METADATA_RESOLVE_MAX = 50  # Entries per request
+
+    # Whisper models stay loaded between transcriptions; idle ones are unloaded
+    # after WHISPER_IDLE_SECONDS, and least recently used ones to stay within the budget
+    WHISPER_DEFAULT_MODEL = os.environ.get('WHISPER_DEFAULT_MODEL', 'base')
+    WHISPER_MEMORY_BUDGET_MB = int(os.environ.get('WHISPER_MEMORY_BUDGET_MB', 4096))
+    WHISPER_IDLE_SECONDS = int(os.environ.get('WHISPER_IDLE_SECONDS', 600))
+    WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE')  # e.g. 'cpu' or 'cuda'; default picks CUDA if available
+
+    # Transcriptions run as their own jobs on a separate pool. Whisper already
+    # spreads one file over several cores, so the pool is a fraction of the CPUs
+    TRANSCRIPTION_WORKERS = int(os.environ.get('TRANSCRIPTION_WORKERS', max(1, (os.cpu_count() or 1) // 4)))
+
+    # Media longer than TRANSCRIPTION_LONG_MEDIA_SECONDS is cut at pauses into pieces of about
+    # TRANSCRIPTION_CHUNK_SECONDS, transcribed in parallel by TRANSCRIPTION_CHUNK_PROCESSES
+    # processes that share the cores. One Whisper process makes little use of more than about
+    # four cores, hence one process per four; 1 turns the long-media mode off
+    TRANSCRIPTION_CHUNK_PROCESSES = int(os.environ.get('TRANSCRIPTION_CHUNK_PROCESSES', max(1, (os.cpu_count() or 1) // 4)))
+    TRANSCRIPTION_CHUNK_SECONDS = int(os.environ.get('TRANSCRIPTION_CHUNK_SECONDS', 300))
+    TRANSCRIPTION_LONG_MEDIA_SECONDS = int(os.environ.get('TRANSCRIPTION_LONG_MEDIA_SECONDS', 1200))
+
+    # Finished transcripts are kept in SQLite, keyed by source video and by decoded audio
+    TRANSCRIPT_CACHE_ENABLED = os.environ.get('TRANSCRIPT_CACHE_ENABLED', '1') == '1'
+    TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.environ.get('TRANSCRIPT_CACHE_MAX_ENTRIES', 5000))
+
+    # Logging: console output at LOG_LEVEL; each job's last JOB_LOG_LINES lines at
+    # JOB_LOG_LEVEL are kept for /api/download/status/<job_id>?logs=1
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    JOB_LOG_LEVEL = os.environ.get('JOB_LOG_LEVEL', 'INFO')
+    JOB_LOG_LINES = int(os.environ.get('JOB_LOG_LINES', 200))
+
+    # Server-Sent Events progress stream
+    EVENTS_KEEPALIVE_SECONDS = 15
     
     @staticmethod
     def init_app(app):
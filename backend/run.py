@@ -1,6 +1,12 @@
+import os
 from app import create_app
 
+if __name__ == '__main__':
+    # Known to the app from the start, so that the reloader's watching process
+    # leaves the jobs to the server child it restarts
+    os.environ.setdefault('FLASK_DEBUG', '1')
+
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=app.debug)
@@ -2,7 +2,20 @@
 import { defineStore } from 'pinia'
 import axios from 'axios'
 
-const pollingIntervals = new Map();
+// One Server-Sent Events connection carries progress for all of this tab's jobs
+let eventSource = null;
+
+// Identifies this browser session so the backend can stream all of its jobs
+function getClientId() {
+  let clientId = sessionStorage.getItem('downloadClientId');
+  if (!clientId) {
+    clientId = window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    sessionStorage.setItem('downloadClientId', clientId);
+  }
+  return clientId;
+}
+
+const clientId = getClientId();
 
 // Helper function to format bytes
 function formatBytes(bytes, decimals = 2) {
@@ -88,10 +101,14 @@ export const useDownloadStore = defineStore('download', {
     // 3. Initiate the download with the backend
     async _initiateDownload(download) {
       try {
+        // Open the event stream first so no update for the new job is missed
+        this._ensureEventStream();
+
         const response = await axios.post('/api/download', {
             url: download.url,
             format: download.format,
             quality: download.quality,
+            client_id: clientId,
         });
         const { job_id } = response.data;
 
@@ -99,7 +116,6 @@ export const useDownloadStore = defineStore('download', {
 
         download.job_id = job_id;
         download.status = 'downloading';
-        this._pollDownloadStatus(download);
 
       } catch (error) {
         console.error('Error initiating download:', error);
@@ -109,74 +125,70 @@ export const useDownloadStore = defineStore('download', {
       }
     },
 
-    // 4. Poll for the status of the current download
-    _pollDownloadStatus(download) {
-        if (pollingIntervals.has(download.job_id)) return;
+    // 4. Receive progress for this client's jobs over Server-Sent Events
+    _ensureEventStream() {
+        if (eventSource) return;
 
-        const intervalId = setInterval(async () => {
-            if (this.isPaused) return; // Skip polling if paused
+        eventSource = new EventSource(`/api/download/events?client_id=${encodeURIComponent(clientId)}`);
 
-            try {
-                const response = await axios.get(`/api/download/status/${download.job_id}`);
-                const jobStatus = response.data;
-
-                // Debug logging
-                console.log('📊 Progress Update:', {
-                    status: jobStatus.status,
-                    progress: jobStatus.progress,
-                    speed: jobStatus.speed,
-                    eta: jobStatus.eta,
-                    downloaded_bytes: jobStatus.downloaded_bytes,
-                    total_bytes: jobStatus.total_bytes
-                });
-
-                if (!this.currentDownload || this.currentDownload.id !== download.id) {
-                    this._stopPolling(download.job_id);
-                    return;
-                }
-
-                this.currentDownload.status = jobStatus.status;
-                this.currentDownload.progress = jobStatus.progress;
-                this.currentDownload.speed = jobStatus.speed;
-                this.currentDownload.eta = jobStatus.eta;
-                this.currentDownload.downloaded_bytes = jobStatus.downloaded_bytes;
-                this.currentDownload.total_bytes = jobStatus.total_bytes;
-
-                if (jobStatus.status === 'completed' || jobStatus.status === 'error') {
-                    this.currentDownload.result = jobStatus.result;
-                    if(jobStatus.result?.downloads?.[0]) {
-                        this.currentDownload.title = jobStatus.result.downloads[0].title || 'Finished';
-                        this.currentDownload.filename = jobStatus.result.downloads[0].filename;
-                        this.currentDownload.thumbnail_url = jobStatus.result.downloads[0].thumbnail_url;
-                        this.currentDownload.duration = jobStatus.result.downloads[0].duration;
-                        this.currentDownload.size = jobStatus.result.downloads[0].size || 0;
-                    }
-                    this._finalizeCurrentDownload();
-                }
+        const onUpdate = (event) => this._applyJobUpdate(JSON.parse(event.data));
+        eventSource.addEventListener('snapshot', onUpdate);
+        eventSource.addEventListener('progress', onUpdate);
 
+        // The server dropped queued updates for this slow client; fetch the current state once
+        eventSource.addEventListener('resync', async () => {
+            const jobId = this.currentDownload?.job_id;
+            if (!jobId) return;
+            try {
+                const response = await axios.get(`/api/download/status/${jobId}`);
+                this._applyJobUpdate(response.data);
             } catch (error) {
-                console.error(`Polling error for job ${download.job_id}:`, error);
-                this.currentDownload.status = 'error';
-                this.currentDownload.error = 'Could not get status update.';
-                this._finalizeCurrentDownload();
+                console.error(`Resync error for job ${jobId}:`, error);
             }
-        }, 2000);
+        });
 
-        pollingIntervals.set(download.job_id, intervalId);
+        // EventSource reconnects on its own and the server re-sends a snapshot
+        eventSource.onerror = (error) => {
+            console.warn('Progress stream interrupted, reconnecting...', error);
+        };
     },
 
-    _stopPolling(jobId) {
-        if (pollingIntervals.has(jobId)) {
-            clearInterval(pollingIntervals.get(jobId));
-            pollingIntervals.delete(jobId);
+    _closeEventStream() {
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+    },
+
+    // Updates carry only the fields that changed since the last event
+    _applyJobUpdate(jobStatus) {
+        if (!this.currentDownload || this.currentDownload.job_id !== jobStatus.job_id) {
+            return;
+        }
+
+        for (const field of ['status', 'progress', 'speed', 'eta', 'downloaded_bytes', 'total_bytes', 'queue_position',
+                             'entries_total', 'entries_done', 'entries_failed']) {
+            if (field in jobStatus) {
+                this.currentDownload[field] = jobStatus[field];
+            }
+        }
+
+        if (['completed', 'error', 'cancelled'].includes(jobStatus.status)) {
+            this.currentDownload.result = jobStatus.result;
+            if(jobStatus.result?.downloads?.[0]) {
+                this.currentDownload.title = jobStatus.result.downloads[0].title || 'Finished';
+                this.currentDownload.filename = jobStatus.result.downloads[0].filename;
+                this.currentDownload.thumbnail_url = jobStatus.result.downloads[0].thumbnail_url;
+                this.currentDownload.duration = jobStatus.result.downloads[0].duration;
+                this.currentDownload.size = jobStatus.result.downloads[0].size || 0;
+            }
+            this._finalizeCurrentDownload();
         }
     },
 
     // 5. Finalize the current download and trigger the next one
     _finalizeCurrentDownload() {
       if (this.currentDownload) {
-        this._stopPolling(this.currentDownload.job_id);
-
         // If download completed successfully, add to notification queue
         if (this.currentDownload.status === 'completed') {
           this.completedDownloadsToNotify.push({ ...this.currentDownload });
@@ -185,6 +197,10 @@ export const useDownloadStore = defineStore('download', {
         this.downloads.unshift(this.currentDownload); // Add to finished list
         this.currentDownload = null;
       }
+      // Nothing left to track; release the connection until the next job
+      if (this.queue.length === 0) {
+        this._closeEventStream();
+      }
       // Use setTimeout to avoid immediate re-triggering in case of rapid failure
       setTimeout(() => this._processQueue(), 100);
     },
@@ -209,8 +225,14 @@ export const useDownloadStore = defineStore('download', {
     cancelDownload(downloadId) {
       // If it's the current download
       if (this.currentDownload && this.currentDownload.id === downloadId) {
+        const jobId = this.currentDownload.job_id;
         this.currentDownload.status = 'cancelled';
-        // Note: Backend doesn't support cancellation, so we just stop polling and move on.
+        if (jobId) {
+          // Frees the backend worker slot; a failure here only means the job already finished
+          axios.post(`/api/download/cancel/${jobId}`).catch(error => {
+            console.warn(`Could not cancel job ${jobId}:`, error);
+          });
+        }
         this._finalizeCurrentDownload();
       }
       // If it's in the queue
@@ -234,17 +256,15 @@ export const useDownloadStore = defineStore('download', {
       }
 
       try {
-        // Properly encode the filename for the URL
+        // Let the browser stream the file straight to disk (and resume it) instead of
+        // buffering it in memory as a blob; the server answers Range requests
         const encodedFilename = encodeURIComponent(filename);
-        const response = await axios.get(`/api/download/file/${encodedFilename}`, { responseType: 'blob' });
-        const url = window.URL.createObjectURL(new Blob([response.data]));
         const link = document.createElement('a');
-        link.href = url;
+        link.href = `/api/download/file/${encodedFilename}`;
         link.setAttribute('download', filename);
         document.body.appendChild(link);
         link.click();
         link.remove();
-        window.URL.revokeObjectURL(url);
       } catch (error) {
         console.error('File download error:', error);
         alert(`Failed to download file: ${error.message}`);